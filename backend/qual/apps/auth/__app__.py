@@ -1,8 +1,14 @@
 from fastapi import FastAPI
 from qual.core.xyapi import installer
+from qual.core.xyapi.security import (
+    shutdown_password_executor,
+    start_key_rotation,
+    stop_key_rotation,
+)
 from .authorizations.xysso import router as sso
 from .authorizations.oauth2password import router as oauth2password
-from .router import api
+from .router import api, well_known
+from . import revocation
 
 
 @installer(__name__)
@@ -11,3 +17,15 @@ def install(app: FastAPI):
     app.include_router(sso.api)
     app.include_router(oauth2password.api)
     app.include_router(api)
+    app.include_router(well_known)
+
+    # 关闭密码哈希进程池
+    app.add_event_handler("shutdown", shutdown_password_executor)
+
+    # 定时轮换JWT签名密钥（只有配置了密钥环才会启动）
+    app.add_event_handler("startup", start_key_rotation)
+    app.add_event_handler("shutdown", stop_key_rotation)
+
+    # 同步令牌吊销名单
+    app.add_event_handler("startup", revocation.start_sync)
+    app.add_event_handler("shutdown", revocation.stop_sync)
@@ -2,7 +2,7 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from qual.core.xyapi.exception import HttpExceptionModel
-from qual.core.xyapi.security import TokenADP, TokenData, verify_password
+from qual.core.xyapi.security import TokenADP, TokenData, password_needs_update
 from qual.apps.user.model import User, AccountType
 
 api = APIRouter(prefix="/oath2password", tags=["oath2password"])
@@ -20,6 +20,14 @@ api = APIRouter(prefix="/oath2password", tags=["oath2password"])
             "model": HttpExceptionModel,
             "description": "同名的别的类型用户已存在",
         },
+        status.HTTP_429_TOO_MANY_REQUESTS: {
+            "model": HttpExceptionModel,
+            "description": "登录请求过多，密码校验排队已满",
+        },
+        status.HTTP_503_SERVICE_UNAVAILABLE: {
+            "model": HttpExceptionModel,
+            "description": "密码校验排队超时",
+        },
     },
 )
 async def token(form: Annotated[OAuth2PasswordRequestForm, Depends()]):
@@ -42,7 +50,7 @@ async def token(form: Annotated[OAuth2PasswordRequestForm, Depends()]):
     # github、google那样搞大OAuth2开放平台。
 
     # XXX: 这一段代码就是具体的认证流程逻辑已经粘死这里了
-    user = User.get_by_username(username=form.username)
+    user = await User.aget_by_username(username=form.username)
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="用户不存在")
     elif user.account_type != AccountType.local:  # password模式只认local类型账户
@@ -50,10 +58,18 @@ async def token(form: Annotated[OAuth2PasswordRequestForm, Depends()]):
             status_code=status.HTTP_409_CONFLICT,
             detail=f"用户已存在，但是类型是 {user.account_type}。",
         )
-    elif not verify_password(form.password, user.password):
+    elif not await user.verify_password_async(form.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="密码不正确")
 
-    token_data = TokenData.simple_create(username=form.username, scopes=form.scopes)
+    if password_needs_update(user.password):
+        # 哈希算法或者rounds配置改过了，趁着手上有明文密码按新配置重新哈希
+        # 只是换个哈希，密码没变，不更新安全版本号
+        await user.set_password_async(form.password, rotate_stamp=False)
+        await user.asave()
+
+    token_data = TokenData.simple_create(
+        username=form.username, scopes=form.scopes, claims=user.token_claims
+    )
     return token_data
 
 
@@ -165,7 +165,7 @@ async def token(form: Annotated[OAuth2AuthorizationCodeForm, Depends()]):
 
     # TODO: 检查数据库里有没有这个用户，没有就创建用户
     # XXX: 这里不可避免的要跟具体的创建用户耦合。到底要不要后端这个接口一条龙的创建用户呢？
-    user = User.get_by_username(xy_resp.username)
+    user = await User.aget_by_username(xy_resp.username)
     if not user:
         user_info = list(xy_resp.user.values())[0]
         user_info = cast(UserInfo, user_info)
@@ -176,7 +176,7 @@ async def token(form: Annotated[OAuth2AuthorizationCodeForm, Depends()]):
             mail=user_info.mail[0],
             account_type=AccountType.xysso,
         )
-        user.save()
+        await user.asave()
         logger.info(f"初次创建xysso用户 {user.username}")
 
     # XXX: 因为XYSSO的一些不规范实现，导致OpenAPI的Scope没有被传递到`oauth2-redirect`页面，因此`form.scope`是空的。
@@ -185,7 +185,9 @@ async def token(form: Annotated[OAuth2AuthorizationCodeForm, Depends()]):
     scopes = form.scope if form.scope else [Scope.all]
 
     # token部分是通用的，都是用户名来做负载
-    token_data = TokenData.simple_create(username=xy_resp.username, scopes=scopes)
+    token_data = TokenData.simple_create(
+        username=xy_resp.username, scopes=scopes, claims=user.token_claims
+    )
     logger.debug(f"发放token {token_data.model_dump()}")
     return token_data
 
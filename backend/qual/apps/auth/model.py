@@ -0,0 +1,16 @@
+from datetime import datetime
+from qual.core.database import Model
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class RevokedToken(Model):
+    """
+    已吊销的令牌
+
+    内存吊销名单（`qual.core.xyapi.security.revocation_store`）的持久化，
+    重启和多worker之间靠这张表同步。过期的记录会被定期清理，表不会无限增长。
+    """
+
+    key: Mapped[str] = mapped_column(unique=True, index=True, comment="令牌jti或会话sid")
+    expires_at: Mapped[datetime] = mapped_column(index=True, comment="过期时间（UTC）")
+    reason: Mapped[str] = mapped_column(default="", comment="吊销原因")
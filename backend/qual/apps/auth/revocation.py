@@ -0,0 +1,201 @@
+"""
+令牌吊销
+
+请求时的检查只查内存名单（`security.revocation_store`），这里负责：
+
+1. 吊销时先写 `RevokedToken` 表再更新本进程的内存名单。
+2. 定时把表里新增的记录同步到内存名单（别的worker吊销的），顺便清理过期记录。
+3. 刷新令牌一次性使用：用过的刷新令牌 `jti` 也记到表里，唯一约束保证并发下只有一个请求能用成功；
+   同一个刷新令牌再出现就是被盗用了，直接吊销整个会话（`sid`）。
+
+用例：
+```python
+from qual.apps.auth import revocation
+
+# 注销会话
+revocation.revoke(payload.sid, payload.exp, "logout")
+# 在异步接口里
+await revocation.arevoke(payload.sid, payload.exp, "logout")
+```
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from qual.core.xyapi.security import Payload, revocation_store
+from qual.core.settings import settings
+from .model import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+# 同步时往前多看一段时间，避免worker之间的时钟误差和事务提交延迟漏掉记录
+_SYNC_MARGIN = timedelta(seconds=30)
+
+_last_sync: datetime | None = None
+_sync_task: asyncio.Task | None = None
+
+
+def _utc(dt: datetime) -> datetime:
+    """
+    转换成不带时区的UTC时间（数据库里存的都是这种）
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _timestamp(dt: datetime) -> float:
+    return _utc(dt).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _insert(key: str, expires_at: datetime, reason: str) -> bool:
+    """
+    写入吊销记录
+
+    用独立的会话马上提交，不跟请求的工作单元一起：吊销要立刻生效，
+    唯一约束冲突也只能在自己的事务里处理。
+
+    Returns:
+        bool: 写入成功返回True，记录已经存在返回False
+    """
+    with Session(RevokedToken.engine) as session:
+        session.add(RevokedToken(key=key, expires_at=_utc(expires_at), reason=reason))
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            return False
+    return True
+
+
+def revoke(key: str, expires_at: datetime, reason: str = ""):
+    """
+    吊销令牌或会话
+
+    Args:
+        key (str): 令牌jti或会话sid
+        expires_at (datetime): 过期时间，过了这个时间记录就会被清理，一般传令牌的exp
+        reason (str, optional): 吊销原因. Defaults to "".
+    """
+    if not key:
+        return
+
+    _insert(key, expires_at, reason)
+    revocation_store.revoke(key, _timestamp(expires_at))
+    logger.info(f"吊销 {key}：{reason}")
+
+
+async def arevoke(key: str, expires_at: datetime, reason: str = ""):
+    """
+    `revoke` 的异步版本，写库放到线程里执行，不阻塞事件循环
+    """
+    await asyncio.to_thread(revoke, key, expires_at, reason)
+
+
+def consume_refresh_token(payload: Payload) -> bool:
+    """
+    消费刷新令牌
+
+    刷新令牌只能用一次，用过的 `jti` 会记下来。如果同一个刷新令牌被再次使用，说明令牌泄露了，
+    会吊销整个会话，合法用户和攻击者手里的令牌都会失效，需要重新登录。
+
+    Args:
+        payload (Payload): 刷新令牌负载
+
+    Returns:
+        bool: 首次使用返回True，重用返回False
+    """
+    # 老令牌没有jti，没法检测重用，直接放行
+    if not payload.jti:
+        return True
+
+    expires_at = payload.exp or datetime.now(timezone.utc) + timedelta(
+        minutes=settings.JWT_REFRESH_EXPIRE_MINUTES
+    )
+
+    if revocation_store.is_revoked(payload.jti) or not _insert(
+        payload.jti, expires_at, "refresh"
+    ):
+        logger.warning(f"刷新令牌重用，吊销会话：sub={payload.sub} sid={payload.sid}")
+        # 会话里最新的刷新令牌最长还能活 JWT_REFRESH_EXPIRE_MINUTES
+        revoke(
+            payload.sid,
+            datetime.now(timezone.utc)
+            + timedelta(minutes=settings.JWT_REFRESH_EXPIRE_MINUTES),
+            "refresh token reuse",
+        )
+        return False
+
+    revocation_store.revoke(payload.jti, _timestamp(expires_at))
+    return True
+
+
+async def aconsume_refresh_token(payload: Payload) -> bool:
+    """
+    `consume_refresh_token` 的异步版本，写库放到线程里执行，不阻塞事件循环
+    """
+    return await asyncio.to_thread(consume_refresh_token, payload)
+
+
+def sync() -> int:
+    """
+    从数据库同步吊销名单到内存，并清理过期记录
+
+    第一次同步加载全部未过期记录，之后只加载上次同步以来新增的记录。
+
+    Returns:
+        int: 加载的记录数
+    """
+    global _last_sync
+
+    now = datetime.utcnow()
+    stmt = select(RevokedToken.key, RevokedToken.expires_at).where(
+        RevokedToken.expires_at > now
+    )
+    if _last_sync is not None:
+        stmt = stmt.where(RevokedToken.create_at >= _last_sync - _SYNC_MARGIN)
+
+    with Session(RevokedToken.engine) as session:
+        rows = session.execute(stmt).all()
+        session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+        session.commit()
+
+    for key, expires_at in rows:
+        revocation_store.revoke(key, _timestamp(expires_at))
+    revocation_store.purge()
+
+    _last_sync = now
+    return len(rows)
+
+
+async def _sync_periodically(interval: float):
+    while True:
+        try:
+            await asyncio.to_thread(sync)
+        except Exception:
+            logger.exception("同步令牌吊销名单失败")
+        await asyncio.sleep(interval)
+
+
+async def start_sync():
+    """
+    启动定时同步任务（在startup事件里调用）
+    """
+    global _sync_task
+    if _sync_task is None:
+        _sync_task = asyncio.create_task(
+            _sync_periodically(settings.JWT_REVOCATION_SYNC_SECONDS)
+        )
+
+
+async def stop_sync():
+    """
+    停止定时同步任务（在shutdown事件里调用）
+    """
+    global _sync_task, _last_sync
+    if _sync_task is not None:
+        _sync_task.cancel()
+        _sync_task = None
+    _last_sync = None
@@ -1,8 +1,18 @@
-from fastapi import APIRouter, HTTPException, status
-from qual.core.xyapi.security import RefreshTokenPayloadADP, TokenData
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, HTTPException, Response, status
+from qual.core.xyapi import security
+from qual.core.xyapi.exception import JWTUnauthorizedError
+from qual.core.xyapi.security import (
+    AccessTokenPayloadADP,
+    RefreshTokenPayloadADP,
+    TokenData,
+)
 from qual.apps.user.model import User
+from qual.core.settings import settings
+from . import revocation
 
 api = APIRouter(prefix="/auth", tags=["auth"])
+well_known = APIRouter(prefix="/.well-known", tags=["auth"])
 
 
 @api.post("/refresh_token", response_model=TokenData)
@@ -15,13 +25,64 @@ async def refresh_token(payload: RefreshTokenPayloadADP):
     本接口会校验token负载和用户名是否还有效，如果用户有效就返回一个新的 `Access Token`。
 
     刷新令牌属于`jwt`认证的公告接口，不属于具体的认证流程接口中。
+
+    刷新令牌只能用一次，每次刷新都会返回新的 `Refresh Token`；旧的刷新令牌再次使用会被当成盗用，
+    整个会话都会被吊销，需要重新登录。
     """
     username = payload.sub
 
-    if not User.get_by_username(username):
+    user = await User.aget_by_username(username)
+    if not user:
         # 如果用户无效就返回失败
-        return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="用户已经无效")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="用户已经无效")
+
+    if payload.sv != user.security_stamp:
+        # 改过密码，之前的会话都要重新登录
+        raise JWTUnauthorizedError("令牌已失效，请重新登录")
 
-    token_data = TokenData.simple_create(username=username, scopes=payload.scopes)
+    if not await revocation.aconsume_refresh_token(payload):
+        raise JWTUnauthorizedError("刷新令牌已被使用，会话已吊销")
+
+    token_data = TokenData.simple_create(
+        username=username,
+        scopes=payload.scopes,
+        sid=payload.sid,
+        claims=user.token_claims,
+    )
 
     return token_data
+
+
+@api.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(payload: AccessTokenPayloadADP):
+    """
+    注销接口
+
+    吊销当前令牌所属的会话，这次登录签发的 `Access Token` 和 `Refresh Token` 都会立刻失效。
+    """
+    if payload.sid:
+        # 会话里的刷新令牌比access令牌活得久，要吊销到刷新令牌过期
+        expires_at = datetime.now(timezone.utc) + timedelta(
+            minutes=settings.JWT_REFRESH_EXPIRE_MINUTES
+        )
+        await revocation.arevoke(payload.sid, expires_at, "logout")
+    else:
+        await revocation.arevoke(payload.jti, payload.exp, "logout")
+
+
+@well_known.get("/jwks.json")
+async def jwks(response: Response):
+    """
+    JWT验签公钥集（JWKS）
+
+    其它服务可以拉取这个公钥集，按token header里的 `kid` 找到公钥在本地验证token，
+    不用回调我们的接口。
+
+    非对称算法的公钥都会发布：配置了 `JWT_KEYS_DIR` 时是密钥环里的所有密钥，
+    否则是 `JWT_PRIVATE_KEY` 对应的那一个。`HS*` 共享密文是不能公开的，返回空集。
+    """
+    # 新密钥发布满这么久才开始签发，缓存不能比它长
+    max_age = settings.JWT_KEY_PUBLISH_SECONDS
+    response.headers["Cache-Control"] = f"public, max-age={max_age}"
+
+    return security.jwt_backend.jwks()
@@ -1,6 +1,8 @@
 from qual.core.database import Model, OrderMixin, KeyMixin
-from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload
+from sqlalchemy import ForeignKey, bindparam
+from qual.core.xyapi.database.entity_cache import EntityCache
+from qual.core.xyapi.database.statements import cached_statement
 from enum import IntEnum
 
 
@@ -16,6 +18,8 @@ class VariantType(IntEnum):
 
 
 class Dictionary(Model, KeyMixin, OrderMixin):
+    __entity_cache__ = EntityCache(max_size=1024, ttl=300, unique_keys=["key"])
+
     name: Mapped[str] = mapped_column(unique=True, comment="字典名")
     type: Mapped[int] = mapped_column(default=VariantType.text, comment="值类型")
     enable: Mapped[bool] = mapped_column(default=True, comment="启用/禁用")
@@ -27,9 +31,30 @@ class Dictionary(Model, KeyMixin, OrderMixin):
         back_populates="parent",
     )
 
+    @cached_statement
+    def by_key_with_children(cls):
+        """
+        按key查询并预加载 `children`
+        """
+        return cls.select.where(cls.key == bindparam("key")).options(
+            selectinload(cls.children)
+        )
+
     @classmethod
     def get_by_key(cls, key: str):
-        _dict = cls.scalar(cls.select.where(cls.key == key))
+        """
+        通过key获取，走实体缓存
+        """
+        return cls.get_by_unique("key", key)
+
+    @classmethod
+    async def aget_by_key(cls, key: str):
+        """
+        通过key获取（异步），会预加载 `children`
+
+        实体缓存只有列属性，异步会话又不能懒加载 `children`，所以这里不走缓存。
+        """
+        _dict = await cls.ascalar(cls.by_key_with_children, {"key": key})
         return _dict
 
 
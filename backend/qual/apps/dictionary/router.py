@@ -1,5 +1,9 @@
 from fastapi import APIRouter, status
+from qual.core.settings import settings
+from qual.core.xyapi import RawJSONResponse, StreamingJSONResponse
 from qual.core.xyapi.exception import NotFoundError
+from qual.core.xyapi.responses import StreamFormat
+from qual.core.xyapi.database.pagination import Page, PageADP
 from .model import Dictionary, DictionaryKeyValue
 from .schema import (
     DictionaryReadDetial,
@@ -13,15 +17,42 @@ from .schema import (
 api = APIRouter(prefix="/dict", tags=["dict"])
 
 
-@api.get("", response_model=list[DictionaryReadDetial])
-async def get_dicts():
-    dicts = Dictionary.scalars(Dictionary.select.where()).all()
-    return dicts
+@api.get("", response_model=Page[DictionaryReadDetial])
+async def get_dicts(page: PageADP):
+    """
+    分页获取字典，按id排序
+
+    下一页把返回的 `next_cursor` 作为 `cursor` 参数传回来。
+    开启 `DB_JSON_AGGREGATION` 时在数据库里拼好JSON直接返回，一页一条查询。
+    """
+    if settings.DB_JSON_AGGREGATION:
+        content = await Dictionary.apaginate_json(
+            DictionaryReadDetial, cursor=page.cursor, limit=page.limit, total=page.total
+        )
+        return RawJSONResponse(content)
+
+    stmt = Dictionary.select_for(DictionaryReadDetial)
+    return await Dictionary.apaginate(
+        stmt, cursor=page.cursor, limit=page.limit, total=page.total
+    )
+
+
+@api.get("/export", response_class=StreamingJSONResponse)
+async def export_dicts(format: StreamFormat = "ndjson"):
+    """
+    流式导出全部字典，按id排序
+
+    `children` 按响应模型用 `selectinload` 按批加载，每批一条额外的查询。
+    """
+    stmt = Dictionary.select_for(DictionaryReadDetial).order_by(Dictionary.id)
+    return StreamingJSONResponse(
+        Dictionary.astream(stmt), DictionaryReadDetial, format=format
+    )
 
 
 @api.get("/{key}", response_model=DictionaryReadDetial)
 async def get_dict(key: str):
-    _dict = Dictionary.get_by_key(key)
+    _dict = await Dictionary.aget_by_key(key)
     if _dict:
         return _dict
     else:
@@ -31,7 +62,7 @@ async def get_dict(key: str):
 @api.post("", status_code=status.HTTP_201_CREATED)
 async def add_dict(dict_c: DictionaryCreate):
     _dict = Dictionary(**dict_c.model_dump())
-    _dict.save()
+    await _dict.asave()
 
 
 @api.patch("/{key}")
@@ -39,39 +70,48 @@ async def update_dict(key: str, dict_u: DictionaryUpdate):
     """
     更新已存在的字典
     """
-    _dict = Dictionary.get_by_key(key)
+    _dict = await Dictionary.aget_by_key(key)
     if _dict:
-        _dict.update(**dict_u.model_dump())
+        await _dict.aupdate(**dict_u.model_dump())
     else:
         raise NotFoundError(f"key={key}的字典不存在")
 
 
 @api.delete("/{key}")
 async def delete_dict(key: str):
-    _dict = Dictionary.get_by_key(key)
+    _dict = await Dictionary.aget_by_key(key)
     if _dict:
-        _dict.delete()
+        await _dict.adelete()
     else:
         raise NotFoundError(f"key={key}的字典不存在")
 
 
 @api.get("/{key}/values", response_model=list[DictionaryKeyValueRead])
 async def get_dict_values(key: str):
-    _dict = Dictionary.get_by_key(key)
+    """
+    获取字典的全部键值，按id排序
+
+    字典本身走实体缓存，键值只查 `DictionaryKeyValueRead` 需要的列。
+    """
+    _dict = await Dictionary.aget_by_unique("key", key)
     if _dict:
-        return _dict.children
+        stmt = DictionaryKeyValue.select_columns(DictionaryKeyValueRead)
+        stmt = stmt.where(DictionaryKeyValue.parent_id == _dict.id).order_by(
+            DictionaryKeyValue.id
+        )
+        return await DictionaryKeyValue.aread(DictionaryKeyValueRead, stmt)
     else:
         raise NotFoundError(f"key={key}的字典不存在")
 
 
 @api.post("/{key}/values")
 async def add_dict_values(key: str, dict_value_c: DcitionaryKeyValueCreate):
-    _dict = Dictionary.get_by_key(key)
+    _dict = await Dictionary.aget_by_key(key)
 
     if _dict:
         value = DictionaryKeyValue(**dict_value_c.model_dump())
         _dict.children.append(value)
-        _dict.save()
+        await _dict.asave()
 
     else:
         raise NotFoundError(f"key={key}的字典不存在")
@@ -85,7 +125,7 @@ async def get_dict_value(key: str, id: int):
         .where(Dictionary.key == key)
     )
 
-    value = DictionaryKeyValue.scalar(stmt)
+    value = await DictionaryKeyValue.ascalar(stmt)
     return value
 
 
@@ -96,8 +136,8 @@ async def delete_dict_values(key: str, id: int):
         DictionaryKeyValue.id == id,
     )
 
-    value = DictionaryKeyValue.scalar(stmt)
+    value = await DictionaryKeyValue.ascalar(stmt)
     if value:
-        value.delete()
+        await value.adelete()
     else:
         raise NotFoundError("字典值不存在")
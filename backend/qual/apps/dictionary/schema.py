@@ -7,7 +7,7 @@ class DictionaryBase(BaseModel):
     name: str
     type: int = VariantType.text
     enable: bool = True
-    sort: int = 1
+    order: int = 1
     comment: str = ""
 
 
@@ -22,7 +22,7 @@ class DictionaryKeyValueRead(BaseModel):
     value: str
     type: int = Field(description="")
     enable: bool
-    sort: int
+    order: int
     parent_id: int
 
     model_config = ConfigDict(from_attributes=True)
@@ -45,6 +45,6 @@ class DcitionaryKeyValueCreate(BaseModel):
     value: str
     type: int
     enable: bool
-    sort: int
+    order: int
 
     model_config = ConfigDict(from_attributes=True)
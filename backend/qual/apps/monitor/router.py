@@ -0,0 +1,23 @@
+from typing import Any
+from fastapi import APIRouter
+from qual.core.xyapi import NeedScope, Scope, metrics
+
+api = APIRouter(prefix="/monitor", tags=["monitor"])
+
+Scope.monitor = "监控:读取"
+
+
+@api.get(
+    "/metrics",
+    response_model=dict[str, dict[str, Any]],
+    dependencies=[NeedScope(Scope.monitor)],
+)
+async def get_metrics():
+    """
+    获取运行指标
+
+    返回各模块注册的统计数据，比如密码哈希排队深度、排队耗时等。
+
+    Scopes: monitor
+    """
+    return metrics.collect()
@@ -4,7 +4,14 @@ from typing import Self
 from sqlalchemy.orm import Mapped, mapped_column
 from enum import StrEnum
 from qual.core.database import Model
-from qual.core.xyapi.security import verify_password, hash_password
+from qual.core.settings import settings
+from qual.core.xyapi.database.entity_cache import EntityCache
+from qual.core.xyapi.security import (
+    verify_password,
+    verify_password_async,
+    hash_password,
+    hash_password_async,
+)
 
 
 class AccountType(StrEnum):
@@ -13,6 +20,15 @@ class AccountType(StrEnum):
 
 
 class User(Model):
+    # 认证每个请求都要按用户名取当前用户
+    # 密码和安全版本号不缓存，别的worker改了密码这里要马上生效
+    __entity_cache__ = EntityCache(
+        settings.AUTH_USER_CACHE_SIZE,
+        settings.AUTH_USER_CACHE_TTL,
+        unique_keys=["username"],
+        uncached=["password", "security_stamp"],
+    )
+
     username: Mapped[str] = mapped_column(unique=True, index=True, comment="用户名")
     mail: Mapped[str] = mapped_column(default=None, nullable=True, comment="邮箱")
     password: Mapped[str] = mapped_column(
@@ -24,14 +40,40 @@ class User(Model):
     account_type: Mapped[str] = mapped_column(
         nullable=False, default=AccountType.local, comment="账户类型"
     )
+    security_stamp: Mapped[int] = mapped_column(
+        default=0, server_default="0", comment="安全版本号，改密码时+1，之前签发的令牌随之失效"
+    )
 
     def verify_password(self, password: str) -> bool:
         """验证密码"""
-        return verify_password(self.password, password)
+        return verify_password(password, self.password)
 
-    def set_password(self, password: str) -> None:
-        """设置密码"""
+    def set_password(self, password: str, rotate_stamp: bool = True) -> None:
+        """设置密码，默认同时更新安全版本号"""
         self.password = hash_password(password)
+        if rotate_stamp:
+            self.rotate_security_stamp()
+
+    async def verify_password_async(self, password: str) -> bool:
+        """验证密码（异步，不阻塞事件循环）"""
+        return await verify_password_async(password, self.password)
+
+    async def set_password_async(
+        self, password: str, rotate_stamp: bool = True
+    ) -> None:
+        """设置密码（异步，不阻塞事件循环），默认同时更新安全版本号"""
+        self.password = await hash_password_async(password)
+        if rotate_stamp:
+            self.rotate_security_stamp()
+
+    def rotate_security_stamp(self) -> None:
+        """更新安全版本号，之前签发的令牌都会失效"""
+        self.security_stamp = (self.security_stamp or 0) + 1
+
+    @property
+    def token_claims(self) -> dict:
+        """签发令牌时要带上的用户负载"""
+        return {"uid": self.id, "sv": self.security_stamp or 0}
 
     @classmethod
     def get_by_username(cls, username: str) -> Self | None:
@@ -44,8 +86,20 @@ class User(Model):
         Returns:
             Self | None: 如果没找到就返回None
         """
-        user = cls.scalar(cls.select.where(cls.username == username))
-        return user
+        return cls.get_by_unique("username", username)
+
+    @classmethod
+    async def aget_by_username(cls, username: str) -> Self | None:
+        """
+        通过用户名获取（异步）
+
+        Args:
+            username (str): 用户名
+
+        Returns:
+            Self | None: 如果没找到就返回None
+        """
+        return await cls.aget_by_unique("username", username)
 
     def __repr__(self) -> str:
         return f"<User {self.username}>"
@@ -1,9 +1,10 @@
 from typing import Annotated
 from fastapi import APIRouter, Body, HTTPException, status
-from qual.core.xyapi import ExistedError
+from qual.core.xyapi import ExistedError, StreamingJSONResponse
+from qual.core.xyapi.responses import StreamFormat
 from qual.core.xyapi.exception import NotFoundError
-from qual.core.xyapi.security import verify_password
-from qual.core.authentication import AuthenticateADP
+from qual.core.xyapi.database.pagination import Page, PageADP
+from qual.core.authentication import AuthenticateADP, PrincipalADP
 from .schema import UserRead, UserCreate, UserUpdate
 from .model import User, AccountType
 
@@ -17,7 +18,8 @@ async def current_user(me: AuthenticateADP):
 
 @api.patch("/me", response_model=UserRead)
 async def update_current_user(user_u: UserUpdate, me: AuthenticateADP):
-    me.update(**user_u.model_dump())
+    await me.aupdate(**user_u.model_dump())
+    return me
 
 
 @api.patch("/me/password")
@@ -36,24 +38,44 @@ async def reset_password(
         NotFoundError: 用户无效
     """
     if me:
-        if verify_password(password, me.password):
+        if await me.verify_password_async(password):
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT, detail="新密码与旧密码一样"
             )
-        me.set_password(password)
-        me.save()
+        await me.set_password_async(password)
+        await me.asave()
     else:
         raise NotFoundError(detail="用户不存在")
 
 
-@api.get("", response_model=list[UserRead])
-async def get_users(_me: AuthenticateADP):
-    return User.scalars(User.select.where()).all()
+@api.get("", response_model=Page[UserRead])
+async def get_users(page: PageADP, _me: PrincipalADP):
+    """
+    分页获取用户，按id排序
+
+    下一页把返回的 `next_cursor` 作为 `cursor` 参数传回来。
+    只查 `UserRead` 需要的列，不构建ORM对象。
+    """
+    return await User.apaginate(
+        cursor=page.cursor, limit=page.limit, schema=UserRead, total=page.total
+    )
+
+
+@api.get("/export", response_class=StreamingJSONResponse)
+async def export_users(_me: PrincipalADP, format: StreamFormat = "ndjson"):
+    """
+    流式导出全部用户，按id排序
+
+    边读边发送，用户再多内存占用也是平的。
+    """
+    return StreamingJSONResponse(
+        User.astream(User.select.order_by(User.id)), UserRead, format=format
+    )
 
 
 @api.get("/{id}", response_model=UserRead)
-async def get_user(id: int, _me: AuthenticateADP):
-    user = User.get_by_pk(id)
+async def get_user(id: int, _me: PrincipalADP):
+    user = await User.aget_by_pk(id)
     if not user:
         raise NotFoundError(detail=f"用户 {id} 不存在")
 
@@ -68,10 +90,10 @@ async def sign_in(user_c: UserCreate):
     TODO: 有个严重的问题，这个注册接口是无需权限的，那么就要防止恶意请求。
     XXX: 怎么限流？ 认证码？
     """
-    user = User.get_by_username(user_c.username)
+    user = await User.aget_by_username(user_c.username)
     if user:
         raise ExistedError(detail=f"用户名 {user_c.username} 已经存在")
     user_c.account_type = AccountType.local
     user = User(**user_c.model_dump())
-    user.set_password(user_c.password)
-    user.save()
+    await user.set_password_async(user_c.password)
+    await user.asave()
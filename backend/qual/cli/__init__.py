@@ -7,6 +7,9 @@ from sqlalchemy_utils import database_exists, create_database, drop_database
 from alembic.config import main as alembic_main
 from qual.migrations.seeds import seed as seed_data
 from qual.core.settings import settings
+from qual.core.xyapi import security
+from qual.core.xyapi.security import KeyRing, benchmark_password_rounds
+from .bench import bench
 
 
 @click.group
@@ -17,6 +20,9 @@ def main():
     ...
 
 
+main.add_command(bench)
+
+
 @main.command
 @click.option("-r", "--reinstall", is_flag=True, help="重装，会删除数据库重新创建")
 def install(reinstall: bool):
@@ -49,3 +55,39 @@ def seed():
     填充初始数据
     """
     seed_data()
+
+
+@main.command
+@click.option(
+    "-t", "--target-ms", default=250.0, show_default=True, help="目标单次哈希耗时（毫秒）"
+)
+@click.option("-s", "--scheme", default=None, help="哈希算法，默认用 PASSWORD_HASH_SCHEME 配置")
+def calibrate_password(target_ms: float, scheme: str | None):
+    """
+    测试本机性能，挑选密码哈希的rounds
+
+    把输出的配置写到 `.env`，已有用户下次登录成功时会自动按新配置重新哈希。
+    """
+    rounds, results = benchmark_password_rounds(target_ms, scheme)
+    for _rounds, elapsed in results:
+        click.echo(f"rounds={_rounds:<10} {elapsed:8.1f}ms")
+
+    click.echo(f"推荐配置：PASSWORD_HASH_ROUNDS={rounds}")
+
+
+@main.command
+def rotate_jwt_key():
+    """
+    立即轮换JWT签名密钥
+
+    需要配置 `JWT_KEYS_DIR`。新密钥先发布到JWKS，过了 `JWT_KEY_PUBLISH_SECONDS` 秒
+    才开始签发；旧密钥会保留到用它签发的token全部过期，正在运行的服务会在下一次检查时加载新密钥。
+    """
+    keyring = security.jwt_backend
+    if not isinstance(keyring, KeyRing):
+        click.echo("没有配置 JWT_KEYS_DIR，当前不是密钥环模式。")
+        return
+
+    kid = keyring.rotate()
+    click.echo(f"新的签名密钥：{kid}，{keyring.publish.total_seconds():.0f}秒后开始签发")
+    click.echo(f"当前密钥：{', '.join(keyring.kids)}")
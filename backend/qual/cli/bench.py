@@ -0,0 +1,282 @@
+"""
+性能基准测试命令
+
+用来对比不同实现的吞吐量，结果只跟当前机器有关，不要跨机器比较。
+"""
+
+import secrets
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable
+import click
+from jose import jwt
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import MetaData, create_engine, lambda_stmt, select
+from sqlalchemy.orm import Mapped, Session, mapped_column
+from qual.core.xyapi.database.sqlalchemy_activerecord import Model
+from qual.core.xyapi.security import (
+    JWTBackend,
+    Payload,
+    create_jwt_backend,
+    generate_signing_key,
+    pyjwt,
+)
+
+
+def _ops_per_second(func: Callable[[], object], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return number / (time.perf_counter() - start)
+
+
+@click.group
+def bench():
+    """
+    性能基准测试
+    """
+    ...
+
+
+@bench.command("jwt")
+@click.option("-n", "--number", default=2000, show_default=True, help="每项测试的执行次数")
+@click.option(
+    "-a",
+    "--algorithm",
+    "algorithms",
+    multiple=True,
+    default=["HS256", "ES256"],
+    show_default=True,
+    help="要测试的算法，可以多次指定",
+)
+def bench_jwt(number: int, algorithms: tuple[str, ...]):
+    """
+    对比各个JWT后端签发（access+refresh令牌对）和验证的吞吐量
+
+    `legacy` 是原来的实现：每次签发都拷贝、导出 `Payload` 模型，每次签发和验证都用密钥串
+    调用 `jose.jwt`（每次都重新解析密钥）。
+    """
+    backends = ["jose", "pyjwt"] if pyjwt else ["jose"]
+
+    click.echo(f"{'后端':<8}{'算法':<8}{'签发(对/秒)':>12}{'验证(个/秒)':>12}")
+
+    for algorithm in algorithms:
+        key = secrets.token_urlsafe(32) if algorithm.startswith("HS") else None
+        if key is None:
+            try:
+                key = generate_signing_key(algorithm)
+            except ValueError as e:
+                click.echo(f"跳过 {algorithm}：{e}")
+                continue
+
+        if algorithm.startswith("HS"):
+            _bench_legacy(algorithm, key, number)
+
+        for name in backends:
+            try:
+                backend = create_jwt_backend(name, algorithm, key)
+            except (RuntimeError, ValueError) as e:
+                click.echo(f"跳过 {name} {algorithm}：{e}")
+                continue
+            _bench_backend(name, backend, number)
+
+
+def _bench_backend(name: str, backend: JWTBackend, number: int):
+    access_token, _ = backend.encode_pair("admin", ["all"], 30, 60)
+
+    issue = _ops_per_second(
+        lambda: backend.encode_pair("admin", ["all"], 30, 60), number
+    )
+    verify = _ops_per_second(lambda: backend.decode(access_token), number)
+    click.echo(f"{name:<10}{backend.algorithm:<10}{issue:>16.0f}{verify:>16.0f}")
+
+
+def _bench_legacy(algorithm: str, key: str, number: int):
+    def issue():
+        payload = Payload(sub="admin", scopes=["all"])
+        for typ in ("access", "refresh"):
+            to_encode = payload.model_copy()
+            to_encode.typ = typ
+            to_encode.exp = datetime.utcnow() + timedelta(minutes=30)
+            jwt.encode(
+                to_encode.model_dump(exclude_unset=True), key=key, algorithm=algorithm
+            )
+
+    token = jwt.encode({"sub": "admin", "exp": int(time.time()) + 60}, key, algorithm)
+    verify = _ops_per_second(
+        lambda: jwt.decode(token, key, algorithms=algorithm), number
+    )
+    issue_ops = _ops_per_second(issue, number)
+    click.echo(f"{'legacy':<10}{algorithm:<10}{issue_ops:>16.0f}{verify:>16.0f}")
+
+
+class _BenchModel(Model):
+    __abstract__ = True
+    metadata = MetaData()
+
+
+class _BenchRow(_BenchModel):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(unique=True)
+    value: Mapped[int] = mapped_column(default=0)
+
+
+class _BenchRowRead(BaseModel):
+    id: int
+    name: str
+    value: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+@bench.command("bulk")
+@click.option("-n", "--number", default=5000, show_default=True, help="插入的行数")
+@click.option("-c", "--chunk-size", default=1000, show_default=True, help="每批行数")
+@click.option(
+    "--dsn",
+    default="",
+    help="测试用的数据库，默认在临时目录建一个SQLite。会建表 `_benchrow`，测完删除",
+)
+def bench_bulk(number: int, chunk_size: int, dsn: str):
+    """
+    对比逐行 `save` 和 `bulk_insert` `bulk_upsert` `bulk_update` 的吞吐量
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(dsn or f"sqlite:///{Path(tmp) / 'bench.sqlite'}")
+        old_engine = Model.engine
+        _BenchModel.metadata.create_all(engine)
+        Model.bind(engine)
+        try:
+            _bench_bulk(number, chunk_size)
+        finally:
+            Model.bind(old_engine)
+            _BenchModel.metadata.drop_all(engine)
+            engine.dispose()
+
+
+def _bench_bulk(number: int, chunk_size: int):
+    rows = [{"name": f"row{i}", "value": i} for i in range(number)]
+
+    click.echo(f"{'操作':<14}{'行数':>8}{'行/秒':>12}")
+
+    # 逐行save要慢得多，只测一小部分
+    count = min(number, 500)
+    start = time.perf_counter()
+    for row in rows[:count]:
+        _BenchRow(name=f"save-{row['name']}", value=row["value"]).save()
+    save_rps = count / (time.perf_counter() - start)
+    click.echo(f"{'save':<16}{count:>10}{save_rps:>14.0f}")
+
+    result = _BenchRow.bulk_insert(rows, chunk_size=chunk_size)
+    click.echo(f"{'bulk_insert':<16}{result.rows:>10}{result.rows_per_second:>14.0f}")
+
+    result = _BenchRow.bulk_upsert(
+        ({**row, "value": -row["value"]} for row in rows),
+        conflict_on=["name"],
+        chunk_size=chunk_size,
+    )
+    click.echo(f"{'bulk_upsert':<16}{result.rows:>10}{result.rows_per_second:>14.0f}")
+
+    bench_rows = _BenchRow.scalars(
+        _BenchRow.select.where(_BenchRow.name.startswith("row"))
+    ).all()
+    result = _BenchRow.bulk_update(
+        ({"id": row.id, "value": 1} for row in bench_rows), chunk_size=chunk_size
+    )
+    click.echo(f"{'bulk_update':<16}{result.rows:>10}{result.rows_per_second:>14.0f}")
+
+
+@bench.command("stmt")
+@click.option("-n", "--number", default=5000, show_default=True, help="每项测试的执行次数")
+def bench_stmt(number: int):
+    """
+    对比每次重新构建语句、`lambda_stmt`、`cached_statement` 的单次查询开销
+
+    “构建”只算构建语句和生成缓存key（SQLAlchemy命中编译缓存前必须做的），
+    “查询”是在内存SQLite上按唯一列查一行的完整耗时。
+    """
+    engine = create_engine("sqlite://")
+    _BenchModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(_BenchRow(name=f"row{i}") for i in range(100))
+        session.commit()
+
+        def build_select():
+            return select(_BenchRow).where(_BenchRow.name == "row1"), None
+
+        def build_lambda():
+            name = "row1"
+            return (
+                lambda_stmt(lambda: select(_BenchRow).where(_BenchRow.name == name)),
+                None,
+            )
+
+        def build_cached():
+            return _BenchRow._unique_stmt("name"), {"name": "row1"}
+
+        click.echo(f"{'方式':<14}{'构建(次/秒)':>12}{'查询(次/秒)':>12}{'单次查询(μs)':>14}")
+        for name, build in [
+            ("select", build_select),
+            ("lambda_stmt", build_lambda),
+            ("cached", build_cached),
+        ]:
+            build_ops = _ops_per_second(
+                lambda: build()[0]._generate_cache_key(), number
+            )
+
+            def query():
+                stmt, params = build()
+                session.scalar(stmt, params)
+                session.expunge_all()
+
+            query_ops = _ops_per_second(query, number)
+            click.echo(
+                f"{name:<16}{build_ops:>14.0f}{query_ops:>14.0f}"
+                f"{1_000_000 / query_ops:>16.1f}"
+            )
+    engine.dispose()
+
+
+@bench.command("read")
+@click.option("-n", "--number", default=50, show_default=True, help="每项测试的执行次数")
+@click.option("-r", "--rows", default=1000, show_default=True, help="每次查询的行数")
+def bench_read(number: int, rows: int):
+    """
+    对比ORM查询（`scalars(...).all()` + `from_attributes` 校验）和 `read` 只读列查询
+    组装成响应模型的吞吐量
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.sqlite'}")
+        old_engine = Model.engine
+        _BenchModel.metadata.create_all(engine)
+        Model.bind(engine)
+        try:
+            _BenchRow.bulk_insert({"name": f"row{i}", "value": i} for i in range(rows))
+
+            def orm():
+                return [
+                    _BenchRowRead.model_validate(row)
+                    for row in _BenchRow.scalars(_BenchRow.select).all()
+                ]
+
+            def read():
+                return _BenchRow.read(_BenchRowRead)
+
+            def read_unvalidated():
+                return _BenchRow.read(_BenchRowRead, validate=False)
+
+            assert orm() == read() == read_unvalidated()
+
+            click.echo(f"{'方式':<18}{'查询(次/秒)':>12}{'行/秒':>12}")
+            for name, func in [
+                ("orm", orm),
+                ("read", read),
+                ("read(validate=F)", read_unvalidated),
+            ]:
+                ops = _ops_per_second(func, number)
+                click.echo(f"{name:<20}{ops:>14.1f}{ops * rows:>14.0f}")
+        finally:
+            Model.bind(old_engine)
+            engine.dispose()
@@ -1,13 +1,20 @@
-from typing import Annotated
+from typing import Annotated, Self
 from fastapi import Depends
+from pydantic import BaseModel, ConfigDict, Field
 from qual.apps.user.model import User
 from qual.apps.auth.authorizations.xysso.router import xysso_bearer
 from qual.apps.auth.authorizations.oauth2password.router import oauth2_password_bearer
-from qual.core.xyapi.security import AccessTokenPayloadADP
-from qual.apps.user.model import User
+from qual.core.xyapi.database.routing import set_consistency_key
+from qual.core.xyapi.exception import JWTUnauthorizedError
+from qual.core.xyapi.security import AccessTokenPayloadADP, Payload
+
+
+async def _load_user(username: str) -> User | None:
+    # `User` 声明了实体缓存，按用户名命中时不查数据库
+    return await User.aget_by_username(username)
 
 
-def authenticate(
+async def authenticate(
     token: AccessTokenPayloadADP,
     _1=Depends(xysso_bearer),
     _2=Depends(oauth2_password_bearer),
@@ -18,6 +25,15 @@ def authenticate(
     这个依赖项是用来给 `openapi` 用的， 实际最终AccessTokenPayloadADP起作用。
     后面的依赖项都是用来给 `opanapi` 页面注册认证模式用的。
 
+    用户按用户名（`sub`）缓存在 `User.__entity_cache__` 里，缓存命中时不查数据库。
+    命中时返回的是detached对象，只有列属性，不要访问懒加载的关系。
+
+    令牌里的安全版本号（`sv`）跟用户当前的对不上（改过密码）会认证失败。
+    安全版本号声明在 `User.__entity_cache__` 的 `uncached` 里，缓存命中时也是从数据库读的，
+    别的worker改了密码这里马上就能拒绝旧令牌。
+
+    只需要用户id、用户名、scopes的接口请用 `PrincipalADP`，完全不碰数据库。
+
     Args:
         token (AccessTokenPayloadADP): 访问令牌
         user_dao (UserDAO_ADP): 用户DAO
@@ -27,8 +43,79 @@ def authenticate(
     Returns:
         _type_: _description_
     """
-    user = User.scalar(User.select.where(User.username == token.sub))
+    # 读写分离时，这个用户刚写过的话本次请求的读走主库
+    set_consistency_key(token.sub)
+    user = await _load_user(token.sub)
+    # `security_stamp` 不走缓存，见 `User.__entity_cache__`
+    if user is not None and user.security_stamp != token.sv:
+        raise JWTUnauthorizedError("令牌已失效，请重新登录")
     return user
 
 
 AuthenticateADP = Annotated[User, Depends(authenticate)]
+
+
+class Principal(BaseModel):
+    """
+    当前登录的主体
+
+    只由令牌负载构建，不可变。大部分接口只需要知道“是谁”，不需要完整的 `User` 对象，
+    用这个就不用查数据库。
+
+    NOTE: 安全版本号只是令牌签发时的值，这条路径不会去数据库比对，改密码后旧的access令牌
+    在过期前还能通过 `PrincipalADP`（刷新令牌和 `AuthenticateADP` 会拒绝）。
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    id: int | None = Field(description="用户id，老令牌没有")
+    username: str = Field(description="用户名")
+    scopes: tuple[str, ...] = Field(description="权限范围")
+    security_stamp: int = Field(description="签发令牌时用户的安全版本号")
+
+    @classmethod
+    def from_payload(cls, payload: Payload) -> Self:
+        return cls(
+            id=payload.uid,
+            username=payload.sub,
+            scopes=tuple(payload.scopes),
+            security_stamp=payload.sv,
+        )
+
+    async def load_user(self) -> User | None:
+        """
+        加载完整的用户对象（走 `User.__entity_cache__`）
+
+        Returns:
+            User | None: 用户不存在返回None
+        """
+        return await _load_user(self.username)
+
+
+def get_principal(
+    token: AccessTokenPayloadADP,
+    _1=Depends(xysso_bearer),
+    _2=Depends(oauth2_password_bearer),
+) -> Principal:
+    """
+    认证并返回当前登录的主体，只用令牌负载，不查数据库
+
+    跟 `authenticate` 一样，后面的依赖项是给 `openapi` 页面注册认证模式用的。
+
+    用例：
+    ```python
+    @api.get("/hello")
+    async def hello(me: PrincipalADP):
+        return f"hello {me.username}"
+    ```
+
+    Args:
+        token (AccessTokenPayloadADP): 访问令牌
+
+    Returns:
+        Principal: 当前主体
+    """
+    return Principal.from_payload(token)
+
+
+PrincipalADP = Annotated[Principal, Depends(get_principal)]
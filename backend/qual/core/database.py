@@ -1,7 +1,10 @@
 import logging
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import Mapped, mapped_column
 from qual.core.settings import settings
+from qual.core.xyapi import metrics
+from qual.core.xyapi.database.pool import PoolMonitor, pool_options
 from qual.core.xyapi.database.sqlalchemy_activerecord import Model as BaseModel
 
 
@@ -33,5 +36,79 @@ class KeyMixin:
     )
 
 
-engine = create_engine(settings.DB_DSN, echo=settings.DEBUG)
-BaseModel.bind(engine)
+# 同步驱动对应的异步驱动
+_ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def async_dsn(dsn: str) -> str:
+    """
+    把同步DSN换成对应的异步驱动
+
+    Args:
+        dsn (str): 同步DSN，比如 `postgresql://...`、`postgresql+psycopg2://...`
+
+    Returns:
+        str: 异步DSN，比如 `postgresql+asyncpg://...`
+    """
+    url = make_url(dsn)
+    driver = _ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver:
+        url = url.set(drivername=f"{url.get_backend_name()}+{driver}")
+    return url.render_as_string(hide_password=False)
+
+
+def _create_engine(dsn: str, metric: str, is_async: bool = False):
+    """
+    按配置的连接池参数创建引擎，连接池统计以 `metric` 注册到 `metrics`
+    """
+    monitor = PoolMonitor()
+    options = pool_options(
+        dsn,
+        monitor,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    factory = create_async_engine if is_async else create_engine
+    engine = factory(dsn, echo=settings.DEBUG, **options)
+    monitor.listen(engine)
+    metrics.register(metric, monitor.collect)
+    return engine
+
+
+engine = _create_engine(settings.DB_DSN, "db_pool")
+replica_engines = [
+    _create_engine(dsn, f"db_pool.replica{i}")
+    for i, dsn in enumerate(settings.DB_REPLICA_DSNS)
+]
+router = BaseModel.bind(
+    engine,
+    replica_engines,
+    settings.DB_READ_YOUR_WRITES_SECONDS,
+    settings.DB_REPLICA_COOLDOWN_SECONDS,
+)
+if replica_engines:
+    metrics.register("db_router", router.collect)
+
+try:
+    async_engine = _create_engine(
+        settings.DB_ASYNC_DSN or async_dsn(settings.DB_DSN), "db_async_pool", True
+    )
+    async_replica_engines = [
+        _create_engine(async_dsn(dsn), f"db_async_pool.replica{i}", True)
+        for i, dsn in enumerate(settings.DB_REPLICA_DSNS)
+    ]
+    async_router = BaseModel.bind_async(
+        async_engine,
+        async_replica_engines,
+        settings.DB_READ_YOUR_WRITES_SECONDS,
+        settings.DB_REPLICA_COOLDOWN_SECONDS,
+    )
+    if async_replica_engines:
+        metrics.register("db_async_router", async_router.collect)
+except ModuleNotFoundError as e:
+    # 没装异步驱动只影响异步接口，命令行、迁移这些同步的用法还能用
+    async_engine = None
+    logger.warning(f"异步引擎创建失败，没有安装异步驱动：{e}")
@@ -1,3 +1,4 @@
+from typing import Literal
 from qual.core.xyapi.settings import BaseSettings
 
 
@@ -6,6 +7,36 @@ class Settings(BaseSettings):
     SECRET_KEY: str = ""
 
     DB_DSN: str = "sqlite:///.db.sqlite"
+    # 异步引擎用的DSN，为空时从DB_DSN推导（sqlite用aiosqlite，postgresql用asyncpg）
+    DB_ASYNC_DSN: str = ""
+    # 只读从库的DSN列表，为空时不做读写分离。异步从库的DSN同样从这里推导
+    DB_REPLICA_DSNS: list[str] = []
+    # 写过以后多少秒内同一个用户的读走主库（读己之写）
+    DB_READ_YOUR_WRITES_SECONDS: float = 5
+    # 从库出错以后多少秒内不再使用
+    DB_REPLICA_COOLDOWN_SECONDS: float = 30
+    # 连接池大小，内存SQLite之类不用 `QueuePool` 的数据库上大小、溢出、超时不生效
+    DB_POOL_SIZE: int = 5
+    # 池满以后最多再临时建多少个连接
+    DB_MAX_OVERFLOW: int = 10
+    # 等空闲连接的超时秒数
+    DB_POOL_TIMEOUT: float = 30
+    # 连接用了多少秒以后回收重建，-1为不回收。数据库或者中间件会断开空闲连接时设置得比它短
+    DB_POOL_RECYCLE: int = -1
+    # 借出连接前先ping一下，断掉的连接自动重连
+    DB_POOL_PRE_PING: bool = False
+    # 嵌套的列表接口（比如 /dict）在数据库里拼好JSON直接返回，见 `json_documents`
+    DB_JSON_AGGREGATION: bool = False
+    # 响应头 `Server-Timing` 里带上每个请求的SQL条数和耗时
+    DB_SERVER_TIMING: bool = True
+    # 同一个请求里同一条SQL重复执行（N+1）时打日志还是报错，为空时生产环境off，其它环境log
+    DB_N_PLUS_ONE: Literal["off", "log", "raise"] | None = None
+    # 同一条SQL执行多少次算N+1
+    DB_N_PLUS_ONE_THRESHOLD: int = 3
+
+    # 当前用户缓存，`authenticate` 用，SIZE为0时关闭
+    AUTH_USER_CACHE_SIZE: int = 4096
+    AUTH_USER_CACHE_TTL: float = 60
 
 
 settings = Settings()
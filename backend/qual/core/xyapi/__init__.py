@@ -7,12 +7,17 @@ xyapi这个模块是负责提供以下功能:
 from .xyapp import init, installer, FastAPI
 from .auto_discover import auto_discover
 from .settings import BaseSettings
+from . import metrics
 from .exception import (
     HttpExceptionModel,
+    BadRequestError,
     NotFoundError,
     ExistedError,
     JWTUnauthorizedError,
+    TooManyRequestsError,
+    ServiceUnavailableError,
 )
+from .responses import RawJSONResponse, StreamingJSONResponse
 from .security import AccessTokenPayloadADP, RefreshTokenPayloadADP, NeedScope, Scope
 
 __all__ = [
@@ -21,10 +26,16 @@ __all__ = [
     "auto_discover",
     "FastAPI",
     "BaseSettings",
+    "metrics",
     "HttpExceptionModel",
+    "BadRequestError",
     "NotFoundError",
     "ExistedError",
     "JWTUnauthorizedError",
+    "TooManyRequestsError",
+    "ServiceUnavailableError",
+    "RawJSONResponse",
+    "StreamingJSONResponse",
     "AccessTokenPayloadADP",
     "RefreshTokenPayloadADP",
     "NeedScope",
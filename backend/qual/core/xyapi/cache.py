@@ -0,0 +1,144 @@
+"""
+进程内缓存
+
+`TTLCache` 是一个线程安全的 LRU + TTL 缓存，带命中统计，可以直接注册到 `metrics`。
+
+用例：
+```python
+from qual.core.xyapi import metrics
+from qual.core.xyapi.cache import TTLCache
+
+cache = TTLCache[str, dict](max_size=1024, ttl=60)
+metrics.register("profile_cache", lambda: cache.stats.model_dump())
+
+cache.put("admin", {"name": "admin"})
+cache.get("admin")
+>> {"name": "admin"}
+```
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, TypeVar
+from pydantic import BaseModel, Field
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class CacheStats(BaseModel):
+    """
+    缓存统计
+    """
+
+    size: int = Field(description="当前缓存条数")
+    max_size: int = Field(description="最大缓存条数")
+    hits: int = Field(description="命中数")
+    misses: int = Field(description="未命中数")
+    evictions: int = Field(description="因容量不足被淘汰的条数")
+    hit_rate: float = Field(description="命中率")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    LRU + TTL 缓存
+
+    超出 `max_size` 淘汰最久没用的条目，条目超过 `ttl` 秒就过期。
+    `max_size` 小于等于0时不缓存任何东西。
+
+    同步依赖项是在线程池里跑的，所以内部用锁保护。
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict[Any, tuple[float, V]]()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _key(self, key: K) -> Any:
+        """
+        缓存内部实际使用的key，子类可以覆盖（比如存摘要而不是原文）
+        """
+        return key
+
+    def get(self, key: K) -> V | None:
+        """
+        获取缓存
+
+        Args:
+            key (K): key
+
+        Returns:
+            V | None: 没有缓存或者已经过期返回None
+        """
+        key = self._key(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._entries[key]
+            self._misses += 1
+            return None
+
+    def put(self, key: K, value: V, expires_at: float | None = None):
+        """
+        放入缓存
+
+        Args:
+            key (K): key
+            value (V): 值
+            expires_at (float | None, optional): 过期时间戳，跟 `ttl` 取更早的那个. Defaults to None.
+        """
+        if self.max_size <= 0:
+            return
+
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+
+        key = self._key(key)
+        with self._lock:
+            self._entries[key] = (deadline, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def discard(self, key: K):
+        """
+        移除某个key的缓存
+
+        Args:
+            key (K): key
+        """
+        with self._lock:
+            self._entries.pop(self._key(key), None)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def stats(self) -> CacheStats:
+        total = self._hits + self._misses
+        return CacheStats(
+            size=len(self._entries),
+            max_size=self.max_size,
+            hits=self._hits,
+            misses=self._misses,
+            evictions=self._evictions,
+            hit_rate=self._hits / total if total else 0.0,
+        )
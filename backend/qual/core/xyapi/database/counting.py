@@ -0,0 +1,131 @@
+"""
+存在性判断和计数
+
+- `exists`：`SELECT EXISTS (SELECT 1 ... LIMIT 1)`，找到第一行就停，不取整行
+- `count`：精确的 `COUNT(*)`，大表要扫全表（或者整个索引）
+- `estimated_count`：估算的总行数，代价是常数，适合列表接口显示“约 N 条”
+  - PostgreSQL：`pg_class.reltuples`，VACUUM/ANALYZE时更新的规划器统计
+  - SQLite：`sqlite_stat1` 里的行数，`ANALYZE` 时更新
+  - 没有统计信息（从来没有ANALYZE过）或者其它数据库：返回None，不会退回到精确计数，
+    列表接口的 `total` 客户端可以随便带，不能让它触发全表扫描
+  - 结果按表缓存 `ESTIMATE_TTL` 秒
+
+用例：
+```python
+User.exists(User.mail == mail)
+User.count(User.account_type == AccountType.local)
+User.estimated_count()
+```
+"""
+from typing import Any
+from sqlalchemy import (
+    ColumnElement,
+    Connection,
+    Engine,
+    Select,
+    func,
+    inspect,
+    literal_column,
+    select,
+    text,
+)
+from sqlalchemy.orm import Session
+from ..cache import TTLCache
+
+ESTIMATE_TTL = 60
+
+# (数据库, 表名) -> 估算行数
+_estimates = TTLCache[tuple[str, str], int](4096, ESTIMATE_TTL)
+
+
+def exists_stmt(model: type, where: ColumnElement[bool] | None = None) -> Select:
+    """
+    `SELECT EXISTS (SELECT 1 FROM 表 WHERE ... LIMIT 1)`
+    """
+    stmt = select(literal_column("1")).select_from(model)
+    if where is not None:
+        stmt = stmt.where(where)
+    return select(stmt.limit(1).exists())
+
+
+def count_stmt(model: type, where: ColumnElement[bool] | None = None) -> Select:
+    """
+    `SELECT count(*) FROM 表 WHERE ...`
+    """
+    stmt = select(func.count()).select_from(model)
+    if where is not None:
+        stmt = stmt.where(where)
+    return stmt
+
+
+def _postgresql_estimate(conn: Connection, table_name: str) -> int | None:
+    reltuples = conn.scalar(
+        text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)"),
+        {"name": table_name},
+    )
+    # 从来没有ANALYZE过是-1（PostgreSQL 14以前是0）
+    if reltuples is None or reltuples <= 0:
+        return None
+    return int(reltuples)
+
+
+def _sqlite_estimate(conn: Connection, table_name: str) -> int | None:
+    has_stat = conn.scalar(
+        text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        )
+    )
+    if not has_stat:
+        return None
+    # stat的第一个数是表的行数，每个索引一行，没有索引的表idx为NULL
+    stat = conn.scalar(
+        text("SELECT stat FROM sqlite_stat1 WHERE tbl = :name LIMIT 1"),
+        {"name": table_name},
+    )
+    if not stat:
+        return None
+    return int(stat.split()[0])
+
+
+_estimators = {
+    "postgresql": _postgresql_estimate,
+    "sqlite": _sqlite_estimate,
+}
+
+
+def estimated_count(session: Session, model: type) -> int | None:
+    """
+    估算模型的表的总行数
+
+    Args:
+        session (Session): 会话
+        model (type): ORM模型
+
+    Returns:
+        int | None: 估算的行数，没有统计信息返回None（需要精确值用 `count_stmt`）
+    """
+    mapper = inspect(model)
+    table = mapper.local_table
+    bind: Engine = session.get_bind(mapper, clause=count_stmt(model))
+    key = (repr(bind.url), table.fullname)
+
+    estimate = _estimates.get(key)
+    if estimate is not None:
+        return estimate
+
+    estimator: Any = _estimators.get(bind.dialect.name)
+    if estimator is None:
+        return None
+    # 统计信息的查询是纯文本SQL，按模型选好连接，多库的时候才不会查到别的库
+    conn = session.connection(bind_arguments={"mapper": mapper})
+    estimate = estimator(conn, table.fullname)
+    if estimate is not None:
+        _estimates.put(key, estimate)
+    return estimate
+
+
+def clear_estimates():
+    """
+    清空估算行数的缓存，ANALYZE之后或者测试里用
+    """
+    _estimates.clear()
@@ -0,0 +1,248 @@
+"""
+二级实体缓存
+
+很少变化的行（用户、字典）每次 `get_by_pk` / `get_by_username` 都查一次数据库不划算。
+模型声明 `__entity_cache__` 以后，按主键和声明的唯一键查询会先查进程内缓存。
+
+缓存的是列值快照（不是ORM对象），每次命中都还原出一个新对象，不同请求之间不会共享同一个对象。
+只有列属性，关系需要的时候再懒加载（异步会话里不能懒加载）。
+
+通过ORM修改、删除对象会在flush和commit之后自动失效；`bulk_*` 批量操作会清空整个模型的缓存；
+直接执行 `update(Model)` 之类的语句改了数据需要手动调用 `invalidate` 或 `clear`。
+
+缓存只在当前进程里，别的进程（别的worker）改了数据这里收不到失效，TTL之内读到的是旧值。
+密码、安全版本号这种旧值会出安全问题的列声明成 `uncached`：快照里不放，每次缓存命中都按主键单独查一次。
+
+失效时会给key记一个版本号。查数据库之前先取当前版本（`version`），放进缓存时如果key在这之后失效过就不放：
+请求A查到旧数据、请求B提交修改并失效、A再把旧数据放进缓存，这样的竞争不会把旧数据缓存一整个TTL。
+
+用例：
+```python
+class User(Model):
+    __entity_cache__ = EntityCache(
+        max_size=4096, ttl=60, unique_keys=["username"], uncached=["password"]
+    )
+
+    @classmethod
+    def get_by_username(cls, username: str):
+        return cls.get_by_unique("username", username)
+
+User.__entity_cache__.stats
+>> CacheStats(size=1, max_size=4096, hits=10, misses=1, ...)
+```
+"""
+import threading
+from typing import Any, Hashable, Iterable
+from sqlalchemy import Row, Select, event, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from .. import metrics
+from ..cache import TTLCache
+
+_PENDING_KEY = "entity_cache_pending"
+
+# 失效版本号最多记这么多个key，超出就整体作废，正在查询的都不放进缓存
+_MAX_VERSIONS = 4096
+
+
+class EntityCache(TTLCache[Hashable, dict[str, Any]]):
+    """
+    实体缓存
+
+    缓存的key是 `("pk", 主键元组)` 或者 `(唯一键名, 值)`，值是列值快照。
+    声明到模型上以后会以 `entity_cache.<模型名小写>` 注册到 `metrics`。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: float = 60,
+        unique_keys: Iterable[str] = (),
+        uncached: Iterable[str] = (),
+    ) -> None:
+        """
+        Args:
+            max_size (int, optional): 最大缓存条数，小于等于0不缓存
+            ttl (float, optional): 过期秒数
+            unique_keys (Iterable[str], optional): 可以按值查询缓存的唯一列
+            uncached (Iterable[str], optional): 不放进缓存的列，缓存命中时按主键单独查
+        """
+        super().__init__(max_size, ttl)
+        self.unique_keys = tuple(unique_keys)
+        self.uncached = tuple(uncached)
+        self.model: type | None = None
+
+        # 每次失效加一，key -> 最后一次失效时的版本，早于 `_floor` 开始的查询都不放进缓存
+        self._clock = 0
+        self._versions = dict[Hashable, int]()
+        self._floor = 0
+        self._version_lock = threading.Lock()
+
+    def __set_name__(self, owner: type, name: str):
+        self.model = owner
+        metrics.register(
+            f"entity_cache.{owner.__name__.lower()}", lambda: self.stats.model_dump()
+        )
+
+    @staticmethod
+    def pk_key(identity: Any) -> tuple:
+        return ("pk", identity if isinstance(identity, tuple) else (identity,))
+
+    def keys_of(self, obj: Any) -> set[Hashable]:
+        """
+        对象对应的所有缓存key，包括唯一键修改之前的旧值
+        """
+        state = inspect(obj)
+        keys = set[Hashable]()
+        if state.identity is not None:
+            keys.add(self.pk_key(state.identity))
+        for name in self.unique_keys:
+            history = state.attrs[name].history
+            for value in (*history.unchanged, *history.added, *history.deleted):
+                keys.add((name, value))
+        return keys
+
+    def snapshot(self, obj: Any) -> dict[str, Any] | None:
+        """
+        对象的列值快照（不含 `uncached` 的列），有列没加载（过期、延迟加载）就返回None
+        """
+        loaded = inspect(obj).dict
+        data = dict[str, Any]()
+        for attr in inspect(self.model).column_attrs:
+            if attr.key in self.uncached:
+                continue
+            if attr.key not in loaded:
+                return None
+            data[attr.key] = loaded[attr.key]
+        return data
+
+    def restore(self, data: dict[str, Any]) -> Any:
+        """
+        从快照还原成detached对象
+
+        还原出来的对象跟从数据库查出来的一样，`save` `update` 会正常生成UPDATE语句。
+        `uncached` 的列是过期状态，要用 `uncached_stmt` 查出来再 `fill`。
+        """
+        obj = self.model(**data)
+        make_transient_to_detached(obj)
+        return obj
+
+    def uncached_stmt(self, obj: Any) -> Select | None:
+        """
+        按主键查还原出来的对象 `uncached` 的列，没有 `uncached` 的列返回None
+        """
+        if not self.uncached:
+            return None
+        mapper = inspect(self.model)
+        identity = inspect(obj).identity
+        return select(*(getattr(self.model, name) for name in self.uncached)).where(
+            *(column == value for column, value in zip(mapper.primary_key, identity))
+        )
+
+    def fill(self, obj: Any, row: Row | None) -> bool:
+        """
+        把 `uncached_stmt` 查到的值填进对象
+
+        Args:
+            obj (Any): 还原出来的对象
+            row (Row | None): 查询结果
+
+        Returns:
+            bool: 行已经被删了返回False
+        """
+        if row is None:
+            return False
+        for name, value in zip(self.uncached, row):
+            set_committed_value(obj, name, value)
+        return True
+
+    def version(self) -> int:
+        """
+        当前的失效版本，查数据库之前取，放进缓存时传给 `store`
+        """
+        return self._clock
+
+    def store(self, obj: Any, session: Session, version: int):
+        """
+        把从数据库查出来的对象放进缓存
+
+        会话里有这个模型还没提交的修改时不放，免得把回滚掉的数据缓存下来；
+        对象的任意一个key在 `version` 之后失效过也不放，查到的可能是旧数据。
+
+        Args:
+            obj (Any): ORM对象
+            session (Session): 对象所在的会话
+            version (int): 查数据库之前取的 `version()`
+        """
+        state = inspect(obj)
+        if not state.persistent or state.modified:
+            return
+        if self in session.info.get(_PENDING_KEY, {}):
+            return
+        data = self.snapshot(obj)
+        if data is None:
+            return
+        keys = self.keys_of(obj)
+        with self._version_lock:
+            if version < self._floor or any(
+                self._versions.get(key, 0) > version for key in keys
+            ):
+                return
+            for key in keys:
+                self.put(key, data)
+
+    def _invalidate_keys(self, keys: Iterable[Hashable]):
+        with self._version_lock:
+            self._clock += 1
+            for key in keys:
+                self.discard(key)
+                self._versions[key] = self._clock
+            if len(self._versions) > _MAX_VERSIONS:
+                self._versions.clear()
+                self._floor = self._clock
+
+    def invalidate(self, obj: Any, session: Session | None = None):
+        """
+        让对象的缓存失效
+
+        传了 `session` 的话提交之后会再失效一次，因为flush到commit之间别的请求还可能读到旧数据放回缓存。
+
+        Args:
+            obj (Any): ORM对象
+            session (Session | None, optional): 对象所在的会话
+        """
+        keys = self.keys_of(obj)
+        self._invalidate_keys(keys)
+        if session is not None:
+            pending = session.info.setdefault(_PENDING_KEY, {})
+            if pending.get(self, set()) is not None:
+                pending.setdefault(self, set()).update(keys)
+
+    def clear(self):
+        with self._version_lock:
+            self._clock += 1
+            self._versions.clear()
+            self._floor = self._clock
+            super().clear()
+
+    def clear_later(self, session: Session | None = None):
+        """
+        清空缓存，传了 `session` 的话提交之后会再清空一次
+        """
+        self.clear()
+        if session is not None:
+            session.info.setdefault(_PENDING_KEY, {})[self] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _on_commit(session: Session):
+    for cache, keys in session.info.pop(_PENDING_KEY, {}).items():
+        if keys is None:
+            cache.clear()
+        else:
+            cache._invalidate_keys(keys)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _on_rollback(session: Session, previous_transaction):
+    session.info.pop(_PENDING_KEY, None)
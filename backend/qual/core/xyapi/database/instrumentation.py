@@ -0,0 +1,158 @@
+"""
+请求级SQL统计
+
+`QueryTimingMiddleware` 用 `before_cursor_execute` / `after_cursor_execute` 事件统计每个请求执行了多少条SQL、
+花了多少时间，写进响应的 `Server-Timing` 头（浏览器开发者工具的Timing面板能直接看到）：
+
+    Server-Timing: db;dur=12.3;desc="5 queries"
+
+同一个请求里同一条SQL（参数化以后的语句文本一样）执行了 `threshold` 次以上，多半是循环里懒加载关系的N+1查询，
+开发和测试环境下可以打日志（`log`）或者直接报错（`raise`），生产环境关掉（`off`）。
+
+事件监听在 `Engine` 类上，所有引擎（包括异步引擎底下的同步引擎）都会统计；请求之外执行的SQL不统计。
+
+用例：
+```python
+app.add_middleware(UnitOfWorkMiddleware)
+# 加在工作单元外面，提交时flush的SQL也算进去
+app.add_middleware(QueryTimingMiddleware, n_plus_one="log", threshold=3)
+```
+"""
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Literal
+from sqlalchemy import Engine, event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+NPlusOneMode = Literal["off", "log", "raise"]
+
+# 开始时间记在这条语句的执行上下文上，语句出错没有 `after_cursor_execute` 也不会残留在池化的连接上
+_START_ATTR = "_query_timing_start"
+
+
+class NPlusOneError(RuntimeError):
+    """
+    `raise` 模式下发现N+1查询
+    """
+
+
+class QueryStats:
+    """
+    一个请求的SQL统计
+    """
+
+    def __init__(
+        self, path: str = "", n_plus_one: NPlusOneMode = "off", threshold: int = 3
+    ) -> None:
+        self.path = path
+        self.n_plus_one = n_plus_one
+        self.threshold = threshold
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter[str]()
+
+    @property
+    def repeated(self) -> dict[str, int]:
+        """
+        执行次数达到 `threshold` 的SQL
+        """
+        return {
+            statement: count
+            for statement, count in self.statements.items()
+            if count >= self.threshold
+        }
+
+    def record(self, statement: str):
+        self.count += 1
+        self.statements[statement] += 1
+        if self.n_plus_one == "off" or self.statements[statement] != self.threshold:
+            return
+
+        message = f"疑似N+1查询：{self.path} 同一条SQL执行了{self.threshold}次：{statement}"
+        if self.n_plus_one == "raise":
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.seconds * 1000:.1f};desc="{self.count} queries"'
+
+
+_stats_var = ContextVar[QueryStats | None]("query_stats_var", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _stats_var.get()
+    if stats is None:
+        return
+    stats.record(statement)
+    setattr(context, _START_ATTR, time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _stats_var.get()
+    start = getattr(context, _START_ATTR, None)
+    if stats is None or start is None:
+        return
+    stats.seconds += time.perf_counter() - start
+
+
+def install():
+    """
+    在 `Engine` 类上监听SQL执行事件，重复调用只监听一次
+    """
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryTimingMiddleware:
+    """
+    请求级SQL统计中间件
+
+    统计结果写进 `Server-Timing` 响应头，N+1检查见模块说明。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        n_plus_one: NPlusOneMode = "off",
+        threshold: int = 3,
+        server_timing: bool = True,
+    ) -> None:
+        """
+        Args:
+            app (ASGIApp): ASGI应用
+            n_plus_one (NPlusOneMode, optional): N+1检查，`off` 不检查，`log` 打警告日志，
+                `raise` 执行到第 `threshold` 次时抛 `NPlusOneError`
+            threshold (int, optional): 同一条SQL执行多少次算N+1
+            server_timing (bool, optional): 是否写 `Server-Timing` 响应头
+        """
+        self.app = app
+        self.n_plus_one = n_plus_one
+        self.threshold = threshold
+        self.server_timing = server_timing
+        install()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope.get("path", ""), self.n_plus_one, self.threshold)
+        token = _stats_var.set(stats)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and self.server_timing:
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _stats_var.reset(token)
@@ -0,0 +1,216 @@
+"""
+在数据库里拼响应JSON
+
+嵌套的响应模型（比如字典和它的 `children`）平常要先查ORM对象、组装成响应模型、再序列化成JSON。
+`json_document` 按响应模型把每一行在数据库里拼成一个JSON对象，嵌套的集合关系用关联子查询聚合成数组：
+- PostgreSQL：`json_build_object` + `json_agg`（按主键排序）
+- SQLite：`json_object` + `json_group_array`（聚合按主键排过序的子查询，SQLite的聚合函数里不能写ORDER BY）
+
+查出来的是JSON文本，Python这边只把每行的文本拼成数组，不解析也不校验，直接发给客户端。
+一页数据一条查询，Python几乎没有开销。
+
+限制：
+- 字段名要跟模型的列或者关系同名，嵌套的响应模型同样
+- 值的JSON表示由数据库决定，布尔值在SQLite上会转成 `true`/`false`，
+  日期时间之类的格式可能跟pydantic序列化的不一样，响应模型里有这些类型时不要用
+- 不经过响应模型校验，没有 `exclude`、别名、`SecretStr` 之类的处理
+
+用例：
+```python
+@api.get("", response_model=Page[DictionaryReadDetial])
+async def get_dicts(page: PageADP):
+    content = await Dictionary.apaginate_json(DictionaryReadDetial, limit=page.limit)
+    return RawJSONResponse(content)
+```
+"""
+import json
+from functools import cache
+from typing import Any, Iterable
+from pydantic import BaseModel
+from sqlalchemy import (
+    Boolean,
+    ColumnElement,
+    Text,
+    cast,
+    inspect,
+    literal_column,
+    select,
+)
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from .loading import _nested_schema
+
+# region 方言相关的JSON函数
+
+
+class _json_object(FunctionElement):
+    """
+    `json_object(key, value, ...)`
+    """
+
+    name = "json_object"
+    inherit_cache = True
+
+
+class _json_array_agg(FunctionElement):
+    """
+    把每行的JSON聚合成数组，没有行时是 `[]`，第一个参数是值，后面的是排序
+
+    SQLite不支持聚合函数里的排序，会忽略后面的参数，要聚合排好序的子查询。
+    """
+
+    name = "json_array_agg"
+    inherit_cache = True
+
+
+class _json_nested(FunctionElement):
+    """
+    子查询返回的JSON嵌进另一个JSON时当成JSON而不是字符串
+    """
+
+    name = "json_nested"
+    inherit_cache = True
+
+
+class _json_bool(FunctionElement):
+    """
+    布尔列转成JSON的 `true`/`false`
+    """
+
+    name = "json_bool"
+    inherit_cache = True
+
+
+@compiles(_json_object)
+def _compile_json_object(element, compiler, **kw):
+    return f"json_object({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(_json_object, "postgresql")
+def _compile_json_object_pg(element, compiler, **kw):
+    return f"json_build_object({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(_json_array_agg)
+def _compile_json_array_agg(element, compiler, **kw):
+    # 聚合的是带ORDER BY的子查询时，SQLite不会展开子查询，按子查询的顺序聚合
+    value, *_ = element.clauses
+    return f"json_group_array({compiler.process(value, **kw)})"
+
+
+@compiles(_json_array_agg, "postgresql")
+def _compile_json_array_agg_pg(element, compiler, **kw):
+    value, *order_by = element.clauses
+    order = ", ".join(compiler.process(column, **kw) for column in order_by)
+    order = f" ORDER BY {order}" if order else ""
+    return f"coalesce(json_agg({compiler.process(value, **kw)}{order}), '[]'::json)"
+
+
+@compiles(_json_nested)
+def _compile_json_nested(element, compiler, **kw):
+    return f"json({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(_json_nested, "postgresql")
+def _compile_json_nested_pg(element, compiler, **kw):
+    return compiler.process(element.clauses, **kw)
+
+
+@compiles(_json_bool)
+def _compile_json_bool(element, compiler, **kw):
+    value = compiler.process(element.clauses, **kw)
+    return f"json(CASE {value} WHEN 1 THEN 'true' WHEN 0 THEN 'false' END)"
+
+
+@compiles(_json_bool, "postgresql")
+def _compile_json_bool_pg(element, compiler, **kw):
+    return compiler.process(element.clauses, **kw)
+
+
+# endregion
+
+
+def _document(model: type, schema: type[BaseModel], seen: frozenset) -> ColumnElement:
+    mapper = inspect(model)
+    args = list[Any]()
+    for name, field in schema.model_fields.items():
+        if name in mapper.column_attrs:
+            column = getattr(model, name)
+            value = _json_bool(column) if isinstance(column.type, Boolean) else column
+        elif name in mapper.relationships:
+            relationship = mapper.relationships[name]
+            nested = _nested_schema(field.annotation)
+            target = relationship.mapper.class_
+            if nested is None or (target, nested) in seen:
+                raise TypeError(f"{schema.__name__}.{name} 不能在数据库里拼JSON")
+
+            document = _document(target, nested, seen | {(target, nested)})
+            if relationship.uselist:
+                # 先在子查询里按主键排好序再聚合，SQLite的聚合函数里不能排序
+                pks = inspect(target).primary_key
+                rows = (
+                    select(
+                        document.label("document"),
+                        *(pk.label(f"pk_{i}") for i, pk in enumerate(pks)),
+                    )
+                    .where(relationship.primaryjoin)
+                    .order_by(*pks)
+                    .correlate(model)
+                    .subquery()
+                )
+                order_by = [rows.c[f"pk_{i}"] for i in range(len(pks))]
+                subquery = select(
+                    _json_array_agg(_json_nested(rows.c.document), *order_by)
+                )
+            else:
+                subquery = select(document).where(relationship.primaryjoin).limit(1)
+            value = _json_nested(subquery.scalar_subquery())
+        elif field.is_required():
+            raise TypeError(f"{schema.__name__}.{name} 不是 {model.__name__} 的列或者关系")
+        else:
+            continue
+        # 字段名是标识符，直接写成字面量，PostgreSQL推断不出可变参数里绑定参数的类型
+        args += [literal_column(f"'{name}'"), value]
+    return _json_object(*args)
+
+
+@cache
+def json_document(model: type, schema: type[BaseModel]) -> ColumnElement[str]:
+    """
+    按响应模型把一行拼成JSON对象的表达式，结果是JSON文本
+
+    Args:
+        model (type): ORM模型
+        schema (type[BaseModel]): 响应模型
+
+    Raises:
+        TypeError: 响应模型有必填字段不是模型的列或者关系，或者嵌套的响应模型循环引用
+
+    Returns:
+        ColumnElement[str]: 表达式
+    """
+    return cast(_document(model, schema, frozenset({(model, schema)})), Text)
+
+
+def join_documents(documents: Iterable[str]) -> bytes:
+    """
+    把每行的JSON文本拼成JSON数组
+    """
+    return b"[" + ",".join(documents).encode() + b"]"
+
+
+def page_bytes(
+    documents: Iterable[str], next_cursor: str | None, total: int | None = None
+) -> bytes:
+    """
+    拼成 `Page` 的JSON：`{"items": [...], "next_cursor": ..., "total": ...}`
+    """
+    return (
+        b'{"items":'
+        + join_documents(documents)
+        + b',"next_cursor":'
+        + json.dumps(next_cursor).encode()
+        + b',"total":'
+        + json.dumps(total).encode()
+        + b"}"
+    )
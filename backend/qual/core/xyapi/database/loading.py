@@ -0,0 +1,83 @@
+"""
+按响应模型预加载关系
+
+响应模型里嵌套了关系（比如字典的 `children`），序列化的时候每个对象懒加载一次就是N+1查询，
+异步会话里更是直接报错。`eager_options` 按响应模型的字段生成加载选项，
+查询语句正好加载响应需要的那些关系，不多也不少：
+- 集合关系（一对多、多对多）用 `selectinload`，整批对象一条 `IN` 查询
+- 单个对象的关系（多对一）用 `joinedload`，跟主查询JOIN在一起
+- 嵌套的响应模型递归处理
+
+用例：
+```python
+@api.get("", response_model=list[DictionaryReadDetial])
+async def get_dicts():
+    return (await Dictionary.ascalars(Dictionary.select_for(DictionaryReadDetial))).all()
+```
+"""
+from functools import cache
+from typing import Any, get_args
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, raiseload, selectinload
+from sqlalchemy.orm.interfaces import ORMOption
+
+
+def _nested_schema(annotation: Any) -> type[BaseModel] | None:
+    """
+    从 `list[X]` `X | None` 这样的注解里找出嵌套的响应模型
+    """
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for arg in get_args(annotation):
+        schema = _nested_schema(arg)
+        if schema is not None:
+            return schema
+    return None
+
+
+def _options(
+    model: type, schema: type[BaseModel], strict: bool, seen: frozenset
+) -> list[ORMOption]:
+    relationships = inspect(model).relationships
+    options = list[ORMOption]()
+    for name in schema.model_fields:
+        relationship = relationships.get(name)
+        if relationship is None:
+            continue
+
+        attr = getattr(model, name)
+        loader = selectinload(attr) if relationship.uselist else joinedload(attr)
+
+        nested = _nested_schema(schema.model_fields[name].annotation)
+        target = relationship.mapper.class_
+        if nested is not None and (target, nested) not in seen:
+            sub_options = _options(target, nested, strict, seen | {(target, nested)})
+            if sub_options:
+                loader = loader.options(*sub_options)
+        options.append(loader)
+
+    if strict:
+        options.append(raiseload("*"))
+    return options
+
+
+@cache
+def eager_options(
+    model: type, schema: type[BaseModel], strict: bool = False
+) -> tuple[ORMOption, ...]:
+    """
+    按响应模型生成关系加载选项
+
+    结果按 (模型, 响应模型) 缓存，只在第一次调用时分析。
+
+    Args:
+        model (type): ORM模型
+        schema (type[BaseModel]): 响应模型，字段名跟关系名一致的字段会被预加载
+        strict (bool, optional): 响应模型里没有的关系改成访问即报错（`raiseload`），
+            开发测试时用来发现漏掉的预加载
+
+    Returns:
+        tuple[ORMOption, ...]: 加载选项，传给 `stmt.options(*options)`
+    """
+    return tuple(_options(model, schema, strict, frozenset({(model, schema)})))
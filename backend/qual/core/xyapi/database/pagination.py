@@ -0,0 +1,238 @@
+"""
+游标（keyset）分页
+
+`OFFSET` 分页翻到越后面越慢，数据库要先扫过前面所有的行再丢掉。游标分页记住上一页最后一行的排序键，
+下一页直接 `WHERE (排序键) > (上一页最后的值)`，配合索引每页都只扫 `limit` 行，
+多深的页都一样快。
+
+游标对客户端是不透明的字符串，客户端只需要原样传回来。
+
+用例：
+```python
+@api.get("", response_model=Page[UserRead])
+async def get_users(page: PageADP):
+    return await User.apaginate(
+        cursor=page.cursor, limit=page.limit, order_by=[User.create_at.desc()]
+    )
+```
+"""
+import base64
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Annotated, Any, Generic, Sequence, TypeVar
+from uuid import UUID
+from fastapi import Depends, Query
+from pydantic import BaseModel, Field
+from sqlalchemy import ColumnElement, Select, and_, inspect, or_, tuple_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from ..exception import BadRequestError
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    """
+    一页数据
+    """
+
+    items: list[T] = Field(description="数据")
+    next_cursor: str | None = Field(default=None, description="下一页的游标，没有下一页时为空")
+    total: int | None = Field(
+        default=None,
+        description="估算的总行数，请求时带 `total=true` 才有；数据库没有统计信息时为空，"
+        "SQLite要执行过ANALYZE才有统计信息，默认都是空",
+    )
+
+
+class PageParams(BaseModel):
+    """
+    分页参数
+    """
+
+    cursor: str | None = Field(default=None, description="游标，第一页不传")
+    limit: int = Field(default=20, description="每页条数")
+    total: bool = Field(default=False, description="是否返回估算的总行数，数据库没有统计信息时为空")
+
+
+def _page_params(
+    cursor: Annotated[str | None, Query(description="游标，第一页不传")] = None,
+    limit: Annotated[int, Query(ge=1, le=100, description="每页条数")] = 20,
+    total: Annotated[
+        bool, Query(description="是否返回估算的总行数，数据库没有统计信息（比如SQLite没有ANALYZE过）时为空")
+    ] = False,
+) -> PageParams:
+    return PageParams(cursor=cursor, limit=limit, total=total)
+
+
+PageADP = Annotated[PageParams, Depends(_page_params)]
+
+
+# region 排序键
+
+
+def _order_keys(
+    model: type, order_by: Sequence[Any] | None
+) -> list[tuple[ColumnElement, bool]]:
+    """
+    把 `order_by` 解析成 (列, 是否倒序) 列表，并补上主键保证排序唯一
+    """
+    keys = list[tuple[ColumnElement, bool]]()
+    for clause in order_by or []:
+        if isinstance(clause, UnaryExpression) and clause.modifier in (
+            operators.desc_op,
+            operators.asc_op,
+        ):
+            keys.append((clause.element, clause.modifier is operators.desc_op))
+        else:
+            keys.append((clause, False))
+
+    names = {column.key for column, _ in keys}
+    descending = keys[-1][1] if keys else False
+    for column in inspect(model).primary_key:
+        if column.key not in names:
+            keys.append((column, descending))
+    return keys
+
+
+def _seek(keys: list[tuple[ColumnElement, bool]], values: list[Any]) -> ColumnElement:
+    """
+    生成“排在这些值后面”的条件
+
+    方向一致时用行值比较 `(a, b) > (x, y)`，PostgreSQL能直接用上联合索引；
+    方向不一致时展开成 `a > x OR (a = x AND b < y) ...`。
+    """
+    if len({desc for _, desc in keys}) == 1:
+        columns = tuple_(*(column for column, _ in keys))
+        literal = tuple_(*values)
+        return columns < literal if keys[0][1] else columns > literal
+
+    clauses = []
+    for i, (column, desc) in enumerate(keys):
+        equals = [keys[j][0] == values[j] for j in range(i)]
+        after = column < values[i] if desc else column > values[i]
+        clauses.append(and_(*equals, after))
+    return or_(*clauses)
+
+
+# endregion
+
+# region 游标编解码
+
+
+def _dump_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+def _load_value(column: ColumnElement, value: Any) -> Any:
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type in (datetime, date, time):
+        return python_type.fromisoformat(value)
+    if python_type in (Decimal, UUID):
+        return python_type(value)
+    if python_type is float and isinstance(value, int):
+        return float(value)
+    if not isinstance(value, python_type):
+        raise ValueError(f"{column.key} 的值类型不对")
+    return value
+
+
+def encode_cursor(keys: list[tuple[ColumnElement, bool]], row: Any) -> str:
+    """
+    把一行的排序键编码成游标
+
+    Args:
+        keys (list[tuple[ColumnElement, bool]]): 排序键
+        row (Any): ORM对象
+
+    Returns:
+        str: 游标
+    """
+    values = [_dump_value(getattr(row, column.key)) for column, _ in keys]
+    data = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor(keys: list[tuple[ColumnElement, bool]], cursor: str) -> list[Any]:
+    """
+    解码游标
+
+    Args:
+        keys (list[tuple[ColumnElement, bool]]): 排序键
+        cursor (str): 游标
+
+    Raises:
+        BadRequestError: 游标无效
+
+    Returns:
+        list[Any]: 排序键的值
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError()
+        return [_load_value(column, value) for (column, _), value in zip(keys, values)]
+    except (ValueError, TypeError):
+        raise BadRequestError("游标无效")
+
+
+# endregion
+
+
+def keyset_stmt(
+    model: type,
+    stmt: Select,
+    cursor: str | None,
+    limit: int,
+    order_by: Sequence[Any] | None,
+) -> tuple[Select, list[tuple[ColumnElement, bool]]]:
+    """
+    给查询语句加上游标条件、排序和 `limit+1`（多查一行用来判断有没有下一页）
+
+    Args:
+        model (type): 模型
+        stmt (Select): 查询语句
+        cursor (str | None): 游标
+        limit (int): 每页条数
+        order_by (Sequence[Any] | None): 排序，比如 `[User.create_at.desc()]`，会自动补上主键
+
+    Returns:
+        tuple[Select, list[tuple[ColumnElement, bool]]]: (语句, 排序键)
+    """
+    keys = _order_keys(model, order_by)
+    if cursor:
+        stmt = stmt.where(_seek(keys, decode_cursor(keys, cursor)))
+    stmt = stmt.order_by(
+        None, *(column.desc() if desc else column.asc() for column, desc in keys)
+    )
+    return stmt.limit(limit + 1), keys
+
+
+def make_page(
+    rows: Sequence[Any], limit: int, keys: list[tuple[ColumnElement, bool]]
+) -> Page:
+    """
+    把 `keyset_stmt` 查出来的结果组装成一页
+
+    Args:
+        rows (Sequence[Any]): 查询结果
+        limit (int): 每页条数
+        keys (list[tuple[ColumnElement, bool]]): 排序键
+
+    Returns:
+        Page: 一页数据
+    """
+    items = list(rows[:limit])
+    next_cursor = encode_cursor(keys, items[-1]) if len(rows) > limit else None
+    return Page(items=items, next_cursor=next_cursor)
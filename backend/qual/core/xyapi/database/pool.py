@@ -0,0 +1,155 @@
+"""
+连接池配置和监控
+
+`pool_options` 按数据库选好连接池类，把池大小、溢出、超时、回收、pre-ping这些参数整理成
+`create_engine` 的参数，只有 `QueuePool` 一类的池才支持的参数在别的池上会被去掉
+（比如内存SQLite用的 `SingletonThreadPool` / `StaticPool`）。
+
+`PoolMonitor` 用连接池事件统计连接池的压力，注册到 `metrics` 以后跟其它指标一起导出：
+- 借出连接的等待时间（`Pool.connect` 的耗时，包括等空闲连接、新建连接和pre-ping）
+- 当前借出的连接数、峰值，溢出连接数，新建溢出连接的次数
+- 等待超时、连接失效的次数
+
+用例：
+```python
+monitor = PoolMonitor()
+engine = create_engine(dsn, **pool_options(dsn, monitor, pool_size=10, max_overflow=5))
+monitor.listen(engine)
+metrics.register("db_pool", monitor.collect)
+```
+"""
+import threading
+import time
+from typing import Any
+from pydantic import BaseModel, Field
+from sqlalchemy import URL, Engine, event, exc, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import Pool, QueuePool
+
+# 只有 `QueuePool` 一类的池才支持的参数
+_QUEUE_POOL_OPTIONS = ("pool_size", "max_overflow", "pool_timeout")
+
+
+class PoolStats(BaseModel):
+    """
+    连接池统计
+    """
+
+    size: int = Field(default=0, description="池大小")
+    checked_out: int = Field(default=0, description="当前借出的连接数")
+    checked_out_max: int = Field(default=0, description="借出连接数的峰值")
+    overflow: int = Field(default=0, description="当前超出池大小的连接数，负数表示池还没满")
+    checkouts: int = Field(default=0, description="借出次数")
+    connects: int = Field(default=0, description="新建连接的次数")
+    overflow_connects: int = Field(default=0, description="超出池大小新建连接的次数")
+    invalidations: int = Field(default=0, description="连接失效的次数（断线、pre-ping失败、回收）")
+    timeouts: int = Field(default=0, description="等空闲连接超时的次数")
+    wait_seconds_total: float = Field(default=0, description="借出连接的总耗时")
+    wait_seconds_max: float = Field(default=0, description="借出连接的最大耗时")
+
+
+class PoolMonitor:
+    """
+    连接池监控
+    """
+
+    def __init__(self) -> None:
+        self.stats = PoolStats()
+        self.engine: Engine | None = None
+        self._lock = threading.Lock()
+
+    def pool_class(self, dsn: str | URL) -> type[Pool]:
+        """
+        数据库默认的连接池类的子类，记录每次借出连接的耗时
+
+        用子类而不是包一层 `connect`，`engine.dispose()` 重建连接池以后还在。
+        """
+        url = make_url(dsn)
+        base = url.get_dialect().get_pool_class(url)
+        monitor = self
+
+        class MonitoredPool(base):
+            def connect(self):
+                start = time.perf_counter()
+                try:
+                    return super().connect()
+                except exc.TimeoutError:
+                    monitor.stats.timeouts += 1
+                    raise
+                finally:
+                    monitor.record_wait(time.perf_counter() - start)
+
+        MonitoredPool.__name__ = f"Monitored{base.__name__}"
+        MonitoredPool.__qualname__ = MonitoredPool.__name__
+        return MonitoredPool
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.stats.wait_seconds_total += seconds
+            self.stats.wait_seconds_max = max(self.stats.wait_seconds_max, seconds)
+
+    def listen(self, engine: Engine | AsyncEngine):
+        """
+        监听引擎的连接池事件，异步引擎监听它的 `sync_engine`
+        """
+        self.engine = getattr(engine, "sync_engine", engine)
+        event.listen(self.engine, "connect", self._on_connect)
+        event.listen(self.engine, "checkout", self._on_checkout)
+        event.listen(self.engine, "invalidate", self._on_invalidate)
+        event.listen(self.engine, "soft_invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.stats.connects += 1
+            pool = self.engine.pool
+            if isinstance(pool, QueuePool) and pool.overflow() > 0:
+                self.stats.overflow_connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.stats.checkouts += 1
+            pool = self.engine.pool
+            if isinstance(pool, QueuePool):
+                self.stats.checked_out_max = max(
+                    self.stats.checked_out_max, pool.checkedout()
+                )
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.stats.invalidations += 1
+
+    def collect(self) -> dict[str, Any]:
+        """
+        给 `metrics` 用的统计，池大小、借出数这些是收集时的实时值
+        """
+        pool = self.engine.pool if self.engine is not None else None
+        if isinstance(pool, QueuePool):
+            self.stats.size = pool.size()
+            self.stats.checked_out = pool.checkedout()
+            self.stats.overflow = pool.overflow()
+        return self.stats.model_dump()
+
+
+def pool_options(
+    dsn: str | URL, monitor: PoolMonitor | None = None, **options: Any
+) -> dict[str, Any]:
+    """
+    整理 `create_engine` 的连接池参数
+
+    Args:
+        dsn (str | URL): 数据库DSN
+        monitor (PoolMonitor | None, optional): 连接池监控，传了就用它的连接池类
+        options (Any): `pool_size` `max_overflow` `pool_timeout` `pool_recycle` `pool_pre_ping`
+
+    Returns:
+        dict[str, Any]: `create_engine` 的参数
+    """
+    url = make_url(dsn)
+    poolclass = (
+        monitor.pool_class(url)
+        if monitor is not None
+        else url.get_dialect().get_pool_class(url)
+    )
+    if not issubclass(poolclass, QueuePool):
+        options = {k: v for k, v in options.items() if k not in _QUEUE_POOL_OPTIONS}
+    return {"poolclass": poolclass, **options}
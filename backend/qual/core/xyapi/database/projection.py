@@ -0,0 +1,77 @@
+"""
+只读列查询，直接组装成响应模型
+
+只读的列表接口走ORM要付三份钱：ORM对象的构建和身份映射登记，`from_attributes` 逐个属性读取，
+最后才是响应模型校验。`Model.read(UserRead)` 只查响应模型需要的那几列（Core `select`），
+用行的映射直接校验成响应模型，中间不产生ORM对象。
+
+限制：
+- 只支持平铺的响应模型，字段名要跟模型的列属性同名；模型上没有的字段必须有默认值
+- 查出来的是响应模型对象，不在会话里，不能修改保存
+
+用例：
+```python
+users = User.read(UserRead, User.select_columns(UserRead).where(User.mail != None))
+page = await User.apaginate(cursor=cursor, limit=20, schema=UserRead)
+```
+"""
+from functools import cache
+from typing import Any, Iterable, Sequence, TypeVar
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Row, inspect
+from sqlalchemy.orm import InstrumentedAttribute
+
+S = TypeVar("S", bound=BaseModel)
+
+
+@cache
+def schema_columns(
+    model: type, schema: type[BaseModel]
+) -> tuple[InstrumentedAttribute, ...]:
+    """
+    响应模型需要查的列
+
+    Args:
+        model (type): ORM模型
+        schema (type[BaseModel]): 响应模型
+
+    Raises:
+        TypeError: 响应模型有必填字段不是模型的列（比如关系）
+
+    Returns:
+        tuple[InstrumentedAttribute, ...]: 列属性，按响应模型的字段顺序
+    """
+    column_attrs = inspect(model).column_attrs
+    columns = list[InstrumentedAttribute]()
+    for name, field in schema.model_fields.items():
+        if name in column_attrs:
+            columns.append(getattr(model, name))
+        elif field.is_required():
+            raise TypeError(
+                f"{schema.__name__}.{name} 不是 {model.__name__} 的列，不能只查列，请用ORM查询"
+            )
+    return tuple(columns)
+
+
+@cache
+def _adapter(schema: type[S]) -> TypeAdapter[list[S]]:
+    return TypeAdapter(list[schema])
+
+
+def build(schema: type[S], rows: Iterable[Row], validate: bool = True) -> list[S]:
+    """
+    把查询结果的行组装成响应模型
+
+    Args:
+        schema (type[S]): 响应模型
+        rows (Iterable[Row]): 查询结果
+        validate (bool, optional): 是否校验。列的类型跟响应模型完全一致时可以关掉，
+            用 `model_construct` 直接构建，省掉校验
+
+    Returns:
+        list[S]: 响应模型对象
+    """
+    mappings: Sequence[Any] = [row._mapping for row in rows]
+    if validate:
+        return _adapter(schema).validate_python(mappings)
+    return [schema.model_construct(**mapping) for mapping in mappings]
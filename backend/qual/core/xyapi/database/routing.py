@@ -0,0 +1,249 @@
+"""
+多数据库和主从读写分离
+
+`bind` 是按模型体系登记的：`DeviceModel.bind(device_engine)` 只影响 `DeviceModel` 的子类，
+其它模型还在 `Model.bind` 绑定的库上。会话按模型（mapper）和语句里的表自动选库，
+一个工作单元里可以同时操作多个库的模型（各库各自提交，不是分布式事务）。
+
+`Model.bind(writer, readers=[...])` 绑定一个主库和若干只读从库以后，同一个库里按语句路由：
+- `SELECT`（不带 `FOR UPDATE`）走从库，每个会话轮询选一个健康的从库，之后一直用它
+- flush、`INSERT` `UPDATE` `DELETE`、原生SQL都走主库
+- 读己之写：会话写过一次以后，这个会话后面的读都走主库（同一个请求里读得到自己刚写的数据）；
+  设置了一致性key（比如当前用户名）的话，写完 `read_your_writes` 秒内同一个key的读也都走主库，
+  下一个请求不会因为从库延迟读到旧数据
+- 从库连不上（`OperationalError` / 断线）会被标记为不可用，`cooldown` 秒后再重新尝试，
+  所有从库都不可用时读也走主库
+
+用例：
+```python
+Model.bind(writer, readers=[reader1, reader2], read_your_writes=5)
+
+class DeviceModel(Model):
+    __abstract__ = True
+    metadata = MetaData()
+
+DeviceModel.bind(device_engine)
+
+# 认证以后把当前用户设成一致性key
+set_consistency_key(user.username)
+```
+"""
+import itertools
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Hashable, Mapping, Sequence
+from pydantic import BaseModel, Field
+from sqlalchemy import Engine, MetaData, Select, event, exc
+from sqlalchemy.engine import ExceptionContext
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.util import find_tables
+from ..cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+_consistency_key_var = ContextVar[Hashable | None]("consistency_key_var", default=None)
+
+
+def set_consistency_key(key: Hashable | None):
+    """
+    设置当前上下文的一致性key
+
+    同一个key写过以后 `read_your_writes` 秒内的读都走主库。
+    在认证依赖项里设置就能覆盖整个请求。
+
+    Args:
+        key (Hashable | None): 一致性key，比如用户名
+    """
+    _consistency_key_var.set(key)
+
+
+class RouterStats(BaseModel):
+    """
+    读写分离统计
+    """
+
+    replica_reads: int = Field(default=0, description="走从库的读")
+    primary_reads: int = Field(default=0, description="走主库的读（读己之写、没有可用从库）")
+    writes: int = Field(default=0, description="走主库的写（flush、DML、原生SQL）")
+    failures: int = Field(default=0, description="从库被标记为不可用的次数")
+    replicas: dict[str, bool] = Field(default_factory=dict, description="从库是否可用")
+
+
+class ReplicaRouter:
+    """
+    主从路由
+    """
+
+    def __init__(
+        self,
+        writer: Engine,
+        readers: Sequence[Engine] = (),
+        read_your_writes: float = 5,
+        cooldown: float = 30,
+    ) -> None:
+        """
+        Args:
+            writer (Engine): 主库
+            readers (Sequence[Engine], optional): 从库
+            read_your_writes (float, optional): 写过以后同一个一致性key多少秒内读主库，0为关闭
+            cooldown (float, optional): 从库出错以后多少秒内不再使用
+        """
+        self.writer = writer
+        self.readers = list(readers)
+        self.cooldown = cooldown
+        self.stats = RouterStats()
+        self._recent_writes = TTLCache[Hashable, bool](
+            100_000 if read_your_writes > 0 else 0, read_your_writes
+        )
+        self._down_until = dict[Engine, float]()
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+        for reader in self.readers:
+            event.listen(reader, "handle_error", self._on_error)
+
+    def _on_error(self, context: ExceptionContext):
+        if context.is_disconnect or isinstance(
+            context.sqlalchemy_exception, exc.OperationalError
+        ):
+            self.mark_down(context.engine)
+
+    def mark_down(self, engine: Engine):
+        """
+        把从库标记为不可用，`cooldown` 秒后再尝试
+        """
+        logger.warning(f"从库不可用，{self.cooldown}秒内不再使用：{engine.url!r}")
+        with self._lock:
+            self._down_until[engine] = time.monotonic() + self.cooldown
+            self.stats.failures += 1
+
+    def is_healthy(self, engine: Engine) -> bool:
+        return self._down_until.get(engine, 0) <= time.monotonic()
+
+    def reader(self) -> Engine:
+        """
+        轮询选一个健康的从库，没有就返回主库
+        """
+        count = len(self.readers)
+        start = next(self._next)
+        for i in range(count):
+            engine = self.readers[(start + i) % count]
+            if self.is_healthy(engine):
+                self.stats.replica_reads += 1
+                return engine
+        self.stats.primary_reads += 1
+        return self.writer
+
+    def note_write(self, key: Hashable | None):
+        self.stats.writes += 1
+        if key is not None:
+            self._recent_writes.put(key, True)
+
+    def wrote_recently(self, key: Hashable | None) -> bool:
+        return key is not None and self._recent_writes.get(key) is not None
+
+    def collect(self) -> dict[str, Any]:
+        """
+        给 `metrics` 用的统计
+        """
+        self.stats.replicas = {
+            repr(engine.url): self.is_healthy(engine) for engine in self.readers
+        }
+        return self.stats.model_dump()
+
+
+# 模型基类或者 `MetaData` -> 路由器
+Routes = Mapping[Any, ReplicaRouter]
+
+
+def bind_keys(cls: type) -> list[Any]:
+    """
+    在 `cls` 上绑定引擎时登记的key：类本身，以及它自己声明的 `metadata`
+
+    没有自己的 `metadata` 的子类跟父类共用表集合，不按 `metadata` 登记，免得把父类的表也带走。
+    """
+    keys: list[Any] = [cls]
+    metadata = cls.__dict__.get("metadata")
+    if isinstance(metadata, MetaData):
+        keys.append(metadata)
+    return keys
+
+
+def find_router(
+    routes: Routes, cls: type | None = None, clause: Any = None
+) -> ReplicaRouter | None:
+    """
+    找模型或语句对应的路由器
+
+    先按模型的继承链找最近的绑定过的基类，再按语句里的表的 `metadata` 找，
+    都没有就用最先绑定的（一般是 `Model`）。
+
+    Args:
+        routes (Routes): 路由表
+        cls (type | None, optional): 模型类
+        clause (Any, optional): 语句
+
+    Returns:
+        ReplicaRouter | None: 一个引擎都没绑定返回None
+    """
+    if cls is not None:
+        for base in cls.__mro__:
+            if base in routes:
+                return routes[base]
+    if clause is not None:
+        for table in find_tables(clause, include_crud=True):
+            metadata = getattr(table, "metadata", None)
+            if metadata in routes:
+                return routes[metadata]
+    return next(iter(routes.values()), None)
+
+
+class RoutingSession(Session):
+    """
+    按模型和语句路由的会话
+
+    - 不同模型体系（绑定在不同的抽象基类上）的模型各自走自己的数据库
+    - 同一个数据库里读走从库、写走主库，见 `ReplicaRouter`
+
+    异步会话用 `AsyncSession(sync_session_class=RoutingSession, routes=...)`，
+    路由器里放的是异步引擎的 `sync_engine`。
+    """
+
+    def __init__(self, routes: Routes, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.routes = routes
+        self._wrote = set[ReplicaRouter]()
+        self._readers = dict[ReplicaRouter, Engine]()
+
+    def get_bind(self, mapper=None, clause=None, **kwargs: Any) -> Engine:
+        cls = mapper.class_ if mapper is not None else None
+        router = find_router(self.routes, cls, clause)
+        if router is None:
+            raise exc.UnboundExecutionError("没有绑定引擎")
+        key = _consistency_key_var.get()
+
+        is_read = (
+            isinstance(clause, Select)
+            and clause._for_update_arg is None
+            and not self._flushing
+        )
+        if not is_read:
+            self._wrote.add(router)
+            router.note_write(key)
+            return router.writer
+
+        if not router.readers:
+            return router.writer
+        if router in self._wrote or router.wrote_recently(key):
+            router.stats.primary_reads += 1
+            return router.writer
+
+        # 一个会话尽量只用一个从库，不要每条语句都换连接
+        reader = self._readers.get(router)
+        if reader is not None and router.is_healthy(reader):
+            router.stats.replica_reads += 1
+            return reader
+        reader = self._readers[router] = router.reader()
+        return reader
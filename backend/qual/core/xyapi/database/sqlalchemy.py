@@ -9,8 +9,8 @@ from contextlib import contextmanager, asynccontextmanager
 
 logger = logging.getLogger(__name__)
 
-_engine_var = ContextVar[Engine]("engine")
-_async_engine_var = ContextVar[AsyncEngine]("async_engine")
+_engine_var = ContextVar[Engine | None]("engine", default=None)
+_async_engine_var = ContextVar[AsyncEngine | None]("async_engine", default=None)
 
 
 def init_engine(engine: Engine | AsyncEngine):
@@ -83,17 +83,14 @@ EngineADP = Annotated[Engine, Depends(_engine_var.get, use_cache=True)]
 SessionADP = Annotated[Session, Depends(_create_session, use_cache=True)]
 
 
-@asynccontextmanager
-def create_async_session():
-    return _create_async_session()
-
-
 async def _create_async_session():
     """
     创建异步会话
 
     这个函数创建的异步会话是个上下文管理器，而且开启了begin自动提交。
 
+    异步会话不能懒加载，所以关掉了 `expire_on_commit`，提交后对象的属性还能访问。
+
     用例：
     ```python
     async with create_async_session() as session:
@@ -114,7 +111,7 @@ async def _create_async_session():
         raise RuntimeError(
             "没有初始化异步引擎，请用 `create_async_engine` 创建一个引擎，然后调用 `init_engine`。"
         )
-    session = AsyncSession(_async_engine_var.get())
+    session = AsyncSession(engine, expire_on_commit=False)
 
     async with session:
         async with session.begin():
@@ -122,7 +119,11 @@ async def _create_async_session():
             yield session
 
 
-AsyncEngineADP = Annotated[Engine, Depends(_async_engine_var.get, use_cache=True)]
+# 依赖项直接用生成器，`async with` 用这个
+create_async_session = asynccontextmanager(_create_async_session)
+
+
+AsyncEngineADP = Annotated[AsyncEngine, Depends(_async_engine_var.get, use_cache=True)]
 AsyncSessionADP = Annotated[
     AsyncSession, Depends(_create_async_session, use_cache=True)
 ]
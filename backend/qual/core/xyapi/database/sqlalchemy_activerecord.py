@@ -1,7 +1,24 @@
+import logging
+import time
 from contextvars import ContextVar
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
-from typing import Any, Self
+from functools import cache
+from itertools import chain, islice
+from typing import (
+    Any,
+    AsyncIterator,
+    ClassVar,
+    Hashable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Self,
+    Sequence,
+    TypeVar,
+)
+from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.orm import (
     Session,
     DeclarativeBase,
@@ -9,7 +26,34 @@ from sqlalchemy.orm import (
     Mapped,
     mapped_column,
 )
-from sqlalchemy import Engine, ScalarResult, select
+from sqlalchemy import (
+    ColumnElement,
+    Engine,
+    ScalarResult,
+    Select,
+    bindparam,
+    event,
+    inspect,
+    insert,
+    select,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from . import counting
+from .entity_cache import EntityCache
+from .json_documents import join_documents, json_document, page_bytes
+from .loading import eager_options
+from .pagination import Page, keyset_stmt, make_page
+from .projection import S, build, schema_columns
+from .routing import ReplicaRouter, Routes, RoutingSession, bind_keys, find_router
+from .statements import cached_statement
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
 
 
 class AutoTableNameMixin:
@@ -35,14 +79,80 @@ class AuditMixin:
     )
 
 
+class BulkResult(BaseModel):
+    """
+    批量操作结果
+    """
+
+    rows: int = Field(default=0, description="处理的行数")
+    chunks: int = Field(default=0, description="分了几批执行")
+    seconds: float = Field(default=0, description="耗时（秒）")
+    rows_per_second: float = Field(default=0, description="吞吐量（行/秒）")
+    primary_keys: list[Any] = Field(
+        default_factory=list, description="插入行的主键（`returning=True` 时才有）"
+    )
+
+
+def _chunked(rows: Iterable[dict[str, Any]], size: int) -> Iterator[list[dict]]:
+    iterator = iter(rows)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+# 支持 `ON CONFLICT` 的方言
+_upsert_inserts = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def _rebind(routes: Mapping[Any, T], cls: type, value: T | None) -> dict[Any, T]:
+    """
+    返回更新过的路由表（ContextVar里的路由表不原地修改）
+    """
+    routes = dict(routes)
+    for key in bind_keys(cls):
+        if value is None:
+            routes.pop(key, None)
+        else:
+            routes[key] = value
+    return routes
+
+
 class ActiveRecordMixin:
-    _engine_var = ContextVar[Engine | None]("engine_var", default=None)
+    """
+    ActiveRecord
+
+    推荐在工作单元（`unit_of_work`，HTTP请求由 `UnitOfWorkMiddleware` 自动开启）里使用：
+    整个工作单元共用一个会话，`save` `update` `delete` 只flush不提交，
+    退出工作单元时统一提交一次，出异常就回滚，最后关闭会话释放连接。
+
+    工作单元外每次调用都用一个临时会话，调用完就提交并关闭，返回的对象是detached的，
+    已加载的属性还能访问，但是不能再懒加载关系。
+
+    用例：
+    ```python
+    with Model.unit_of_work():
+        user = User.get_by_pk(1)
+        user.display_name = "管理员"
+        user.save()  # 只flush
+        Log(content="改名").save()
+    # 这里才提交
+    ```
+    """
+
+    # 按模型基类和metadata登记的引擎，见 `bind`
+    _routes_var = ContextVar[Routes]("routes_var", default={})
     _session_var = ContextVar[Session | None]("session_var", default=None)
 
+    # 二级实体缓存，默认不开启，见 `EntityCache`
+    __entity_cache__: ClassVar[EntityCache | None] = None
+
     @classmethod
     @property
     def engine(cls) -> Engine | None:
-        return cls._engine_var.get()
+        """
+        这个模型所在的数据库的主库
+        """
+        router = find_router(cls._routes_var.get(), cls)
+        return router.writer if router is not None else None
 
     @classmethod
     @property
@@ -50,6 +160,8 @@ class ActiveRecordMixin:
         """
         会尝试从上下文中获取session，如果上下文没有session就创建一个临时的
 
+        NOTE: 临时session需要调用方自己关闭，最好用 `with Model.session as session:`
+
         Returns:
             Session: _description_
         """
@@ -57,68 +169,397 @@ class ActiveRecordMixin:
         if session and session.is_active:
             return session
         else:
-            session = Session(cls.engine)
+            session = cls._new_session()
             return session
 
     @classmethod
-    def start_session(cls, begin=True, *args, **kwargs):
+    def _new_session(cls, **kwargs: Any) -> Session:
+        """
+        新建会话
+
+        只绑定了一个库而且没有从库时就是普通的 `Session`，否则是按模型和语句路由的 `RoutingSession`
+        """
+        routes = cls._routes_var.get()
+        routers = set(routes.values())
+        if len(routers) == 1 and not (router := routers.pop()).readers:
+            return Session(router.writer, **kwargs)
+        return RoutingSession(routes, **kwargs)
+
+    @classmethod
+    @contextmanager
+    def unit_of_work(cls) -> Iterator[Session]:
+        """
+        开启工作单元
+
+        把一个会话绑定到上下文，期间所有ActiveRecord操作都用这个会话，
+        正常退出时提交一次，出异常回滚，最后总是关闭会话释放连接。
+
+        已经在工作单元里的话直接加入外层的，由外层提交。
+
+        Raises:
+            RuntimeError: engine没有绑定
+
+        Yields:
+            Session: 会话
+        """
+        session = cls._session_var.get()
+        if session is not None:
+            yield session
+            return
+
         if cls.engine is None:
             raise RuntimeError("No engine bound")
 
-        cls._session_var.set(cls.session)
-        if begin:
-            with cls.session.begin():
-                return cls.session
-        else:
-            return cls.session
+        session = cls._new_session()
+        token = cls._session_var.set(session)
+        try:
+            yield session
+            if session.in_transaction():
+                session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+            cls._session_var.reset(token)
 
     @classmethod
-    def bind(cls, engine: Engine):
-        cls._engine_var.set(engine)
+    def start_session(cls, begin=True, *args, **kwargs):
+        """
+        同 `unit_of_work`，保留给旧代码用
+        """
+        return cls.unit_of_work()
 
     @classmethod
-    @property
-    def select(cls):
+    @contextmanager
+    def _session_scope(cls) -> Iterator[Session]:
+        """
+        工作单元里返回工作单元的会话；否则开一个临时会话，退出时提交并关闭
+        """
+        session = cls._session_var.get()
+        if session is not None:
+            yield session
+            return
+
+        if cls.engine is None:
+            raise RuntimeError("No engine bound")
+
+        with cls._new_session(expire_on_commit=False) as session:
+            yield session
+            session.commit()
+
+    @classmethod
+    def bind(
+        cls,
+        engine: Engine | None,
+        readers: Sequence[Engine] = (),
+        read_your_writes: float = 5,
+        cooldown: float = 30,
+    ) -> ReplicaRouter | None:
+        """
+        给这个模型体系绑定引擎
+
+        在哪个类上调用就绑定给哪个类和它的子类（还有它自己声明的 `metadata` 里的表），
+        不同的抽象基类可以绑定到不同的数据库，见 `routing`。
+        传了 `readers` 就开启读写分离，见 `ReplicaRouter`。
+
+        用例：
+        ```python
+        Model.bind(engine)
+        DeviceModel.bind(device_engine, readers=[device_reader])
+        ```
+
+        Args:
+            engine (Engine | None): 主库，None为解除绑定
+            readers (Sequence[Engine], optional): 只读从库
+            read_your_writes (float, optional): 同一个一致性key写过以后多少秒内读主库
+            cooldown (float, optional): 从库出错以后多少秒内不再使用
+
+        Returns:
+            ReplicaRouter | None: 路由器，可以注册到 `metrics`
+        """
+        router = None
+        if engine is not None:
+            router = ReplicaRouter(engine, readers, read_your_writes, cooldown)
+        cls._routes_var.set(_rebind(cls._routes_var.get(), cls, router))
+        return router
+
+    @cached_statement
+    def select(cls) -> Select:
+        """
+        `select(cls)`，每个模型只构建一次
+        """
         return select(cls)
 
     @classmethod
-    def scalar(cls, stmt: Any) -> Self | None:
-        return cls.session.scalar(stmt)
+    @cache
+    def select_for(cls, schema: type[BaseModel], strict: bool = False) -> Select:
+        """
+        `select(cls)` 加上响应模型需要的关系预加载，见 `eager_options`
+
+        每个 (模型, 响应模型) 只构建一次。
+
+        用例：
+        ```python
+        stmt = Dictionary.select_for(DictionaryReadDetial).where(Dictionary.enable)
+        ```
+
+        Args:
+            schema (type[BaseModel]): 响应模型
+            strict (bool, optional): 响应模型里没有的关系访问即报错
+
+        Returns:
+            Select: 查询语句
+        """
+        return cls.select.options(*eager_options(cls, schema, strict))
+
+    @classmethod
+    @cache
+    def select_columns(cls, schema: type[BaseModel]) -> Select:
+        """
+        只查响应模型需要的列的 `select`，配合 `read` 使用
+
+        每个 (模型, 响应模型) 只构建一次。
+
+        Args:
+            schema (type[BaseModel]): 平铺的响应模型
+
+        Raises:
+            TypeError: 响应模型有必填字段不是模型的列
+
+        Returns:
+            Select: 查询语句
+        """
+        return select(*schema_columns(cls, schema))
+
+    @classmethod
+    @cache
+    def select_json(cls, schema: type[BaseModel]) -> Select:
+        """
+        每行在数据库里拼成响应模型JSON的 `select`，配合 `read_json` 使用，见 `json_documents`
+
+        Args:
+            schema (type[BaseModel]): 响应模型，可以嵌套关系
+
+        Raises:
+            TypeError: 响应模型有必填字段不是模型的列或者关系
+
+        Returns:
+            Select: 查询语句，只有一列JSON文本
+        """
+        return select(json_document(cls, schema).label("_json"))
 
     @classmethod
-    def scalars(cls, stmt: Any) -> ScalarResult[Self]:
-        return cls.session.scalars(stmt)
+    @cache
+    def _unique_stmt(cls, name: str) -> Select:
+        return cls.select.where(getattr(cls, name) == bindparam(name))
+
+    @classmethod
+    def scalar(cls, stmt: Any, params: dict[str, Any] | None = None) -> Self | None:
+        """
+        `params` 是语句里 `bindparam` 的值，见 `cached_statement`
+        """
+        with cls._session_scope() as session:
+            return session.scalar(stmt, params)
+
+    @classmethod
+    def scalars(
+        cls, stmt: Any, params: dict[str, Any] | None = None
+    ) -> ScalarResult[Self]:
+        """
+        工作单元外返回的结果已经全部取回，会话关掉以后还能用
+        """
+        with cls._session_scope() as session:
+            if session is cls._session_var.get():
+                return session.scalars(stmt, params)
+            return session.execute(stmt, params).freeze()().scalars()
+
+    @classmethod
+    def read(
+        cls,
+        schema: type[S],
+        stmt: Select | None = None,
+        params: dict[str, Any] | None = None,
+        validate: bool = True,
+    ) -> list[S]:
+        """
+        只读查询，跳过ORM对象直接返回响应模型
+
+        用例：
+        ```python
+        stmt = DictionaryKeyValue.select_columns(DictionaryKeyValueRead)
+        values = DictionaryKeyValue.read(DictionaryKeyValueRead, stmt.where(...))
+        ```
+
+        Args:
+            schema (type[S]): 平铺的响应模型，见 `projection`
+            stmt (Select | None, optional): 查询语句，默认 `cls.select_columns(schema)`
+            params (dict[str, Any] | None, optional): `bindparam` 的值
+            validate (bool, optional): 是否校验，见 `projection.build`
+
+        Returns:
+            list[S]: 响应模型对象
+        """
+        stmt = cls.select_columns(schema) if stmt is None else stmt
+        with cls._session_scope() as session:
+            rows = session.execute(stmt, params).all()
+        return build(schema, rows, validate)
+
+    @classmethod
+    def read_json(
+        cls,
+        schema: type[BaseModel],
+        stmt: Select | None = None,
+        params: dict[str, Any] | None = None,
+    ) -> bytes:
+        """
+        在数据库里拼好JSON，返回JSON数组的bytes，用 `RawJSONResponse` 原样发送
+
+        用例：
+        ```python
+        stmt = Dictionary.select_json(DictionaryReadDetial).order_by(Dictionary.id)
+        return RawJSONResponse(Dictionary.read_json(DictionaryReadDetial, stmt))
+        ```
+
+        Args:
+            schema (type[BaseModel]): 响应模型，见 `json_documents`
+            stmt (Select | None, optional): 查询语句，默认 `cls.select_json(schema)`
+            params (dict[str, Any] | None, optional): `bindparam` 的值
+
+        Returns:
+            bytes: JSON数组
+        """
+        stmt = cls.select_json(schema) if stmt is None else stmt
+        with cls._session_scope() as session:
+            return join_documents(session.scalars(stmt, params))
 
     @classmethod
     def query(cls, stmt: Any):
         return cls.session.query(stmt)
 
+    @classmethod
+    def _restore_cached(
+        cls, session: Session, key: Hashable
+    ) -> tuple[Self | None, Select | None]:
+        """
+        从实体缓存还原对象，会话里已经有这个对象就用会话里的
+
+        Returns:
+            tuple[Self | None, Select | None]: 对象，还要查的不缓存的列（没有就是None）
+        """
+        cache = cls.__entity_cache__
+        data = cache.get(key)
+        if data is None:
+            return None, None
+        obj = cache.restore(data)
+        existing = session.identity_map.get(inspect(obj).key)
+        if existing is not None:
+            return existing, None
+        return obj, cache.uncached_stmt(obj)
+
+    @classmethod
+    def _add_cached(cls, session: Session, obj: Self, row: Any) -> Self | None:
+        """
+        把还原出来的对象填上不缓存的列放进会话，行已经被别的进程删了就返回None
+        """
+        if not cls.__entity_cache__.fill(obj, row):
+            return None
+        session.add(obj)
+        return obj
+
+    @classmethod
+    def _from_cache(cls, session: Session, key: Hashable) -> Self | None:
+        """
+        从实体缓存还原对象并放进会话，不缓存的列（见 `EntityCache.uncached`）每次都查数据库
+        """
+        obj, stmt = cls._restore_cached(session, key)
+        if obj is None or obj in session:
+            return obj
+        row = session.execute(stmt).first() if stmt is not None else ()
+        return cls._add_cached(session, obj, row)
+
+    @classmethod
+    async def _afrom_cache(cls, session: AsyncSession, key: Hashable) -> Self | None:
+        """
+        同 `_from_cache`，不缓存的列用异步会话查
+        """
+        obj, stmt = cls._restore_cached(session.sync_session, key)
+        if obj is None or obj in session:
+            return obj
+        row = (await session.execute(stmt)).first() if stmt is not None else ()
+        return cls._add_cached(session.sync_session, obj, row)
+
     @classmethod
     def get_by_pk(cls, primary_key: Any) -> Self | None:
         """
         通过主键获取
 
+        模型声明了 `__entity_cache__` 的话先查缓存。
+
         Args:
             primary_key (Any): 主键
 
         Returns:
             Self | None: _description_
         """
-        return cls.session.get(cls, primary_key)
+        cache = cls.__entity_cache__
+        with cls._session_scope() as session:
+            if cache is None:
+                return session.get(cls, primary_key)
+
+            obj = cls._from_cache(session, cache.pk_key(primary_key))
+            if obj is None:
+                version = cache.version()
+                obj = session.get(cls, primary_key)
+                if obj is not None:
+                    cache.store(obj, session, version)
+            return obj
+
+    @classmethod
+    def get_by_unique(cls, name: str, value: Any) -> Self | None:
+        """
+        通过唯一列获取
+
+        `name` 在 `__entity_cache__` 的 `unique_keys` 里的话先查缓存。
+
+        Args:
+            name (str): 唯一列名
+            value (Any): 值
+
+        Returns:
+            Self | None: 如果没找到就返回None
+        """
+        cache = cls.__entity_cache__
+        cached = cache is not None and name in cache.unique_keys
+        with cls._session_scope() as session:
+            if cached and (obj := cls._from_cache(session, (name, value))):
+                return obj
+
+            version = cache.version() if cached else 0
+            obj = session.scalar(cls._unique_stmt(name), {name: value})
+            if cached and obj is not None:
+                cache.store(obj, session, version)
+            return obj
 
     def delete(self):
         """
         删除会用Session.delete对象。
+
+        工作单元里只flush，由工作单元统一提交。
         """
-        self.session.delete(self)
-        self.session.commit()
+        with self._session_scope() as session:
+            session.delete(self)
+            session.flush()
 
     def save(self):
         """
         保存会用Session.Add添加对象。
+
+        工作单元里只flush（拿到自增主键），由工作单元统一提交。
         """
-        self.session.add(self)
-        self.session.commit()
+        with self._session_scope() as session:
+            session.add(self)
+            session.flush()
 
     def update(self, **kwargs):
         """
@@ -136,13 +577,718 @@ class ActiveRecordMixin:
         Returns:
             bool: 布尔
         """
-        data = cls.scalar(cls.select.where())
-        return data is None
+        return not cls.exists()
+
+    @classmethod
+    def exists(cls, where: ColumnElement[bool] | None = None) -> bool:
+        """
+        有没有满足条件的行，`EXISTS (... LIMIT 1)` 找到一行就停
+
+        用例：
+        ```python
+        User.exists(User.mail == "bob@example.com")
+        ```
+
+        Args:
+            where (ColumnElement[bool] | None, optional): 条件，不传就是表里有没有行
+
+        Returns:
+            bool: 布尔
+        """
+        return bool(cls.scalar(counting.exists_stmt(cls, where)))
+
+    @classmethod
+    def count(cls, where: ColumnElement[bool] | None = None) -> int:
+        """
+        精确计数，大表要扫全表，列表接口的总数用 `estimated_count`
+
+        模型有叫 `count` 的列时这个方法会被列覆盖，改用 `cls.scalar(counting.count_stmt(cls))`。
+
+        Args:
+            where (ColumnElement[bool] | None, optional): 条件
+
+        Returns:
+            int: 行数
+        """
+        return cls.scalar(counting.count_stmt(cls, where))
+
+    @classmethod
+    def estimated_count(cls) -> int | None:
+        """
+        估算的总行数，用数据库的统计信息，代价是常数，见 `counting`
+
+        Returns:
+            int | None: 估算的行数，没有统计信息返回None
+        """
+        with cls._session_scope() as session:
+            return counting.estimated_count(session, cls)
+
+    @classmethod
+    def paginate(
+        cls,
+        stmt: Select | None = None,
+        cursor: str | None = None,
+        limit: int = 20,
+        order_by: Sequence[Any] | None = None,
+        schema: type[BaseModel] | None = None,
+        total: bool = False,
+    ) -> "Page[Self]":
+        """
+        游标分页
+
+        不用 `OFFSET`，而是用上一页最后一行的排序键做条件，翻到多深的页都一样快。
+        排序键上最好有索引。
+
+        用例：
+        ```python
+        page = User.paginate(order_by=[User.create_at.desc()], limit=20)
+        page = User.paginate(cursor=page.next_cursor, order_by=[User.create_at.desc()])
+        # 只读，直接返回响应模型
+        page = User.paginate(limit=20, schema=UserRead)
+        ```
+
+        Args:
+            stmt (Select | None, optional): 查询语句，默认 `cls.select`
+            cursor (str | None, optional): 上一页返回的 `next_cursor`，第一页不传
+            limit (int, optional): 每页条数
+            order_by (Sequence[Any] | None, optional): 排序，会自动补上主键保证顺序唯一，
+                翻页过程中不能变
+            schema (type[BaseModel] | None, optional): 平铺的响应模型，传了就走 `read` 的只读路径，
+                `stmt` 默认 `cls.select_columns(schema)`，返回的是响应模型对象
+            total (bool, optional): 附带 `estimated_count` 估算的整张表的行数，
+                `stmt` 带条件时只能当个大概；没有统计信息时是None
+
+        Raises:
+            BadRequestError: 游标无效
+
+        Returns:
+            Page[Self]: 一页数据和下一页的游标
+        """
+        stmt, keys = cls._keyset_stmt(stmt, cursor, limit, order_by, schema)
+        if schema is None:
+            page = make_page(cls.scalars(stmt).all(), limit, keys)
+        else:
+            with cls._session_scope() as session:
+                rows = session.execute(stmt).all()
+            page = cls._build_page(schema, rows, limit, keys)
+        if total:
+            page.total = cls.estimated_count()
+        return page
+
+    @classmethod
+    def _keyset_stmt(
+        cls,
+        stmt: Select | None,
+        cursor: str | None,
+        limit: int,
+        order_by: Sequence[Any] | None,
+        schema: type[BaseModel] | None,
+    ) -> tuple[Select, list]:
+        if schema is None:
+            return keyset_stmt(
+                cls, cls.select if stmt is None else stmt, cursor, limit, order_by
+            )
+        stmt, keys = keyset_stmt(
+            cls,
+            cls.select_columns(schema) if stmt is None else stmt,
+            cursor,
+            limit,
+            order_by,
+        )
+        # 游标要用排序键的值，响应模型里没有的排序键补查出来
+        selected = {column.key for column in stmt.selected_columns}
+        missing = [column for column, _ in keys if column.key not in selected]
+        return (stmt.add_columns(*missing) if missing else stmt), keys
+
+    @classmethod
+    def paginate_json(
+        cls,
+        schema: type[BaseModel],
+        stmt: Select | None = None,
+        cursor: str | None = None,
+        limit: int = 20,
+        order_by: Sequence[Any] | None = None,
+        total: bool = False,
+    ) -> bytes:
+        """
+        游标分页，在数据库里拼好JSON，返回 `Page` 的JSON的bytes
+
+        参数见 `paginate`，`stmt` 默认 `cls.select_json(schema)`。
+        """
+        stmt, keys = cls._keyset_stmt(
+            cls.select_json(schema) if stmt is None else stmt,
+            cursor,
+            limit,
+            order_by,
+            schema,
+        )
+        with cls._session_scope() as session:
+            rows = session.execute(stmt).all()
+        page = make_page(rows, limit, keys)
+        return page_bytes(
+            (row[0] for row in page.items),
+            page.next_cursor,
+            cls.estimated_count() if total else None,
+        )
+
+    @staticmethod
+    def _build_page(
+        schema: type[BaseModel], rows: Sequence[Any], limit: int, keys: list
+    ) -> Page:
+        page = make_page(rows, limit, keys)
+        return Page(items=build(schema, page.items), next_cursor=page.next_cursor)
+
+    @classmethod
+    def stream(
+        cls, stmt: Select | None = None, chunk_size: int = 1000
+    ) -> Iterator[Self]:
+        """
+        流式读取
+
+        用 `yield_per` 和服务端游标每次只从数据库取 `chunk_size` 行，
+        已经处理完的对象会被回收，不管表多大内存占用都是平的。
+        `selectinload` 会按批加载，集合关系不要用 `joinedload`。
+
+        用例：
+        ```python
+        for user in User.stream(chunk_size=500):
+            ...
+        ```
+
+        Args:
+            stmt (Select | None, optional): 查询语句，默认 `cls.select`
+            chunk_size (int, optional): 每批行数
+
+        Yields:
+            Self: 对象
+        """
+        stmt = (cls.select if stmt is None else stmt).execution_options(
+            yield_per=chunk_size
+        )
+        with cls._session_scope() as session:
+            yield from session.scalars(stmt)
+
+    # region 批量操作
+
+    @classmethod
+    def _bulk_execute(
+        cls,
+        action: str,
+        stmt: Any,
+        rows: Iterable[dict[str, Any]],
+        chunk_size: int,
+        returning: bool,
+    ) -> BulkResult:
+        result = BulkResult()
+        start = time.perf_counter()
+
+        with cls._session_scope() as session:
+            if cls.__entity_cache__ is not None:
+                cls.__entity_cache__.clear_later(session)
+            for chunk in _chunked(rows, chunk_size):
+                cursor = session.execute(stmt, chunk)
+                if returning:
+                    result.primary_keys.extend(
+                        row[0] if len(row) == 1 else tuple(row) for row in cursor
+                    )
+                result.rows += len(chunk)
+                result.chunks += 1
+
+        result.seconds = time.perf_counter() - start
+        if result.seconds > 0:
+            result.rows_per_second = result.rows / result.seconds
+        logger.info(
+            f"{cls.__name__} 批量{action} {result.rows} 行，"
+            f"{result.chunks} 批，{result.rows_per_second:.0f} 行/秒"
+        )
+        return result
+
+    @classmethod
+    def bulk_insert(
+        cls,
+        rows: Iterable[dict[str, Any]],
+        chunk_size: int = 1000,
+        returning: bool = False,
+    ) -> BulkResult:
+        """
+        批量插入
+
+        不创建ORM对象，每批一条语句：SQLAlchemy会按方言选择 executemany，或者多行VALUES
+        （要RETURNING的时候，SQLite 3.35+、PostgreSQL都支持）。列的Python端默认值照常生效。
+
+        工作单元里不提交，由工作单元统一提交；工作单元外所有批次一起提交一次。
+
+        用例：
+        ```python
+        result = User.bulk_insert(
+            [{"username": f"user{i}", "display_name": f"用户{i}"} for i in range(10000)],
+            returning=True,
+        )
+        result.rows_per_second
+        result.primary_keys  # [1, 2, 3, ...]
+        ```
+
+        Args:
+            rows (Iterable[dict[str, Any]]): 行数据，可以是生成器
+            chunk_size (int, optional): 每批行数. Defaults to 1000.
+            returning (bool, optional): 是否返回插入行的主键. Defaults to False.
+
+        Returns:
+            BulkResult: 批量操作结果
+        """
+        stmt = insert(cls)
+        if returning:
+            stmt = stmt.returning(*inspect(cls).primary_key)
+        return cls._bulk_execute("插入", stmt, rows, chunk_size, returning)
+
+    @classmethod
+    def bulk_upsert(
+        cls,
+        rows: Iterable[dict[str, Any]],
+        conflict_on: Sequence[str],
+        update_columns: Sequence[str] | None = None,
+        chunk_size: int = 1000,
+        returning: bool = False,
+    ) -> BulkResult:
+        """
+        批量插入或更新（`INSERT ... ON CONFLICT DO UPDATE`），支持SQLite和PostgreSQL
+
+        用例：
+        ```python
+        User.bulk_upsert(
+            [{"username": "admin", "display_name": "管理员"}],
+            conflict_on=["username"],
+        )
+        ```
+
+        Args:
+            rows (Iterable[dict[str, Any]]): 行数据，每行的列要一致
+            conflict_on (Sequence[str]): 冲突判断的列（需要有唯一约束或唯一索引）
+            update_columns (Sequence[str] | None, optional): 冲突时更新的列，默认是行数据里除了
+                `conflict_on` 和主键以外的列，再加上有 `onupdate` 的列（比如 `updated_at`）. Defaults to None.
+            chunk_size (int, optional): 每批行数. Defaults to 1000.
+            returning (bool, optional): 是否返回行的主键. Defaults to False.
+
+        Raises:
+            NotImplementedError: 数据库不支持
+
+        Returns:
+            BulkResult: 批量操作结果
+        """
+        dialect = cls.engine.dialect.name
+        if dialect not in _upsert_inserts:
+            raise NotImplementedError(f"{dialect} 不支持 bulk_upsert")
+
+        iterator = iter(rows)
+        first = next(iterator, None)
+        if first is None:
+            return BulkResult()
+
+        mapper = inspect(cls)
+        if update_columns is None:
+            skip = {*conflict_on, *(column.key for column in mapper.primary_key)}
+            update_columns = [key for key in first if key not in skip]
+            update_columns += [
+                attr.key
+                for attr in mapper.column_attrs
+                if attr.columns[0].onupdate is not None and attr.key not in first
+            ]
+
+        stmt = _upsert_inserts[dialect](cls)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[mapper.columns[key] for key in conflict_on],
+            set_={
+                key: stmt.excluded[mapper.columns[key].name] for key in update_columns
+            },
+        )
+        if returning:
+            stmt = stmt.returning(*mapper.primary_key)
+
+        rows = chain([first], iterator)
+        return cls._bulk_execute("插入或更新", stmt, rows, chunk_size, returning)
+
+    @classmethod
+    def bulk_update(
+        cls,
+        rows: Iterable[dict[str, Any]],
+        chunk_size: int = 1000,
+    ) -> BulkResult:
+        """
+        按主键批量更新，每行都必须带主键，`onupdate` 的列会自动更新
+
+        用例：
+        ```python
+        User.bulk_update([{"id": 1, "display_name": "管理员"}, {"id": 2, "mail": None}])
+        ```
+
+        Args:
+            rows (Iterable[dict[str, Any]]): 行数据
+            chunk_size (int, optional): 每批行数. Defaults to 1000.
+
+        Returns:
+            BulkResult: 批量操作结果
+        """
+        return cls._bulk_execute("更新", update(cls), rows, chunk_size, False)
+
+    # endregion
+
+
+class AsyncActiveRecordMixin:
+    """
+    异步版的ActiveRecord，方法跟 `ActiveRecordMixin` 一一对应，加了 `a` 前缀（`ascalar` `asave`...），
+    两套可以在同一个模型上共存。
+
+    跟同步版一样，在工作单元（`async_unit_of_work`，HTTP请求由 `UnitOfWorkMiddleware` 自动开启）里
+    `asave` `adelete` 只flush，退出时统一提交一次；工作单元外每次调用都开一个临时会话，提交后关闭。
+    会话关掉了 `expire_on_commit`，返回的对象提交后属性还能访问，
+    但是异步会话不能懒加载，需要的关系请在语句里用 `selectinload` 预加载。
+
+    用例：
+    ```python
+    user = await User.ascalar(User.select.where(User.username == "admin"))
+    user.display_name = "管理员"
+    await user.asave()
+
+    # 多个操作放到同一个会话（事务）里
+    async with Model.async_unit_of_work():
+        user = await User.aget_by_pk(1)
+        await user.adelete()
+    ```
+    """
+
+    # 同 `ActiveRecordMixin._routes_var`，路由器里放的是异步引擎的 `sync_engine`
+    _async_routes_var = ContextVar[Routes]("async_routes_var", default={})
+    _async_engines_var = ContextVar[Mapping[Any, AsyncEngine]](
+        "async_engines_var", default={}
+    )
+    _async_session_var = ContextVar[AsyncSession | None](
+        "async_session_var", default=None
+    )
+
+    @classmethod
+    @property
+    def async_engine(cls) -> AsyncEngine | None:
+        """
+        这个模型所在的数据库的异步主库
+        """
+        engines = cls._async_engines_var.get()
+        for base in cls.__mro__:
+            if base in engines:
+                return engines[base]
+        return next(iter(engines.values()), None)
+
+    @classmethod
+    def bind_async(
+        cls,
+        engine: AsyncEngine | None,
+        readers: Sequence[AsyncEngine] = (),
+        read_your_writes: float = 5,
+        cooldown: float = 30,
+    ) -> ReplicaRouter | None:
+        """
+        给这个模型体系绑定异步引擎，参数见 `ActiveRecordMixin.bind`
+        """
+        router = None
+        if engine is not None:
+            router = ReplicaRouter(
+                engine.sync_engine,
+                [reader.sync_engine for reader in readers],
+                read_your_writes,
+                cooldown,
+            )
+        cls._async_routes_var.set(_rebind(cls._async_routes_var.get(), cls, router))
+        cls._async_engines_var.set(_rebind(cls._async_engines_var.get(), cls, engine))
+        return router
+
+    @classmethod
+    def _new_async_session(cls) -> AsyncSession:
+        routes = cls._async_routes_var.get()
+        if not routes:
+            raise RuntimeError("No async engine bound")
+        routers = set(routes.values())
+        if len(routers) == 1 and not routers.pop().readers:
+            return AsyncSession(cls.async_engine, expire_on_commit=False)
+        return AsyncSession(
+            sync_session_class=RoutingSession, routes=routes, expire_on_commit=False
+        )
+
+    @classmethod
+    @asynccontextmanager
+    async def async_unit_of_work(cls) -> AsyncIterator[AsyncSession]:
+        """
+        开启异步工作单元，见 `ActiveRecordMixin.unit_of_work`
+
+        Yields:
+            AsyncSession: 异步会话
+        """
+        session = cls._async_session_var.get()
+        if session is not None:
+            yield session
+            return
+
+        session = cls._new_async_session()
+        token = cls._async_session_var.set(session)
+        try:
+            yield session
+            if session.in_transaction():
+                await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+            cls._async_session_var.reset(token)
+
+    @classmethod
+    @asynccontextmanager
+    async def _async_session(cls) -> AsyncIterator[AsyncSession]:
+        """
+        工作单元里返回工作单元的会话；否则开一个临时会话，退出时提交并关闭
+        """
+        session = cls._async_session_var.get()
+        if session is not None:
+            yield session
+        else:
+            async with cls._new_async_session() as session:
+                yield session
+                await session.commit()
+
+    @classmethod
+    async def ascalar(
+        cls, stmt: Any, params: dict[str, Any] | None = None
+    ) -> Self | None:
+        async with cls._async_session() as session:
+            return await session.scalar(stmt, params)
+
+    @classmethod
+    async def ascalars(
+        cls, stmt: Any, params: dict[str, Any] | None = None
+    ) -> ScalarResult[Self]:
+        """
+        返回的结果已经全部取回，会话关掉以后还能用
+        """
+        async with cls._async_session() as session:
+            return await session.scalars(stmt, params)
+
+    @classmethod
+    async def aread(
+        cls,
+        schema: type[S],
+        stmt: Select | None = None,
+        params: dict[str, Any] | None = None,
+        validate: bool = True,
+    ) -> list[S]:
+        """
+        只读查询，跳过ORM对象直接返回响应模型，见 `read`
+        """
+        stmt = cls.select_columns(schema) if stmt is None else stmt
+        async with cls._async_session() as session:
+            rows = (await session.execute(stmt, params)).all()
+        return build(schema, rows, validate)
+
+    @classmethod
+    async def aexists(cls, where: ColumnElement[bool] | None = None) -> bool:
+        """
+        有没有满足条件的行，见 `exists`
+        """
+        return bool(await cls.ascalar(counting.exists_stmt(cls, where)))
+
+    @classmethod
+    async def acount(cls, where: ColumnElement[bool] | None = None) -> int:
+        """
+        精确计数，见 `count`
+        """
+        return await cls.ascalar(counting.count_stmt(cls, where))
+
+    @classmethod
+    async def aestimated_count(cls) -> int | None:
+        """
+        估算的总行数，见 `estimated_count`
+        """
+        async with cls._async_session() as session:
+            return await session.run_sync(counting.estimated_count, cls)
+
+    @classmethod
+    async def aread_json(
+        cls,
+        schema: type[BaseModel],
+        stmt: Select | None = None,
+        params: dict[str, Any] | None = None,
+    ) -> bytes:
+        """
+        在数据库里拼好JSON，返回JSON数组的bytes，见 `read_json`
+        """
+        stmt = cls.select_json(schema) if stmt is None else stmt
+        async with cls._async_session() as session:
+            return join_documents(await session.scalars(stmt, params))
+
+    @classmethod
+    async def aget_by_pk(cls, primary_key: Any) -> Self | None:
+        """
+        通过主键获取，见 `get_by_pk`
+
+        Args:
+            primary_key (Any): 主键
+
+        Returns:
+            Self | None: _description_
+        """
+        cache = cls.__entity_cache__
+        async with cls._async_session() as session:
+            if cache is None:
+                return await session.get(cls, primary_key)
+
+            obj = await cls._afrom_cache(session, cache.pk_key(primary_key))
+            if obj is None:
+                version = cache.version()
+                obj = await session.get(cls, primary_key)
+                if obj is not None:
+                    cache.store(obj, session.sync_session, version)
+            return obj
+
+    @classmethod
+    async def aget_by_unique(cls, name: str, value: Any) -> Self | None:
+        """
+        通过唯一列获取，见 `get_by_unique`
+
+        Args:
+            name (str): 唯一列名
+            value (Any): 值
+
+        Returns:
+            Self | None: 如果没找到就返回None
+        """
+        cache = cls.__entity_cache__
+        cached = cache is not None and name in cache.unique_keys
+        async with cls._async_session() as session:
+            if cached and (obj := await cls._afrom_cache(session, (name, value))):
+                return obj
+
+            version = cache.version() if cached else 0
+            obj = await session.scalar(cls._unique_stmt(name), {name: value})
+            if cached and obj is not None:
+                cache.store(obj, session.sync_session, version)
+            return obj
+
+    async def adelete(self):
+        """
+        删除会用AsyncSession.delete对象。
+
+        工作单元里只flush，由工作单元统一提交。
+        """
+        async with self._async_session() as session:
+            await session.delete(self)
+            await session.flush()
+
+    async def asave(self):
+        """
+        保存会用AsyncSession.add添加对象。
+
+        工作单元里只flush（拿到自增主键），由工作单元统一提交。
+        """
+        async with self._async_session() as session:
+            session.add(self)
+            await session.flush()
+
+    async def aupdate(self, **kwargs):
+        """
+        按关键字参数更新字段
+        """
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+        await self.asave()
+
+    @classmethod
+    async def astream(
+        cls, stmt: Select | None = None, chunk_size: int = 1000
+    ) -> AsyncIterator[Self]:
+        """
+        流式读取，见 `stream`
+
+        响应体是在 `UnitOfWorkMiddleware` 提交以后才发送的，提交会关掉请求会话上的服务端游标，
+        所以这里总是单独开一个只读会话，读完就关。
+
+        用例：
+        ```python
+        @api.get("/export")
+        async def export_users():
+            return StreamingJSONResponse(User.astream(), UserRead)
+        ```
+
+        Args:
+            stmt (Select | None, optional): 查询语句，默认 `cls.select`
+            chunk_size (int, optional): 每批行数
+
+        Yields:
+            Self: 对象
+        """
+        stmt = (cls.select if stmt is None else stmt).execution_options(
+            yield_per=chunk_size
+        )
+        async with cls._new_async_session() as session:
+            result = await session.stream_scalars(stmt)
+            async for row in result:
+                yield row
+
+    @classmethod
+    async def apaginate(
+        cls,
+        stmt: Select | None = None,
+        cursor: str | None = None,
+        limit: int = 20,
+        order_by: Sequence[Any] | None = None,
+        schema: type[BaseModel] | None = None,
+        total: bool = False,
+    ) -> "Page[Self]":
+        """
+        游标分页，参数见 `paginate`
+        """
+        stmt, keys = cls._keyset_stmt(stmt, cursor, limit, order_by, schema)
+        if schema is None:
+            result = await cls.ascalars(stmt)
+            page = make_page(result.all(), limit, keys)
+        else:
+            async with cls._async_session() as session:
+                rows = (await session.execute(stmt)).all()
+            page = cls._build_page(schema, rows, limit, keys)
+        if total:
+            page.total = await cls.aestimated_count()
+        return page
+
+    @classmethod
+    async def apaginate_json(
+        cls,
+        schema: type[BaseModel],
+        stmt: Select | None = None,
+        cursor: str | None = None,
+        limit: int = 20,
+        order_by: Sequence[Any] | None = None,
+        total: bool = False,
+    ) -> bytes:
+        """
+        游标分页，在数据库里拼好JSON，见 `paginate_json`
+        """
+        stmt, keys = cls._keyset_stmt(
+            cls.select_json(schema) if stmt is None else stmt,
+            cursor,
+            limit,
+            order_by,
+            schema,
+        )
+        async with cls._async_session() as session:
+            rows = (await session.execute(stmt)).all()
+        page = make_page(rows, limit, keys)
+        return page_bytes(
+            (row[0] for row in page.items),
+            page.next_cursor,
+            await cls.aestimated_count() if total else None,
+        )
 
 
 class Model(
     DeclarativeBase,
     ActiveRecordMixin,
+    AsyncActiveRecordMixin,
     AuditMixin,
     AutoTableNameMixin,
 ):
@@ -162,6 +1308,8 @@ class Model(
         __abstract__ = True
         metadata = MetaData() # 这里创建DB1_Model自己的metadata对象，这样才不会跟基类Model的metadata混淆
 
+    # 再给它单独绑定引擎，DB1_Model的子类就都走这个库，会话按模型自动选库
+    DB1_Model.bind(db1_engine)
     ```
 
     Args:
@@ -170,3 +1318,136 @@ class Model(
     """
 
     ...
+
+
+@event.listens_for(Model, "after_update", propagate=True)
+@event.listens_for(Model, "after_delete", propagate=True)
+def _invalidate_entity_cache(mapper, connection, target: Model):
+    cache = type(target).__entity_cache__
+    if cache is not None:
+        cache.invalidate(target, inspect(target).session)
+
+
+# 会话在这个事务里flush过写操作
+_HAS_WRITES_KEY = "unit_of_work_has_writes"
+
+
+def _mark_writes(session: Session, flush_context):
+    session.info[_HAS_WRITES_KEY] = True
+
+
+def _has_writes(session: Session | AsyncSession) -> bool:
+    return bool(
+        session.info.get(_HAS_WRITES_KEY)
+        or session.new
+        or session.dirty
+        or session.deleted
+    )
+
+
+class UnitOfWorkMiddleware:
+    """
+    请求级工作单元中间件
+
+    每个HTTP请求绑定一个同步会话和一个异步会话（`_session_var` `_async_session_var`），
+    请求里所有ActiveRecord操作共用它们，`save` `delete` 只flush。
+
+    在发送响应头之前统一提交一次（状态码小于400才提交，否则回滚），客户端拿到响应时数据已经落库；
+    提交失败返回500。响应发出以后执行的后台任务（`BackgroundTasks`）的写入在请求结束时再提交一次，
+    后台任务抛异常就回滚。请求结束时总是关闭会话释放连接。
+
+    同步会话和异步会话是两个事务，不能原子提交，所以一个请求只能用其中一种会话写数据：
+    两种会话都有写入时两个都回滚，返回500。
+
+    会话是懒连接的，请求没有访问数据库就不会占用连接。
+
+    用例：
+    ```python
+    app.add_middleware(UnitOfWorkMiddleware)
+    ```
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        session = (
+            ActiveRecordMixin._new_session()
+            if ActiveRecordMixin.engine is not None
+            else None
+        )
+        async_session = (
+            AsyncActiveRecordMixin._new_async_session()
+            if AsyncActiveRecordMixin.async_engine is not None
+            else None
+        )
+        sessions = [s for s in (session, async_session) if s is not None]
+        for s in sessions:
+            event.listen(
+                s.sync_session if isinstance(s, AsyncSession) else s,
+                "after_flush",
+                _mark_writes,
+            )
+        token = ActiveRecordMixin._session_var.set(session)
+        async_token = AsyncActiveRecordMixin._async_session_var.set(async_session)
+
+        committed = False
+        failed = False
+
+        async def finish(commit: bool):
+            mixed = commit and len(sessions) == 2 and all(map(_has_writes, sessions))
+            if mixed:
+                commit = False
+
+            if session is not None and session.in_transaction():
+                await run_in_threadpool(session.commit if commit else session.rollback)
+            if async_session is not None and async_session.in_transaction():
+                await (async_session.commit() if commit else async_session.rollback())
+            for s in sessions:
+                s.info.pop(_HAS_WRITES_KEY, None)
+
+            if mixed:
+                raise RuntimeError("一个请求里同步会话和异步会话都写了数据，不能原子提交，已回滚")
+
+        async def send_wrapper(message: Message):
+            nonlocal committed, failed
+            if failed:
+                # 提交失败已经返回500了，丢掉原来的响应
+                return
+
+            if message["type"] == "http.response.start":
+                try:
+                    commit = message["status"] < 400
+                    await finish(commit)
+                    committed = commit
+                except Exception:
+                    logger.exception("工作单元提交失败")
+                    failed = True
+                    response = PlainTextResponse("Internal Server Error", 500)
+                    await response(scope, receive, send)
+                    return
+            await send(message)
+
+        raised = False
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            raised = True
+            raise
+        finally:
+            try:
+                # 响应发出以后（后台任务）的写入再提交一次；没发送响应、提交过回滚或者异常的话回滚
+                await finish(committed and not raised)
+            except Exception:
+                logger.exception("工作单元提交后台任务的写入失败")
+            finally:
+                if session is not None:
+                    await run_in_threadpool(session.close)
+                if async_session is not None:
+                    await async_session.close()
+                ActiveRecordMixin._session_var.reset(token)
+                AsyncActiveRecordMixin._async_session_var.reset(async_token)
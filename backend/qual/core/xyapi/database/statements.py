@@ -0,0 +1,50 @@
+"""
+预构建的命名语句
+
+每次调用都 `select(cls).where(...)` 重新构建语句，SQLAlchemy还要重新生成一遍缓存key才能命中编译缓存。
+热点查询可以把语句声明成 `cached_statement`：每个模型类只构建一次，条件里的值用 `bindparam` 占位，
+执行时只传参数。同一个语句对象的缓存key会被记住，编译结果按方言缓存在引擎上，
+之后每次调用只剩绑定参数和执行。
+
+用例：
+```python
+from sqlalchemy import bindparam
+
+class User(Model):
+    @cached_statement
+    def by_mail(cls):
+        return cls.select.where(cls.mail == bindparam("mail"))
+
+User.scalar(User.by_mail, {"mail": "bob@example.com"})
+```
+"""
+from typing import Any, Callable, Generic, TypeVar
+from weakref import WeakKeyDictionary
+
+S = TypeVar("S")
+
+
+class cached_statement(Generic[S]):
+    """
+    类级别的语句缓存
+
+    跟 `classmethod` + `property` 一样通过类访问，第一次访问时用类构建，之后返回同一个对象。
+    子类各自构建一份，语句里引用的是子类自己的列。
+
+    SQLAlchemy的语句是不可变的，`.where()` `.order_by()` 这些都返回新对象，可以放心在缓存的语句上继续拼接。
+    """
+
+    def __init__(self, builder: Callable[[type], S]) -> None:
+        self.builder = builder
+        self.__doc__ = builder.__doc__
+        self._statements = WeakKeyDictionary[type, S]()
+
+    def __set_name__(self, owner: type, name: str):
+        self.name = name
+
+    def __get__(self, instance: Any, owner: type | None = None) -> S:
+        cls = owner if owner is not None else type(instance)
+        stmt = self._statements.get(cls)
+        if stmt is None:
+            stmt = self._statements[cls] = self.builder(cls)
+        return stmt
@@ -0,0 +1,61 @@
+"""
+测试辅助工具
+
+用例：
+```python
+with assert_num_queries(engine, 2):
+    client.get("/dict")
+```
+"""
+from contextlib import contextmanager
+from typing import Iterator
+from sqlalchemy import Engine, event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+@contextmanager
+def count_queries(*engines: Engine | AsyncEngine) -> Iterator[list[str]]:
+    """
+    记录期间在这些引擎上执行的SQL
+
+    Args:
+        engines (Engine | AsyncEngine): 引擎，异步引擎会监听它的 `sync_engine`
+
+    Yields:
+        list[str]: 执行过的SQL，退出以后也可以继续看
+    """
+    statements = list[str]()
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    targets = [getattr(engine, "sync_engine", engine) for engine in engines]
+    for target in targets:
+        event.listen(target, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for target in targets:
+            event.remove(target, "before_cursor_execute", before_cursor_execute)
+
+
+@contextmanager
+def assert_num_queries(
+    engine: Engine | AsyncEngine, expected: int
+) -> Iterator[list[str]]:
+    """
+    断言期间执行的SQL条数正好是 `expected`，不对的话把执行过的SQL都列出来
+
+    Args:
+        engine (Engine | AsyncEngine): 引擎
+        expected (int): 预期的SQL条数
+
+    Raises:
+        AssertionError: 条数不对
+    """
+    with count_queries(engine) as statements:
+        yield statements
+
+    if len(statements) != expected:
+        listing = "\n".join(f"  {i}. {stmt}" for i, stmt in enumerate(statements, 1))
+        raise AssertionError(f"预期执行{expected}条SQL，实际执行了{len(statements)}条：\n{listing}")
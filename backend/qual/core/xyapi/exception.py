@@ -29,6 +29,13 @@ class HttpExceptionModel(BaseModel):
     detail: str
 
 
+class BadRequestError(HTTPException):
+    def __init__(
+        self, detail: Any = None, headers: Dict[str, str] | None = None
+    ) -> None:
+        super().__init__(status.HTTP_400_BAD_REQUEST, detail, headers)
+
+
 class ExistedError(HTTPException):
     def __init__(
         self,
@@ -58,3 +65,27 @@ class JWTUnauthorizedError(HTTPException):
             "Bearer" if not scopes else f"Bearer scopes={scopes.scope_str}"
         )
         super().__init__(status.HTTP_401_UNAUTHORIZED, detail, headers)
+
+
+class TooManyRequestsError(HTTPException):
+    """
+    请求过多，服务端主动拒绝（限流/削峰）
+
+    会带上 `Retry-After` 头，告诉客户端多少秒后重试。
+    """
+
+    def __init__(self, detail: Any = None, retry_after: int = 1) -> None:
+        headers = {"Retry-After": str(retry_after)}
+        super().__init__(status.HTTP_429_TOO_MANY_REQUESTS, detail, headers)
+
+
+class ServiceUnavailableError(HTTPException):
+    """
+    服务暂时不可用（过载）
+
+    会带上 `Retry-After` 头，告诉客户端多少秒后重试。
+    """
+
+    def __init__(self, detail: Any = None, retry_after: int = 1) -> None:
+        headers = {"Retry-After": str(retry_after)}
+        super().__init__(status.HTTP_503_SERVICE_UNAVAILABLE, detail, headers)
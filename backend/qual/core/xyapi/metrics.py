@@ -0,0 +1,58 @@
+"""
+运行指标搜集
+
+各个模块把自己的统计数据（队列深度、缓存命中率、连接池状态等）注册成一个搜集函数，
+需要导出的时候统一调用 `collect` 拿到所有指标。
+
+用例：
+```python
+from qual.core.xyapi import metrics
+
+metrics.register("token_cache", lambda: cache.stats.model_dump())
+
+metrics.collect()
+>> {"token_cache": {"hits": 10, "misses": 1}}
+```
+"""
+import logging
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+Collector = Callable[[], dict[str, Any]]
+
+_collectors = dict[str, Collector]()
+
+
+def register(name: str, collector: Collector):
+    """
+    注册指标搜集函数
+
+    同名的搜集函数会被覆盖。
+
+    Args:
+        name (str): 指标名
+        collector (Collector): 搜集函数，返回指标字典
+    """
+    logger.debug(f"注册指标：{name}")
+    _collectors[name] = collector
+
+
+def unregister(name: str):
+    """
+    注销指标搜集函数
+
+    Args:
+        name (str): 指标名
+    """
+    _collectors.pop(name, None)
+
+
+def collect() -> dict[str, dict[str, Any]]:
+    """
+    搜集所有已注册的指标
+
+    Returns:
+        dict[str, dict[str, Any]]: {指标名: 指标字典}
+    """
+    return {name: collector() for name, collector in _collectors.items()}
@@ -0,0 +1,119 @@
+"""
+流式JSON响应
+
+大列表先查到内存再整个序列化，内存占用跟行数成正比。`StreamingJSONResponse`
+边读边按批序列化边发送，配合 `Model.stream` / `Model.astream` 内存占用是平的。
+
+两种格式：
+- NDJSON（`application/x-ndjson`）：一行一个对象，客户端可以边收边处理
+- JSON数组（`application/json`）：普通的 `[...]`，分块发送
+
+用例：
+```python
+@api.get("/export")
+async def export_users(format: StreamFormat = "ndjson"):
+    return StreamingJSONResponse(User.astream(), UserRead, format=format)
+```
+"""
+from itertools import islice
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Literal, Mapping
+from pydantic import BaseModel, TypeAdapter
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+
+StreamFormat = Literal["ndjson", "json"]
+
+_media_types: dict[StreamFormat, str] = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+async def _batches(
+    rows: Iterable[Any] | AsyncIterable[Any], batch_size: int
+) -> AsyncIterator[list[Any]]:
+    """
+    按批取出数据
+
+    同步迭代器（比如 `Model.stream`）会查数据库，每一批放到线程池里取，不阻塞事件循环。
+    """
+    if isinstance(rows, AsyncIterable):
+        batch = []
+        async for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        return
+
+    iterator = iter(rows)
+    while batch := await run_in_threadpool(lambda: list(islice(iterator, batch_size))):
+        yield batch
+
+
+class StreamingJSONResponse(StreamingResponse):
+    """
+    把数据按 `schema` 序列化，流式发送
+
+    每攒够 `batch_size` 个对象序列化一次、发送一次，不会每行都发一个分块。
+    """
+
+    def __init__(
+        self,
+        rows: Iterable[Any] | AsyncIterable[Any],
+        schema: type[BaseModel],
+        format: StreamFormat = "ndjson",
+        batch_size: int = 100,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        background: BackgroundTask | None = None,
+    ) -> None:
+        """
+        Args:
+            rows (Iterable[Any] | AsyncIterable[Any]): 数据，ORM对象或者字典
+            schema (type[BaseModel]): 响应模型，ORM对象需要 `from_attributes=True`
+            format (StreamFormat, optional): `ndjson` 或 `json`
+            batch_size (int, optional): 每批对象数
+            status_code (int, optional): 状态码
+            headers (Mapping[str, str] | None, optional): 响应头
+            background (BackgroundTask | None, optional): 后台任务
+        """
+        self.adapter = TypeAdapter(schema)
+        self.format = format
+        super().__init__(
+            self._encode(_batches(rows, batch_size)),
+            status_code=status_code,
+            headers=headers,
+            media_type=_media_types[format],
+            background=background,
+        )
+
+    def _dump(self, row: Any) -> bytes:
+        return self.adapter.dump_json(
+            self.adapter.validate_python(row, from_attributes=True)
+        )
+
+    async def _encode(self, batches: AsyncIterator[list[Any]]) -> AsyncIterator[bytes]:
+        if self.format == "ndjson":
+            async for batch in batches:
+                yield b"".join(self._dump(row) + b"\n" for row in batch)
+            return
+
+        separator = b"["
+        async for batch in batches:
+            yield separator + b",".join(self._dump(row) for row in batch)
+            separator = b","
+        yield b"]" if separator == b"," else b"[]"
+
+
+class RawJSONResponse(Response):
+    """
+    已经编码好的JSON原样发送，不再解析和序列化
+
+    用来发送数据库里拼好的JSON，见 `Model.read_json`。
+    """
+
+    media_type = "application/json"
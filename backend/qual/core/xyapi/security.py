@@ -5,27 +5,84 @@ AccessToken的创建和解析
 
 """
 
+import asyncio
+import calendar
+import hashlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import secrets
+import statistics
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
 from typing import Annotated, Any, Literal, Self
+import ecdsa
+import rsa
 from fastapi import Depends, Form, Security
 from fastapi.security import (
     HTTPAuthorizationCredentials,
     HTTPBearer,
     SecurityScopes,
 )
-from jose import jwt
-from jose.exceptions import JWTError
+from jose import jwk, jwt
+from jose.exceptions import ExpiredSignatureError, JWTError
+from jose.utils import base64url_decode, base64url_encode
 from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
 from datetime import datetime, timedelta
-from pydantic import BaseModel, Field
-from .exception import JWTUnauthorizedError
+from pydantic import BaseModel, Field, PrivateAttr
+from . import metrics
+from .cache import CacheStats, TTLCache
+from .exception import (
+    JWTUnauthorizedError,
+    ServiceUnavailableError,
+    TooManyRequestsError,
+)
 from .settings import BaseSettings
 
+try:
+    # PyJWT是可选依赖，只有配置了 `JWT_BACKEND=pyjwt` 才需要
+    import jwt as pyjwt
+    from jwt.algorithms import get_default_algorithms
+except ImportError:  # pragma: no cover
+    pyjwt = None
+
+logger = logging.getLogger(__name__)
+
 settings = BaseSettings()
 
 # region 密码
 
-# XXX: 写死了,以后不知道要不要改为.env配置的
-_pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+def _create_pwd_context() -> CryptContext:
+    """
+    按配置创建密码哈希上下文
+
+    `PASSWORD_HASH_SCHEME` 是新哈希用的算法，`PASSWORD_HASH_DEPRECATED_SCHEMES` 里的旧算法
+    只用来校验。rounds跟配置不一致的哈希和旧算法的哈希都会被 `needs_update` 判定为需要更新。
+
+    Returns:
+        CryptContext: 密码哈希上下文
+    """
+    scheme = settings.PASSWORD_HASH_SCHEME
+    options = {}
+    if settings.PASSWORD_HASH_ROUNDS:
+        options[f"{scheme}__rounds"] = settings.PASSWORD_HASH_ROUNDS
+
+    return CryptContext(
+        schemes=[scheme, *settings.PASSWORD_HASH_DEPRECATED_SCHEMES],
+        default=scheme,
+        deprecated="auto",
+        **options,
+    )
+
+
+_pwd_context = _create_pwd_context()
 
 
 def hash_password(plain_password: str) -> str:
@@ -55,6 +112,972 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return _pwd_context.verify(plain_password, hashed_password)
 
 
+def password_needs_update(hashed_password: str) -> bool:
+    """
+    判断哈希密码是不是需要用当前配置重新哈希
+
+    只解析哈希串，不做哈希运算，很便宜，可以直接在事件循环里调用。
+
+    Args:
+        hashed_password (str): 哈希密码
+
+    Returns:
+        bool: 算法已废弃或者rounds跟当前配置不一致返回 True
+    """
+    return _pwd_context.needs_update(hashed_password)
+
+
+def benchmark_password_rounds(
+    target_ms: float,
+    scheme: str | None = None,
+    samples: int = 3,
+) -> tuple[int, list[tuple[int, float]]]:
+    """
+    测试本机的哈希速度，挑选单次哈希耗时不超过 `target_ms` 的最大rounds
+
+    bcrypt这类 `log2` 成本的算法逐个rounds往上测；pbkdf2这类线性成本的算法
+    先按默认rounds测一次，再按比例推算。
+
+    Args:
+        target_ms (float): 目标单次哈希耗时（毫秒）
+        scheme (str | None, optional): 哈希算法. Defaults to `PASSWORD_HASH_SCHEME`.
+        samples (int, optional): 每个rounds测几次取中位数. Defaults to 3.
+
+    Raises:
+        ValueError: 算法不支持rounds
+
+    Returns:
+        tuple[int, list[tuple[int, float]]]: (推荐的rounds, [(rounds, 耗时毫秒), ...])
+    """
+    scheme = scheme or settings.PASSWORD_HASH_SCHEME
+    handler = get_crypt_handler(scheme)
+    if "rounds" not in handler.setting_kwds:
+        raise ValueError(f"哈希算法 {scheme} 不支持rounds")
+
+    def measure(rounds: int) -> float:
+        hasher = handler.using(rounds=rounds)
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            hasher.hash("benchmark")
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
+
+    results: list[tuple[int, float]] = []
+
+    if handler.rounds_cost == "log2":
+        best = handler.min_rounds
+        for rounds in range(handler.min_rounds, handler.max_rounds + 1):
+            elapsed = measure(rounds)
+            results.append((rounds, elapsed))
+            if elapsed > target_ms:
+                break
+            best = rounds
+    else:
+        rounds = handler.default_rounds
+        elapsed = measure(rounds)
+        results.append((rounds, elapsed))
+        best = int(rounds * target_ms / elapsed)
+        best = min(max(best, handler.min_rounds), handler.max_rounds or best)
+        results.append((best, measure(best)))
+
+    return best, results
+
+
+# bcrypt是故意设计成很慢的CPU密集运算，在 `async def` 接口里直接调用会卡住整个事件循环。
+# 所以异步版本把哈希计算丢到进程池里跑（进程池而不是线程池，是因为要绕开GIL真正并行）。
+_pwd_executor: ProcessPoolExecutor | None = None
+
+
+def _pwd_workers() -> int:
+    return settings.PASSWORD_HASH_WORKERS or os.cpu_count() or 1
+
+
+def _get_pwd_executor() -> ProcessPoolExecutor:
+    """
+    获取密码哈希进程池，第一次调用时才创建。
+
+    NOTE: 子进程用 `spawn` 方式启动而不是 `fork`，避免把事件循环、数据库连接池这些
+    父进程的状态复制进子进程。
+
+    Returns:
+        ProcessPoolExecutor: 进程池
+    """
+    global _pwd_executor
+    if _pwd_executor is None:
+        _pwd_executor = ProcessPoolExecutor(
+            max_workers=_pwd_workers(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pwd_executor
+
+
+def shutdown_password_executor():
+    """
+    关闭密码哈希进程池
+
+    在app关闭的时候调用，下次再用到异步哈希的时候会重新创建进程池和准入队列。
+    """
+    global _pwd_executor, _pwd_admission
+    if _pwd_executor is not None:
+        _pwd_executor.shutdown(wait=True, cancel_futures=True)
+        _pwd_executor = None
+    _pwd_admission = None
+
+
+class AdmissionStats(BaseModel):
+    """
+    准入队列统计
+    """
+
+    in_flight: int = Field(description="正在执行数")
+    queue_depth: int = Field(description="排队数")
+    admitted: int = Field(description="累计放行数")
+    rejected: int = Field(description="累计因队列满被拒绝数")
+    timeouts: int = Field(description="累计排队超时数")
+    wait_seconds_total: float = Field(description="累计排队时间（秒）")
+    wait_seconds_max: float = Field(description="最长排队时间（秒）")
+
+
+class AdmissionQueue:
+    """
+    准入队列
+
+    限制同时执行的任务数 `max_in_flight`，超出的请求排队等待。
+
+    1. 排队数达到 `max_queue` 时，新请求直接拒绝（429），不再排队。
+    2. 排队超过 `max_wait` 秒还没轮到，放弃排队（503）。
+
+    两种拒绝都会带上 `Retry-After`，按平均执行耗时估算排队清空需要的秒数。
+
+    用例：
+    ```python
+    queue = AdmissionQueue(max_in_flight=4, max_queue=32, max_wait=3)
+
+    async with queue.admit():
+        await do_something_expensive()
+    ```
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, max_wait: float) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._in_flight = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        # 执行耗时的指数移动平均，用来估算 Retry-After
+        self._service_avg = 0.0
+
+    def retry_after(self) -> int:
+        """
+        估算多少秒后重试
+
+        Returns:
+            int: 秒数，至少1秒
+        """
+        seconds = (self._waiting + 1) * self._service_avg / self.max_in_flight
+        return max(1, math.ceil(seconds))
+
+    @asynccontextmanager
+    async def admit(self):
+        """
+        申请准入
+
+        Raises:
+            TooManyRequestsError: 排队已满
+            ServiceUnavailableError: 排队超时
+        """
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            self._rejected += 1
+            raise TooManyRequestsError("请求过多，请稍后重试", self.retry_after())
+
+        start = time.perf_counter()
+        self._waiting += 1
+        try:
+            async with asyncio.timeout(self.max_wait):
+                await self._semaphore.acquire()
+        except TimeoutError:
+            self._timeouts += 1
+            raise ServiceUnavailableError("服务繁忙，请稍后重试", self.retry_after())
+        finally:
+            self._waiting -= 1
+
+        started = time.perf_counter()
+        wait = started - start
+        self._admitted += 1
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+            elapsed = time.perf_counter() - started
+            if self._service_avg:
+                self._service_avg = self._service_avg * 0.8 + elapsed * 0.2
+            else:
+                self._service_avg = elapsed
+
+    @property
+    def stats(self) -> AdmissionStats:
+        return AdmissionStats(
+            in_flight=self._in_flight,
+            queue_depth=self._waiting,
+            admitted=self._admitted,
+            rejected=self._rejected,
+            timeouts=self._timeouts,
+            wait_seconds_total=self._wait_total,
+            wait_seconds_max=self._wait_max,
+        )
+
+
+_pwd_admission: AdmissionQueue | None = None
+
+
+def _get_pwd_admission() -> AdmissionQueue:
+    """
+    获取密码哈希准入队列，第一次调用时才创建。
+
+    进程池只能防止卡住事件循环，挡不住登录洪峰把所有CPU核吃满。
+    准入队列限制同时在算的哈希数，排不上队的请求快速失败，其它便宜的接口照样能响应。
+
+    Returns:
+        AdmissionQueue: 准入队列
+    """
+    global _pwd_admission
+    if _pwd_admission is None:
+        _pwd_admission = AdmissionQueue(
+            max_in_flight=settings.PASSWORD_HASH_MAX_IN_FLIGHT or _pwd_workers(),
+            max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+            max_wait=settings.PASSWORD_HASH_MAX_WAIT,
+        )
+    return _pwd_admission
+
+
+metrics.register("password_hash", lambda: _get_pwd_admission().stats.model_dump())
+
+
+async def hash_password_async(plain_password: str) -> str:
+    """
+    哈希密码（异步版本，在进程池中计算）
+
+    Args:
+        plain_password (str): 明文密码
+
+    Returns:
+        str: 哈希字符串
+    """
+    loop = asyncio.get_running_loop()
+    async with _get_pwd_admission().admit():
+        return await loop.run_in_executor(
+            _get_pwd_executor(), hash_password, plain_password
+        )
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    校验密码（异步版本，在进程池中计算）
+
+    Args:
+        plain_password (str): 明文密码
+        hashed_password (str): 哈希密码
+
+    Returns:
+        bool: 匹配返回 True，不匹配返回 False
+    """
+    loop = asyncio.get_running_loop()
+    async with _get_pwd_admission().admit():
+        return await loop.run_in_executor(
+            _get_pwd_executor(), verify_password, plain_password, hashed_password
+        )
+
+
+# endregion
+
+
+# region JWT后端
+
+_ecdsa_curves = {
+    "ES256": ecdsa.NIST256p,
+    "ES384": ecdsa.NIST384p,
+    "ES512": ecdsa.NIST521p,
+}
+
+
+def _json_default(value: Any):
+    # 跟 jose 一样，把时间转成UTC时间戳
+    if isinstance(value, datetime):
+        return calendar.timegm(value.utctimetuple())
+    raise TypeError(f"{type(value)} 不能序列化成JSON")
+
+
+def _read_key(value: str) -> str:
+    """
+    读取密钥配置，配置可以是PEM内容也可以是PEM文件路径
+
+    Args:
+        value (str): 配置值
+
+    Returns:
+        str: PEM内容
+    """
+    if value and os.path.isfile(value):
+        with open(value, encoding="utf-8") as f:
+            return f.read()
+    # .env 里写多行不方便，允许用 `\n` 转义换行
+    return value.replace("\\n", "\n")
+
+
+def pack_scopes(claims: dict[str, Any]) -> dict[str, Any]:
+    """
+    把负载里的 `scopes` 字符串列表换成紧凑的 `scp` 位图（见 `ScopeMeta.pack`）
+
+    `refresh` 令牌保留字符串列表：刷新令牌有效期长，跨版本部署时Scope表可能变了，
+    用字符串列表刷新出来的新令牌总能拿到当前的位图。有没注册过的Scope时也保留字符串列表。
+
+    Args:
+        claims (dict[str, Any]): 负载字典，会被原地修改
+
+    Returns:
+        dict[str, Any]: 负载字典
+    """
+    if claims.get("typ") != "refresh" and "scopes" in claims:
+        packed = Scope.pack(claims["scopes"])
+        if packed is not None:
+            del claims["scopes"]
+            claims["scp"] = packed
+    return claims
+
+
+def new_token_id() -> str:
+    """
+    生成令牌id（`jti` `sid` 用）
+    """
+    return secrets.token_urlsafe(16)
+
+
+class JWTBackend(ABC):
+    """
+    JWT编解码后端
+
+    密钥在构造的时候就解析成密钥对象，之后每次签发和验证都直接用，不再重复解析PEM。
+
+    `HS*` 算法 `key` 是共享密文；`RS*` `ES*` `EdDSA` 算法 `key` 是PEM私钥，
+    `public_key` 为空时从私钥推导公钥。
+
+    用例：
+    ```python
+    backend = JoseBackend("HS256", "secret")
+    token = backend.encode({"sub": "admin"})
+    claims = backend.decode(token)
+    ```
+    """
+
+    def __init__(
+        self,
+        algorithm: str,
+        key: str,
+        public_key: str | None = None,
+        kid: str | None = None,
+    ) -> None:
+        self.algorithm = algorithm
+        self.kid = kid
+
+    @property
+    def symmetric(self) -> bool:
+        return self.algorithm.startswith("HS")
+
+    @abstractmethod
+    def encode(self, claims: dict[str, Any]) -> str:
+        """
+        签发token
+
+        Args:
+            claims (dict[str, Any]): 负载，时间字段可以是 `datetime` 或者时间戳
+
+        Returns:
+            str: token串
+        """
+
+    @abstractmethod
+    def jwk(self) -> dict[str, Any]:
+        """
+        导出验签公钥的JWK
+
+        Raises:
+            ValueError: 对称算法的密钥不能公开
+
+        Returns:
+            dict[str, Any]: JWK
+        """
+
+    def jwks(self) -> dict[str, list[dict[str, Any]]]:
+        """
+        导出验签公钥集（JWK Set），对称算法的密文不能公开，返回空集
+
+        Returns:
+            dict[str, list[dict[str, Any]]]: {"keys": [...]}
+        """
+        if self.symmetric:
+            return {"keys": []}
+        return {"keys": [_public_jwk(self.jwk())]}
+
+    @abstractmethod
+    def decode(self, token: str) -> dict[str, Any]:
+        """
+        验签并解析token
+
+        Args:
+            token (str): token串
+
+        Raises:
+            ExpiredSignatureError: token过期
+            JWTError: token不合法
+
+        Returns:
+            dict[str, Any]: 负载
+        """
+
+    def encode_pair(
+        self,
+        sub: str,
+        scopes: list[str],
+        expires_min: int,
+        refresh_expires_min: int,
+        sid: str | None = None,
+        claims: dict[str, Any] | None = None,
+    ) -> tuple[str, str]:
+        """
+        签发 `access` `refresh` 令牌对
+
+        这是登录和刷新令牌用的快速路径，直接拼负载字典签名，不经过 `Payload` 模型的拷贝和导出。
+
+        每个令牌都有自己的 `jti`；同一次登录以及之后刷新出来的令牌共享同一个 `sid`（会话id），
+        吊销 `sid` 就能吊销整个会话。
+
+        Args:
+            sub (str): 主题（用户名）
+            scopes (list[str]): 权限范围
+            expires_min (int): access令牌有效期（分钟）
+            refresh_expires_min (int): refresh令牌有效期（分钟）
+            sid (str | None, optional): 会话id，为空时生成新会话. Defaults to None.
+            claims (dict[str, Any] | None, optional): 两个令牌都要带上的额外负载（比如 `uid` `sv`）. Defaults to None.
+
+        Returns:
+            tuple[str, str]: (access_token, refresh_token)
+        """
+        now = int(time.time())
+        sid = sid or new_token_id()
+        claims = claims or {}
+        access_token = self.encode(
+            pack_scopes(
+                {
+                    "sub": sub,
+                    "scopes": scopes,
+                    "typ": "access",
+                    "exp": now + expires_min * 60,
+                    "jti": new_token_id(),
+                    "sid": sid,
+                    **claims,
+                }
+            )
+        )
+        refresh_token = self.encode(
+            {
+                "sub": sub,
+                "scopes": scopes,
+                "typ": "refresh",
+                "exp": now + refresh_expires_min * 60,
+                "jti": new_token_id(),
+                "sid": sid,
+                **claims,
+            }
+        )
+        return access_token, refresh_token
+
+
+class JoseBackend(JWTBackend):
+    """
+    python-jose 后端
+
+    支持 `HS*` `RS*` `ES*`，不支持 `EdDSA`。
+
+    签发时header是固定的，构造时就编码好，每次只需要编码负载和签名。
+    """
+
+    def __init__(
+        self,
+        algorithm: str,
+        key: str,
+        public_key: str | None = None,
+        kid: str | None = None,
+    ) -> None:
+        super().__init__(algorithm, key, public_key, kid)
+
+        self._signing_key = jwk.construct(key, algorithm)
+        if self.symmetric:
+            self._verify_key = self._signing_key
+        elif public_key:
+            self._verify_key = jwk.construct(public_key, algorithm)
+        else:
+            self._verify_key = self._signing_key.public_key()
+
+        header = {"alg": algorithm, "typ": "JWT"}
+        if kid:
+            header["kid"] = kid
+        self._header_segment = base64url_encode(
+            json.dumps(header, separators=(",", ":")).encode()
+        )
+
+    def jwk(self) -> dict[str, Any]:
+        if self.symmetric:
+            raise ValueError("对称密钥不能公开")
+        return {**self._verify_key.to_dict(), "kid": self.kid, "use": "sig"}
+
+    def encode(self, claims: dict[str, Any]) -> str:
+        claims_segment = base64url_encode(
+            json.dumps(claims, separators=(",", ":"), default=_json_default).encode()
+        )
+        signing_input = self._header_segment + b"." + claims_segment
+        signature = base64url_encode(self._signing_key.sign(signing_input))
+        return (signing_input + b"." + signature).decode()
+
+    def decode(self, token: str) -> dict[str, Any]:
+        return jwt.decode(token, self._verify_key, algorithms=[self.algorithm])
+
+
+class PyJWTBackend(JWTBackend):
+    """
+    PyJWT 后端
+
+    需要安装 `pyjwt[crypto]`，支持 `HS*` `RS*` `ES*` `PS*` `EdDSA`。
+
+    PyJWT的异常会被转换成 jose 的异常，调用方不用关心用的是哪个后端。
+    """
+
+    def __init__(
+        self,
+        algorithm: str,
+        key: str,
+        public_key: str | None = None,
+        kid: str | None = None,
+    ) -> None:
+        if pyjwt is None:
+            raise RuntimeError("使用 pyjwt 后端需要先安装 `pyjwt[crypto]`")
+
+        super().__init__(algorithm, key, public_key, kid)
+
+        algorithms = get_default_algorithms()
+        if algorithm not in algorithms:
+            raise ValueError(f"PyJWT不支持算法 {algorithm}，非对称算法需要安装 `cryptography`")
+        self._alg = alg = algorithms[algorithm]
+
+        self._signing_key = alg.prepare_key(key)
+        if self.symmetric:
+            self._verify_key = self._signing_key
+        elif public_key:
+            self._verify_key = alg.prepare_key(public_key)
+        else:
+            self._verify_key = self._signing_key.public_key()
+
+        self._headers = {"kid": kid} if kid else None
+
+    def encode(self, claims: dict[str, Any]) -> str:
+        return pyjwt.encode(
+            claims,
+            self._signing_key,
+            algorithm=self.algorithm,
+            headers=self._headers,
+            json_encoder=_JSONEncoder,
+        )
+
+    def jwk(self) -> dict[str, Any]:
+        if self.symmetric:
+            raise ValueError("对称密钥不能公开")
+        jwk = json.loads(self._alg.to_jwk(self._verify_key))
+        return {**jwk, "alg": self.algorithm, "kid": self.kid, "use": "sig"}
+
+    def decode(self, token: str) -> dict[str, Any]:
+        try:
+            return pyjwt.decode(token, self._verify_key, algorithms=[self.algorithm])
+        except pyjwt.ExpiredSignatureError as e:
+            raise ExpiredSignatureError(str(e)) from e
+        except pyjwt.PyJWTError as e:
+            raise JWTError(str(e)) from e
+
+
+def _public_jwk(jwk: dict[str, Any]) -> dict[str, Any]:
+    """
+    去掉空字段（没有配置 `kid` 的密钥），JWK里不能有null
+    """
+    return {name: value for name, value in jwk.items() if value is not None}
+
+
+class _JSONEncoder(json.JSONEncoder):
+    def default(self, o: Any) -> Any:
+        return _json_default(o)
+
+
+def generate_signing_key(algorithm: str) -> str:
+    """
+    生成非对称算法的PEM私钥
+
+    `ES*` 用 jose 自带依赖 `ecdsa` 生成；`RS*` `PS*` 优先用 `cryptography`，没装的话退回纯python的
+    `rsa`（很慢，要十几秒）；`EdDSA` 必须安装 `cryptography`。
+
+    Args:
+        algorithm (str): 算法
+
+    Raises:
+        ValueError: 不支持的算法
+
+    Returns:
+        str: PEM私钥
+    """
+    if algorithm in _ecdsa_curves:
+        key = ecdsa.SigningKey.generate(curve=_ecdsa_curves[algorithm])
+        return key.to_pem().decode()
+
+    if algorithm.startswith(("RS", "PS")) or algorithm == "EdDSA":
+        try:
+            from cryptography.hazmat.primitives import serialization
+            from cryptography.hazmat.primitives.asymmetric import ed25519, rsa as _rsa
+        except ImportError:
+            if algorithm == "EdDSA":
+                raise ValueError("生成 EdDSA 密钥需要安装 `cryptography`")
+            _, private_key = rsa.newkeys(2048)
+            return private_key.save_pkcs1().decode()
+
+        if algorithm == "EdDSA":
+            private_key = ed25519.Ed25519PrivateKey.generate()
+        else:
+            private_key = _rsa.generate_private_key(
+                public_exponent=65537, key_size=2048
+            )
+        return private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ).decode()
+
+    raise ValueError(f"不支持生成 {algorithm} 密钥")
+
+
+class KeyRing(JWTBackend):
+    """
+    按 `kid` 索引的签名密钥环
+
+    密钥以 `<kid>.pem` 的形式保存在 `keys_dir` 目录下，`kid` 以创建时间开头，按 `kid` 排序
+    最新的那个密钥负责签发，其它的旧密钥只用来验签。签发的token header里带 `kid`，
+    验签时按 `kid` 找密钥。
+
+    轮换：
+
+    1. `rotate` 生成新密钥，马上发布到JWKS里，但是先不签发。
+    2. 新密钥创建满 `publish_seconds` 秒（不短于JWKS的缓存时长）以后才开始签发，
+       保证缓存了JWKS的下游服务在见到新 `kid` 之前已经拿到了新公钥。
+    3. 旧密钥在被替换后还会保留 `retain_minutes` 分钟（应该不短于refresh令牌有效期），
+       保证用它签发的token在过期之前都还能验证，之后由 `prune` 删除。
+
+    公钥通过 `jwks` 导出，其它服务拿到JWKS就可以在本地验证token，不用回调我们的接口。
+
+    NOTE: 多个worker共用同一个目录，各自 `reload` 就能看到别的worker轮换出来的密钥。
+    几个worker同时到期各自轮换出一个新密钥也没关系，都会被发布到JWKS里。
+    """
+
+    KID_TIME_FORMAT = "%Y%m%d%H%M%S"
+
+    def __init__(
+        self,
+        keys_dir: str | os.PathLike,
+        algorithm: str,
+        backend: str = "jose",
+        rotate_minutes: int = 10080,
+        retain_minutes: int = 43200,
+        publish_seconds: int = 300,
+    ) -> None:
+        if algorithm.startswith("HS"):
+            raise ValueError("密钥环只支持非对称算法")
+
+        self.algorithm = algorithm
+        self.kid = None
+        self.keys_dir = Path(keys_dir)
+        self.backend = backend
+        self.rotate_after = timedelta(minutes=rotate_minutes)
+        self.retain = timedelta(minutes=retain_minutes)
+        self.publish = timedelta(seconds=publish_seconds)
+
+        self._keys: dict[str, JWTBackend] = {}
+        self._active: JWTBackend | None = None
+        self._reloaded_at = 0.0
+
+        self.keys_dir.mkdir(parents=True, exist_ok=True)
+        self.reload()
+        if self._active is None:
+            self.rotate()
+
+    @classmethod
+    def created_at(cls, kid: str) -> datetime:
+        """
+        从 `kid` 解析出密钥创建时间（UTC）
+        """
+        return datetime.strptime(kid.split("-")[0], cls.KID_TIME_FORMAT)
+
+    @property
+    def active_kid(self) -> str | None:
+        return self._active.kid if self._active else None
+
+    @property
+    def kids(self) -> list[str]:
+        return list(self._keys)
+
+    def reload(self):
+        """
+        重新扫描密钥目录
+
+        已经解析过的密钥不会重复解析，目录里删掉的密钥会被移除。
+        """
+        keys: dict[str, JWTBackend] = {}
+        for path in sorted(self.keys_dir.glob("*.pem")):
+            kid = path.stem
+            backend = self._keys.get(kid)
+            if backend is None:
+                backend = jwt_backends[self.backend](
+                    self.algorithm, path.read_text(encoding="utf-8"), kid=kid
+                )
+            keys[kid] = backend
+
+        # 发布满 `publish` 的最新密钥签发，都还没发布满（比如第一次启动）就用最旧的
+        now = datetime.utcnow()
+        published = [kid for kid in keys if now - self.created_at(kid) >= self.publish]
+        active = max(published) if published else min(keys, default=None)
+
+        # 整体替换，验签的线程拿到的永远是完整的字典
+        self._keys = keys
+        self._active = keys[active] if active else None
+        self._reloaded_at = time.monotonic()
+
+    def rotate(self) -> str:
+        """
+        生成新的签名密钥，并清理过了保留期的旧密钥
+
+        新密钥马上发布到JWKS，过了 `publish_seconds` 秒才开始签发。
+
+        私钥先写到权限为 `0o600` 的临时文件里再改名，别的worker `reload` 时
+        不会读到写了一半的文件，私钥也不会有其它用户可读的时候。
+
+        Returns:
+            str: 新密钥的kid
+        """
+        now = datetime.utcnow()
+        kid = f"{now.strftime(self.KID_TIME_FORMAT)}-{secrets.token_hex(4)}"
+        path = self.keys_dir / f"{kid}.pem"
+        # 临时文件不是 `*.pem`，`reload` 扫描不到
+        tmp = self.keys_dir / f".{kid}.pem.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(generate_signing_key(self.algorithm))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        logger.info(f"生成新的JWT签名密钥 {kid}")
+
+        self.reload()
+        self.prune()
+        return kid
+
+    def rotate_if_due(self) -> bool:
+        """
+        重新扫描密钥目录，最新的密钥创建满 `rotate_minutes` 就轮换
+
+        按最新的密钥算而不是当前签名的密钥，还在发布等待中的新密钥不会引起重复轮换。
+
+        Returns:
+            bool: 是否轮换了
+        """
+        self.reload()
+        newest_kid = max(self._keys, default=None)
+        if (
+            newest_kid
+            and datetime.utcnow() - self.created_at(newest_kid) < self.rotate_after
+        ):
+            return False
+        self.rotate()
+        return True
+
+    def prune(self):
+        """
+        删除过了保留期的旧密钥
+
+        旧密钥从被下一个密钥替换（下一个密钥开始签发）的时刻开始算保留期。
+        """
+        now = datetime.utcnow()
+        kids = sorted(self._keys)
+        for kid, next_kid in zip(kids, kids[1:]):
+            if now - self.created_at(next_kid) - self.publish > self.retain:
+                (self.keys_dir / f"{kid}.pem").unlink(missing_ok=True)
+                logger.info(f"删除过期的JWT签名密钥 {kid}")
+        self.reload()
+
+    def encode(self, claims: dict[str, Any]) -> str:
+        if self._active is None:
+            raise RuntimeError("密钥环里没有签名密钥")
+        return self._active.encode(claims)
+
+    def decode(self, token: str) -> dict[str, Any]:
+        kid = jwt.get_unverified_header(token).get("kid")
+        backend = self._keys.get(kid) if kid else None
+
+        if backend is None and kid and time.monotonic() - self._reloaded_at > 1:
+            # 可能是别的worker刚轮换出来的密钥，重新扫描一次目录（最多每秒一次，防止被乱填的kid刷盘）
+            self.reload()
+            backend = self._keys.get(kid)
+
+        if backend is None:
+            raise JWTError(f"未知的密钥 kid={kid}")
+        return backend.decode(token)
+
+    def jwk(self) -> dict[str, Any]:
+        if self._active is None:
+            raise RuntimeError("密钥环里没有签名密钥")
+        return self._active.jwk()
+
+    def jwks(self) -> dict[str, list[dict[str, Any]]]:
+        """
+        导出所有还在用的公钥（JWK Set），包括还没开始签发的新密钥
+
+        Returns:
+            dict[str, list[dict[str, Any]]]: {"keys": [...]}
+        """
+        return {
+            "keys": [
+                _public_jwk(backend.jwk())
+                for backend in self._keys.values()
+                if not backend.symmetric
+            ]
+        }
+
+
+jwt_backends: dict[str, type[JWTBackend]] = {
+    "jose": JoseBackend,
+    "pyjwt": PyJWTBackend,
+}
+
+
+def create_jwt_backend(
+    backend: str | None = None,
+    algorithm: str | None = None,
+    key: str | None = None,
+    public_key: str | None = None,
+    kid: str | None = None,
+) -> JWTBackend:
+    """
+    创建JWT后端
+
+    参数为空的时候读取配置：`JWT_BACKEND` `JWT_ALGORITHM`，对称算法用 `JWT_SECRET`，
+    非对称算法用 `JWT_PRIVATE_KEY` `JWT_PUBLIC_KEY`。
+
+    如果配置了 `JWT_KEYS_DIR`（并且没有传 `key`），返回的是按目录管理密钥的 `KeyRing`。
+
+    Args:
+        backend (str | None, optional): 后端名，`jose` 或 `pyjwt`. Defaults to None.
+        algorithm (str | None, optional): 算法. Defaults to None.
+        key (str | None, optional): 密文或PEM私钥. Defaults to None.
+        public_key (str | None, optional): PEM公钥. Defaults to None.
+        kid (str | None, optional): 密钥id，会写到header里. Defaults to None.
+
+    Returns:
+        JWTBackend: 后端
+    """
+    backend = backend or settings.JWT_BACKEND
+    algorithm = algorithm or settings.JWT_ALGORITHM
+
+    if key is None and settings.JWT_KEYS_DIR:
+        return KeyRing(
+            settings.JWT_KEYS_DIR,
+            algorithm,
+            backend,
+            rotate_minutes=settings.JWT_KEY_ROTATE_MINUTES,
+            retain_minutes=settings.JWT_REFRESH_EXPIRE_MINUTES,
+            publish_seconds=settings.JWT_KEY_PUBLISH_SECONDS,
+        )
+
+    if key is None:
+        if algorithm.startswith("HS"):
+            key = settings.JWT_SECRET
+        else:
+            key = _read_key(settings.JWT_PRIVATE_KEY)
+            public_key = _read_key(settings.JWT_PUBLIC_KEY) or None
+
+    return jwt_backends[backend](algorithm, key, public_key, kid)
+
+
+jwt_backend: JWTBackend = create_jwt_backend()
+
+
+def set_jwt_backend(backend: JWTBackend):
+    """
+    替换当前使用的JWT后端
+
+    会清空已验证令牌缓存。
+
+    Args:
+        backend (JWTBackend): 后端
+    """
+    global jwt_backend
+    jwt_backend = backend
+    token_cache.clear()
+
+
+_key_rotation_task: asyncio.Task | None = None
+
+
+async def _rotate_keys_periodically(keyring: KeyRing, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # 生成RSA密钥可能很慢，放到线程里做
+            await asyncio.to_thread(keyring.rotate_if_due)
+        except Exception:
+            logger.exception("JWT签名密钥轮换失败")
+
+
+async def start_key_rotation():
+    """
+    启动定时轮换签名密钥的后台任务
+
+    只有当前后端是 `KeyRing` 时才启动，每隔 `JWT_KEY_CHECK_SECONDS` 秒扫描一次密钥目录。
+    """
+    global _key_rotation_task
+    if isinstance(jwt_backend, KeyRing) and _key_rotation_task is None:
+        _key_rotation_task = asyncio.create_task(
+            _rotate_keys_periodically(jwt_backend, settings.JWT_KEY_CHECK_SECONDS)
+        )
+
+
+async def stop_key_rotation():
+    """
+    停止定时轮换签名密钥的后台任务
+    """
+    global _key_rotation_task
+    if _key_rotation_task is not None:
+        _key_rotation_task.cancel()
+        _key_rotation_task = None
+
+
 # endregion
 
 
@@ -72,26 +1095,63 @@ class Payload(BaseModel):
     aud: list[str] = Field(default_factory=list, description="受众")
     nbf: datetime = Field(default_factory=datetime.utcnow, description="签发时间，时间戳")
     jti: str = Field(default="", description="编号")
+    sid: str = Field(default="", description="会话id，同一次登录刷新出来的令牌共享")
+    uid: int | None = Field(default=None, description="用户id")
+    sv: int = Field(default=0, description="用户安全版本号，改密码等操作后旧令牌失效")
     typ: Literal["access", "refresh"] = Field(default="access", description="类型")
     scopes: list[str] = Field(default_factory=list, description="权限范围")
 
+    _scope_mask: int | None = PrivateAttr(default=None)
+
+    @property
+    def scope_mask(self) -> int:
+        """
+        权限范围位图，见 `ScopeMeta`
+        """
+        if self._scope_mask is None:
+            self._scope_mask = Scope.mask_of(*self.scopes)
+        return self._scope_mask
+
     @classmethod
-    def from_jwt(cls, token: str) -> Self:
+    def from_jwt(cls, token: str, use_cache: bool = True) -> Self:
         """
         从token字符串中解析出负载
 
         解析的过程中也会检查过期，如果过期会抛出 ExpiredSignatureError
 
+        令牌里的权限范围可以是 `scp` 位图（见 `ScopeMeta.pack`），也可以是旧的 `scopes` 字符串列表。
+
+        验证通过的负载会放进 `token_cache`，同一个token再来的时候直接返回缓存的负载，
+        不再验签和校验模型。
+
+        NOTE: 缓存命中时返回的是同一个对象，不要修改它。
+
         Args:
             token (str): Bearer <token str> 的 <token str> 部分
+            use_cache (bool, optional): 是否使用已验证令牌缓存. Defaults to True.
 
         Returns:
             Self: payload对象
         """
-        payload = jwt.decode(
-            token, key=settings.JWT_SECRET, algorithms=settings.JWT_ALGORITHM
-        )
-        payload = cls.model_validate(payload)
+        if use_cache:
+            payload = token_cache.get(token)
+            if payload is not None:
+                return payload
+
+        claims = jwt_backend.decode(token)
+        mask = None
+        if "scp" in claims:
+            try:
+                mask = Scope.unpack(claims.pop("scp"))
+            except ValueError as e:
+                raise JWTError(str(e))
+            claims["scopes"] = Scope.names_of(mask)
+
+        payload = cls.model_validate(claims)
+        payload._scope_mask = mask
+
+        if use_cache:
+            token_cache.put(token, payload)
         return payload
 
     def to_jwt(self, expires_min: int = 15) -> str:
@@ -106,14 +1166,43 @@ class Payload(BaseModel):
             str: token str
         """
 
-        to_encode = self.model_copy()
-        to_encode.exp = datetime.utcnow() + timedelta(minutes=expires_min)
-        dump = to_encode.model_dump(exclude_unset=True)
+        dump = self.model_dump(exclude_unset=True)
+        dump["exp"] = datetime.utcnow() + timedelta(minutes=expires_min)
+        dump.setdefault("jti", new_token_id())
 
-        encode_jwt = jwt.encode(
-            dump, key=settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM
-        )
-        return encode_jwt
+        return jwt_backend.encode(pack_scopes(dump))
+
+
+TokenCacheStats = CacheStats
+
+
+class TokenCache(TTLCache[str, Payload]):
+    """
+    已验证令牌缓存（LRU + TTL）
+
+    每个认证请求都要对同一个token做一遍 `jwt.decode` 验签加 `Payload.model_validate`，
+    这个缓存把验证通过的负载存起来，key是token的sha256摘要（不存token原文）。
+
+    缓存条目的过期时间取 `ttl` 和token自身 `exp` 中更早的那个，所以永远不会把过期token当成有效的。
+    """
+
+    def _key(self, token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def put(self, token: str, payload: Payload):
+        """
+        缓存已验证的负载
+
+        Args:
+            token (str): token串
+            payload (Payload): 验证通过的负载
+        """
+        super().put(token, payload, payload.exp.timestamp())
+
+
+token_cache = TokenCache(settings.JWT_CACHE_SIZE, settings.JWT_CACHE_TTL)
+
+metrics.register("token_cache", lambda: token_cache.stats.model_dump())
 
 
 class TokenData(BaseModel):
@@ -129,6 +1218,8 @@ class TokenData(BaseModel):
         expires_min: int = settings.JWT_EXPIRE_MINUTES,
         refresh_expires: int = settings.JWT_REFRESH_EXPIRE_MINUTES,
         token_type: str = "bearer",
+        sid: str | None = None,
+        claims: dict[str, Any] | None = None,
     ):
         """
         这是个简易jwt创建接口，通过username和scopes创建令牌。
@@ -143,18 +1234,15 @@ class TokenData(BaseModel):
             expires_min (int, optional): _description_. Defaults to settings.JWT_EXPIRE_MINUTES.
             refresh_expires (int, optional): _description_. Defaults to settings.JWT_REFRESH_EXPIRE_MINUTES.
             token_type (str, optional): _description_. Defaults to "bearer".
+            sid (str | None, optional): 会话id，刷新令牌时沿用原来的会话，为空时开启新会话. Defaults to None.
+            claims (dict[str, Any] | None, optional): 额外负载，比如用户id `uid`、安全版本号 `sv`. Defaults to None.
 
         Returns:
             _type_: _description_
         """
-        access_token_payload = Payload(sub=username, scopes=scopes)
-        access_token_payload.typ = "access"
-
-        refresh_token_payload = access_token_payload.model_copy()
-        refresh_token_payload.typ = "refresh"
-
-        access_token = access_token_payload.to_jwt(expires_min)
-        refresh_token = refresh_token_payload.to_jwt(refresh_expires)
+        access_token, refresh_token = jwt_backend.encode_pair(
+            username, scopes, expires_min, refresh_expires, sid, claims
+        )
 
         return cls(
             access_token=access_token,
@@ -163,6 +1251,69 @@ class TokenData(BaseModel):
         )
 
 
+class RevocationStore:
+    """
+    令牌吊销名单（内存）
+
+    key是令牌的 `jti` 或者会话的 `sid`，value是过期时间戳。检查只是字典查找，O(1)，
+    每个请求都检查也比查一次数据库便宜得多。
+
+    令牌过期以后本来就验证不过，所以名单里的条目只需要保留到令牌过期，`purge` 会清理掉过期条目。
+
+    NOTE: 这里只是内存名单，持久化和多worker之间的同步由使用方负责（见 `qual.apps.auth.revocation`）。
+    """
+
+    def __init__(self) -> None:
+        self._entries: dict[str, float] = {}
+
+    def revoke(self, key: str, expires_at: float):
+        """
+        吊销
+
+        Args:
+            key (str): jti 或者 sid
+            expires_at (float): 过期时间戳，过了这个时间条目就会被清理
+        """
+        if key:
+            self._entries[key] = max(expires_at, self._entries.get(key, 0))
+
+    def is_revoked(self, *keys: str) -> bool:
+        """
+        检查是否被吊销，任意一个key在名单里就算吊销
+
+        Returns:
+            bool: 被吊销返回True
+        """
+        entries = self._entries
+        return any(key in entries for key in keys if key)
+
+    def purge(self) -> int:
+        """
+        清理已经过期的条目
+
+        Returns:
+            int: 清理掉的条目数
+        """
+        now = time.time()
+        expired = [
+            key for key, expires_at in self._entries.items() if expires_at <= now
+        ]
+        for key in expired:
+            self._entries.pop(key, None)
+        return len(expired)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+revocation_store = RevocationStore()
+
+metrics.register("token_revocation", lambda: {"size": len(revocation_store)})
+
+
 # 这是通用的从请求Headers中解析`Bearer`令牌的依赖项
 # 如果你在请求结果中看到了 `Not authenicated` 那么都是这个依赖项拦截的结果
 token_bearer = HTTPBearer(scheme_name="Token", description="JWT令牌")
@@ -178,6 +1329,7 @@ def _get_access_token_payload(credential: TokenADP):
 
     2. 会检查是否过期。
 
+    3. 会检查令牌（`jti`）或者会话（`sid`）是否被吊销。
 
     Args:
         credential (TokenADP): _description_
@@ -194,6 +1346,9 @@ def _get_access_token_payload(credential: TokenADP):
     except JWTError as e:
         raise JWTUnauthorizedError(str(e))
 
+    if revocation_store.is_revoked(payload.jti, payload.sid):
+        raise JWTUnauthorizedError("Token已被吊销")
+
     return payload
 
 
@@ -204,7 +1359,10 @@ async def _get_refresh_access_token_payload(refresh_token: Annotated[str, Form()
     """
     解析 Refresh Token 的Payload。
 
-    会检查是否是 `refresh` 类型的Token。
+    会检查是否是 `refresh` 类型的Token，以及会话（`sid`）是否被吊销。
+
+    NOTE: 这里不检查刷新令牌自己的 `jti`，刷新令牌是一次性的，用过的 `jti` 再来属于重用，
+    要由刷新接口来处理（吊销整个会话），见 `qual.apps.auth.revocation.consume_refresh_token`。
 
     [参考Postman的刷新令牌规范流程](https://auth0.com/docs/secure/tokens/refresh-tokens/use-refresh-tokens#use-basic-authentication)
 
@@ -228,6 +1386,9 @@ async def _get_refresh_access_token_payload(refresh_token: Annotated[str, Form()
     except JWTError as e:
         raise JWTUnauthorizedError(str(e))
 
+    if revocation_store.is_revoked(payload.sid):
+        raise JWTUnauthorizedError("Token已被吊销")
+
     return payload
 
 
@@ -240,21 +1401,148 @@ RefreshTokenPayloadADP = Annotated[Payload, Depends(_get_refresh_access_token_pa
 
 
 class ScopeMeta(type):
-    __scopes__: dict[str, str] = {}
+    """
+    Scope搜集器的元类
+
+    一组Scope可以编译成一个整数位图（mask），检查权限只要做一次位运算。
+
+    位序号跟Scope第一次出现（赋值或者访问）的先后无关：模块是按目录自动发现导入的，
+    导入顺序在不同机器上可能不一样。第一次用到位图时（`freeze`，`xyapi.init` 装完app以后会调用）
+    把已经注册的Scope按名字排序分配位序号，之后不会改变，同样的代码在哪台机器上位图都一样。
+
+    冻结以后才注册的Scope往后追加。一个位图带上编码时的Scope个数和这些Scope名的指纹，
+    之后追加了新的Scope也还能正确解码；如果部署的代码改变了Scope表（比如新增的Scope排在中间），
+    指纹就对不上，解码会报错，让客户端重新获取令牌，不会把位图解成别的权限。
+    """
+
+    def __init__(cls, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # 每个用这个元类的类一张Scope表，用 `type.__setattr__` 绕过注册
+        type.__setattr__(cls, "__scopes__", dict[str, str]())
+        type.__setattr__(cls, "__bits__", dict[str, int]())
+        type.__setattr__(cls, "__names__", list[str]())
+        type.__setattr__(cls, "__fingerprints__", dict[int, str]())
+        type.__setattr__(cls, "__frozen__", False)
 
     def __setattr__(self, __name: str, __value: Any) -> None:
         self.__scopes__[__name] = __value
+        self._register(__name)
 
     def __getattr__(self, item: str) -> str:
+        if item.startswith("__"):
+            raise AttributeError(item)
         if item not in self.__scopes__:
             self.__scopes__[item] = item
+            self._register(item)
 
         return item
 
+    def _register(cls, name: str):
+        # 冻结之前只记到 `__scopes__`，冻结时统一排序
+        if cls.__frozen__ and name not in cls.__bits__:
+            cls.__bits__[name] = len(cls.__names__)
+            cls.__names__.append(name)
+
+    def freeze(cls):
+        """
+        按名字排序给已经注册的Scope分配位序号，只在第一次调用时生效
+
+        签发或者验证令牌之前要调用，`mask_of` `pack` 这些方法第一次用的时候也会自动调用。
+        """
+        if cls.__frozen__:
+            return
+        for name in sorted(cls.__scopes__):
+            cls.__bits__[name] = len(cls.__names__)
+            cls.__names__.append(name)
+        type.__setattr__(cls, "__frozen__", True)
+
     @property
     def scopes(cls):
         return cls.__scopes__
 
+    def mask_of(cls, *names: str) -> int:
+        """
+        把一组Scope编译成位图，没注册过的Scope会被忽略
+
+        Returns:
+            int: 位图
+        """
+        cls.freeze()
+        bits = cls.__bits__
+        mask = 0
+        for name in names:
+            if name in bits:
+                mask |= 1 << bits[name]
+        return mask
+
+    def names_of(cls, mask: int) -> list[str]:
+        """
+        把位图还原成Scope列表
+
+        Args:
+            mask (int): 位图
+
+        Returns:
+            list[str]: Scope列表
+        """
+        cls.freeze()
+        return [name for i, name in enumerate(cls.__names__) if mask >> i & 1]
+
+    def _fingerprint(cls, count: int) -> str:
+        cls.freeze()
+        fingerprint = cls.__fingerprints__.get(count)
+        if fingerprint is None:
+            digest = hashlib.sha256("\n".join(cls.__names__[:count]).encode()).digest()
+            fingerprint = base64url_encode(digest[:6]).decode()
+            cls.__fingerprints__[count] = fingerprint
+        return fingerprint
+
+    def pack(cls, names: list[str]) -> str | None:
+        """
+        把一组Scope编码成紧凑的字符串 `<Scope个数>.<指纹>.<base64url位图>`
+
+        Args:
+            names (list[str]): Scope列表
+
+        Returns:
+            str | None: 编码结果，有没注册过的Scope时无法编码，返回None
+        """
+        cls.freeze()
+        if any(name not in cls.__bits__ for name in names):
+            return None
+
+        count = len(cls.__names__)
+        mask = cls.mask_of(*names)
+        data = base64url_encode(mask.to_bytes((mask.bit_length() + 7) // 8, "little"))
+        return f"{count}.{cls._fingerprint(count)}.{data.decode()}"
+
+    def unpack(cls, value: str) -> int:
+        """
+        解码 `pack` 编码的字符串
+
+        Args:
+            value (str): 编码字符串
+
+        Raises:
+            ValueError: 格式错误或者Scope表跟编码时不一致
+
+        Returns:
+            int: 位图
+        """
+        try:
+            count, fingerprint, data = value.split(".")
+            count = int(count)
+            mask = int.from_bytes(base64url_decode(data.encode()), "little")
+        except Exception:
+            raise ValueError("Scope位图格式错误")
+
+        cls.freeze()
+        if count > len(cls.__names__) or fingerprint != cls._fingerprint(count):
+            raise ValueError("Scope表已变更，请重新获取令牌")
+        if mask >> count:
+            raise ValueError("Scope位图超出范围")
+        return mask
+
 
 class Scope(metaclass=ScopeMeta):
     """
@@ -295,6 +1583,13 @@ class Scope(metaclass=ScopeMeta):
 # 用`Security`包裹的依赖项会将 `scopes` 参数添加到依赖池里。
 
 
+def _check_scopes(payload: Payload, required: int, security_scopes: SecurityScopes):
+    if payload.scope_mask & Scope.mask_of("all"):
+        return
+    if required & ~payload.scope_mask:
+        raise JWTUnauthorizedError(detail="Token的Scope不满足", scopes=security_scopes)
+
+
 def access_token_payload(
     token_payload: AccessTokenPayloadADP,
     security_scopes: SecurityScopes,
@@ -302,7 +1597,7 @@ def access_token_payload(
     """
     获取access_token的payload，如果有scopes那么就会去检查权限范围是否匹配。
 
-
+    NOTE: 每次请求都要编译一次 `security_scopes`，路由上请用 `NeedScope`，它会预先编译好位图。
 
     Args:
 
@@ -319,15 +1614,46 @@ def access_token_payload(
     """
     if security_scopes.scopes:
         # 如果scopes非空，意味着这个依赖需要检查scopes
-        if Scope.all not in token_payload.scopes:
-            for scope in security_scopes.scopes:
-                if scope not in token_payload.scopes:
-                    raise JWTUnauthorizedError(
-                        detail="Token的Scope不满足", scopes=security_scopes
-                    )
+        required = Scope.mask_of(*security_scopes.scopes)
+        if len(set(security_scopes.scopes)) != required.bit_count():
+            # 有没注册过的Scope，位图表达不了，令牌里肯定也没有这个Scope的位
+            required = -1
+        _check_scopes(token_payload, required, security_scopes)
     return token_payload
 
 
+class _ScopeChecker:
+    """
+    `NeedScope` 的依赖项，第一次检查时把需要的Scope编译成位图
+
+    创建时（导入路由模块时）Scope表还没冻结，位序号还没分配，不能马上编译。
+    """
+
+    def __init__(self, scopes: tuple[str, ...]) -> None:
+        self.scopes = scopes
+        # 访问一次Scope保证都注册过了
+        for scope in scopes:
+            getattr(Scope, scope)
+        self._mask: int | None = None
+
+    @property
+    def mask(self) -> int:
+        if self._mask is None:
+            self._mask = Scope.mask_of(*self.scopes)
+        return self._mask
+
+    def __call__(
+        self, token_payload: AccessTokenPayloadADP, security_scopes: SecurityScopes
+    ) -> Payload:
+        mask = self.mask
+        if len(security_scopes.scopes) != len(self.scopes):
+            # 外层的Security还带了Scope，一起检查
+            mask |= Scope.mask_of(*security_scopes.scopes)
+        if mask:
+            _check_scopes(token_payload, mask, security_scopes)
+        return token_payload
+
+
 def NeedScope(*scope_check: str):
     """
     这个依赖项会解析 `jwt_payload` 并检查 `scopes` 是否满足，然后返回`Payload`
@@ -341,6 +1667,7 @@ def NeedScope(*scope_check: str):
     另一种是当作`Security`用，由于内部实现也是用的 `SecurityScopes`，所以
     多个
 
+    需要的Scope在第一次请求时编译成位图，之后每次请求只做一次位运算。
 
     用法：
     ```python
@@ -358,7 +1685,7 @@ def NeedScope(*scope_check: str):
     Returns:
         Callable: ...
     """
-    return Security(access_token_payload, scopes=scope_check)
+    return Security(_ScopeChecker(scope_check), scopes=scope_check)
 
 
 # 预定义Scope
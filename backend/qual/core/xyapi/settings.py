@@ -35,8 +35,41 @@ class BaseSettings(Base):
     # JWT令牌相关
     JWT_SECRET: str = Field(default="jwt_secret", description="密文")
     JWT_ALGORITHM: str = Field(default="HS256", description="算法")
+    JWT_BACKEND: Literal["jose", "pyjwt"] = Field(
+        default="jose", description="JWT编解码后端"
+    )
+    JWT_PRIVATE_KEY: str = Field(
+        default="", description="非对称算法（RS/ES/EdDSA）的私钥，PEM内容或者PEM文件路径"
+    )
+    JWT_PUBLIC_KEY: str = Field(default="", description="非对称算法的公钥，为空时从私钥推导")
+    JWT_KEYS_DIR: str = Field(
+        default="", description="签名密钥环目录，配置后使用按kid轮换的非对称密钥，并发布JWKS"
+    )
+    JWT_KEY_ROTATE_MINUTES: int = Field(default=10080, description="签名密钥轮换周期（分钟）")
+    JWT_KEY_CHECK_SECONDS: float = Field(default=60, description="检查密钥是否需要轮换的间隔（秒）")
+    JWT_KEY_PUBLISH_SECONDS: int = Field(
+        default=300, description="新密钥先在JWKS里发布多久才开始签发（秒），也是JWKS的缓存时长"
+    )
     JWT_EXPIRE_MINUTES: int = Field(default=30, description="令牌有效期")
     JWT_REFRESH_EXPIRE_MINUTES: int = Field(default=43200, description="刷新令牌有效期")
+    JWT_REVOCATION_SYNC_SECONDS: float = Field(
+        default=5, description="从数据库同步令牌吊销名单的间隔（秒）"
+    )
+    JWT_CACHE_SIZE: int = Field(default=4096, description="已验证令牌缓存条数，0表示不缓存")
+    JWT_CACHE_TTL: int = Field(default=300, description="已验证令牌缓存时长（秒）")
+
+    # 密码哈希相关
+    PASSWORD_HASH_SCHEME: str = Field(default="bcrypt", description="密码哈希算法")
+    PASSWORD_HASH_ROUNDS: int = Field(default=0, description="密码哈希rounds（成本），0表示用算法默认值")
+    PASSWORD_HASH_DEPRECATED_SCHEMES: list[str] = Field(
+        default_factory=list, description="仍然可以校验但登录时会被重新哈希的旧算法"
+    )
+    PASSWORD_HASH_WORKERS: int = Field(default=0, description="密码哈希进程池大小，0表示使用CPU核数")
+    PASSWORD_HASH_MAX_IN_FLIGHT: int = Field(
+        default=0, description="同时进行的密码哈希数，0表示跟进程池大小一致"
+    )
+    PASSWORD_HASH_MAX_QUEUE: int = Field(default=32, description="密码哈希最大排队数")
+    PASSWORD_HASH_MAX_WAIT: float = Field(default=3.0, description="密码哈希最长排队时间（秒）")
 
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8", extra="allow"
@@ -5,6 +5,7 @@ from typing import Callable
 from fastapi import FastAPI
 from pydantic import BaseModel
 from .auto_discover import auto_discover
+from .security import Scope
 
 logger = logging.getLogger(__name__)
 
@@ -74,6 +75,9 @@ def init(app: FastAPI, package: ModuleType):
         logger.debug(f"执行安装app：{name}.{installer.__qualname__}")
         installer(app)
 
+    # app都装完了，Scope也都注册了，在签发令牌之前固定位序号
+    Scope.freeze()
+
     return app
 
 
@@ -6,11 +6,24 @@
 import qual
 from qual.core import xyapi
 from qual.core.settings import settings
+from qual.core.xyapi.database.instrumentation import QueryTimingMiddleware
+from qual.core.xyapi.database.sqlalchemy_activerecord import UnitOfWorkMiddleware
 from fastapi import FastAPI
 
 app = FastAPI(debug=settings.DEBUG)
 xyapi.init(app, qual)
 
+# 每个请求一个数据库会话，响应前统一提交一次
+app.add_middleware(UnitOfWorkMiddleware)
+# 每个请求的SQL条数和耗时写进Server-Timing，加在工作单元外面，提交时flush的SQL也算进去
+app.add_middleware(
+    QueryTimingMiddleware,
+    n_plus_one=settings.DB_N_PLUS_ONE
+    or ("off" if settings.ENVIRONMENT == "prod" else "log"),
+    threshold=settings.DB_N_PLUS_ONE_THRESHOLD,
+    server_timing=settings.DB_SERVER_TIMING,
+)
+
 
 @app.get("/test")
 def test():
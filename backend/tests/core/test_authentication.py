@@ -0,0 +1,144 @@
+import asyncio
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import create_async_engine
+from qual.core.database import Model, async_dsn
+from qual.core.xyapi.database.entity_cache import EntityCache
+from qual.core.xyapi.exception import JWTUnauthorizedError
+from qual.core.xyapi.security import Payload, Scope, TokenData
+from qual.apps.user.model import User
+from qual.core.authentication import Principal, get_principal
+from qual.core.authentication import authenticate as _authenticate
+
+
+@pytest.fixture
+def engine(tmp_path):
+    pytest.importorskip("aiosqlite")
+    dsn = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    engine = create_engine(dsn)
+    async_engine = create_async_engine(async_dsn(dsn))
+    User.metadata.create_all(engine, tables=[User.__table__])
+
+    old_engine, old_async_engine = Model.engine, Model.async_engine
+    Model.bind(engine)
+    Model.bind_async(async_engine)
+    yield engine
+    Model.bind(old_engine)
+    Model.bind_async(old_async_engine)
+    asyncio.run(async_engine.dispose())
+    engine.dispose()
+
+
+def authenticate(token: Payload) -> User | None:
+    return asyncio.run(_authenticate(token))
+
+
+def test_authenticate_cache(engine):
+    """
+    测试当前用户缓存：第二次认证不查数据库，修改用户后缓存失效
+    """
+    user_cache = User.__entity_cache__
+    user_cache.clear()
+    with Session(engine) as session:
+        session.add(User(username="bob", display_name="bob"))
+        session.commit()
+
+    token = Payload(sub="bob")
+    misses = user_cache.stats.misses
+
+    assert authenticate(token).display_name == "bob"
+    me = authenticate(token)
+    assert me.display_name == "bob"
+    assert user_cache.stats.misses == misses + 1
+
+    # 缓存还原出来的对象也能正常保存
+    with Session(engine) as session:
+        session.add(me)
+        me.display_name = "bobby"
+        session.commit()
+
+    assert user_cache.get(("username", "bob")) is None
+    assert authenticate(token).display_name == "bobby"
+
+
+def test_authenticate_cache_delete(engine):
+    """
+    测试当前用户缓存：删除用户后缓存失效
+    """
+    with Session(engine) as session:
+        session.add(User(username="alice", display_name="alice"))
+        session.commit()
+
+    assert authenticate(Payload(sub="alice"))
+
+    with Session(engine) as session:
+        session.delete(session.scalar(User.select.where(User.username == "alice")))
+        session.commit()
+
+    assert authenticate(Payload(sub="alice")) is None
+
+
+def test_authenticate_security_stamp(engine):
+    """
+    测试改密码（安全版本号变了）后旧令牌认证失败
+    """
+    with Session(engine) as session:
+        session.add(User(username="carol", display_name="carol"))
+        session.commit()
+
+    assert authenticate(Payload(sub="carol", sv=0))
+
+    with Session(engine) as session:
+        user = session.scalar(User.select.where(User.username == "carol"))
+        user.rotate_security_stamp()
+        session.commit()
+
+    with pytest.raises(JWTUnauthorizedError):
+        authenticate(Payload(sub="carol", sv=0))
+    assert authenticate(Payload(sub="carol", sv=1))
+
+
+def test_authenticate_security_stamp_other_worker(engine, monkeypatch):
+    """
+    测试别的worker（另一份用户缓存）改了密码，这个worker缓存命中时旧令牌也认证失败
+    """
+    user_cache = User.__entity_cache__
+    user_cache.clear()
+    with Session(engine) as session:
+        session.add(User(username="dave", display_name="dave"))
+        session.commit()
+
+    assert authenticate(Payload(sub="dave", sv=0))
+
+    other = EntityCache(
+        unique_keys=user_cache.unique_keys, uncached=user_cache.uncached
+    )
+    other.model = User
+    with monkeypatch.context() as patch:
+        patch.setattr(User, "__entity_cache__", other)
+        user = User.get_by_username("dave")
+        user.set_password("new")
+        user.save()
+
+    hits = user_cache.stats.hits
+    with pytest.raises(JWTUnauthorizedError):
+        authenticate(Payload(sub="dave", sv=0))
+    assert authenticate(Payload(sub="dave", sv=1)).verify_password("new")
+    assert user_cache.stats.hits == hits + 2
+
+
+def test_principal():
+    """
+    测试只用令牌负载构建主体，不可变
+    """
+    token_data = TokenData.simple_create("bob", [Scope.all], claims={"uid": 7, "sv": 3})
+    payload = Payload.from_jwt(token_data.access_token)
+    principal = get_principal(payload)
+
+    assert principal == Principal(
+        id=7, username="bob", scopes=("all",), security_stamp=3
+    )
+    with pytest.raises(ValidationError):
+        principal.username = "alice"
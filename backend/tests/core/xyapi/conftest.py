@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import Engine, create_engine
+from qual.core.xyapi.database.sqlalchemy_activerecord import Model
+
+
+@pytest.fixture
+def bind_engine():
+    """
+    给测试自己的模型基类绑定引擎，测试结束后解除绑定
+
+    只绑定传进来的基类（和它自己的 `metadata`），不动根 `Model` 的绑定。
+    参数同 `Model.bind`，返回路由器。
+
+    用例：
+    ```python
+    def test_replica(bind_engine):
+        router = bind_engine(ItemBase, writer, [reader])
+    ```
+    """
+    bound = list[type[Model]]()
+
+    def bind(base: type[Model], engine: Engine, *args, **kwargs):
+        bound.append(base)
+        return base.bind(engine, *args, **kwargs)
+
+    yield bind
+
+    for base in bound:
+        base.bind(None)
+
+
+@pytest.fixture
+def bind_async_engine():
+    """
+    同 `bind_engine`，绑定的是异步引擎，参数同 `Model.bind_async`
+    """
+    bound = list[type[Model]]()
+
+    def bind(base: type[Model], engine, *args, **kwargs):
+        bound.append(base)
+        return base.bind_async(engine, *args, **kwargs)
+
+    yield bind
+
+    for base in bound:
+        base.bind_async(None)
+
+
+@pytest.fixture
+def bind_sqlite(tmp_path, bind_engine):
+    """
+    给测试自己的模型基类绑定一个临时SQLite库并建表，测试结束后解除绑定
+
+    用例：
+    ```python
+    @pytest.fixture
+    def engine(bind_sqlite):
+        return bind_sqlite(NoteBase)
+    ```
+    """
+    engines = list[Engine]()
+
+    def bind(base: type[Model]) -> Engine:
+        engine = create_engine(f"sqlite:///{tmp_path / f'{base.__name__}.sqlite'}")
+        engines.append(engine)
+        base.metadata.create_all(engine)
+        bind_engine(base, engine)
+        return engine
+
+    yield bind
+
+    for engine in engines:
+        engine.dispose()
@@ -0,0 +1,735 @@
+import asyncio
+import json
+import pytest
+from fastapi import BackgroundTasks, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import MetaData, bindparam, event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Mapped, Session, mapped_column
+from qual.core.xyapi import StreamingJSONResponse
+from qual.core.xyapi.database import counting
+from qual.core.xyapi.database.entity_cache import EntityCache
+from qual.core.xyapi.database.statements import cached_statement
+from qual.core.xyapi.database.pagination import Page, PageADP
+from qual.core.xyapi.database.sqlalchemy_activerecord import (
+    Model,
+    UnitOfWorkMiddleware,
+)
+
+
+class NoteBase(Model):
+    __abstract__ = True
+    metadata = MetaData()
+
+
+class Note(NoteBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    title: Mapped[str] = mapped_column(default="")
+
+
+@pytest.fixture
+def engine(bind_sqlite):
+    return bind_sqlite(NoteBase)
+
+
+@pytest.fixture
+def async_engine(bind_async_engine):
+    pytest.importorskip("aiosqlite")
+    engine = create_async_engine("sqlite+aiosqlite://")
+
+    async def create_all():
+        async with engine.begin() as conn:
+            await conn.run_sync(NoteBase.metadata.create_all)
+
+    asyncio.run(create_all())
+    bind_async_engine(NoteBase, engine)
+    return engine
+
+
+def test_async_active_record(async_engine):
+    """
+    测试异步ActiveRecord：增删改查
+    """
+
+    async def run():
+        note = Note(title="a")
+        await note.asave()
+        assert note.id is not None
+
+        await note.aupdate(title="b")
+        assert (await Note.aget_by_pk(note.id)).title == "b"
+        assert (await Note.ascalar(Note.select.where(Note.title == "b"))).id == note.id
+
+        await Note(title="c").asave()
+        titles = (await Note.ascalars(Note.select.order_by(Note.id))).all()
+        assert [n.title for n in titles] == ["b", "c"]
+
+        await note.adelete()
+        assert await Note.aget_by_pk(note.id) is None
+
+    asyncio.run(run())
+
+
+def test_async_unit_of_work(async_engine):
+    """
+    测试异步工作单元：都用同一个会话，退出时提交，异常回滚
+    """
+
+    async def run():
+        async with NoteBase.async_unit_of_work() as session:
+            note = Note(title="a")
+            await note.asave()
+            assert await Note.aget_by_pk(note.id) is note
+            assert note in session
+
+        assert Model._async_session_var.get() is None
+        assert await Note.aget_by_pk(note.id) is not None
+
+        with pytest.raises(RuntimeError):
+            async with NoteBase.async_unit_of_work():
+                await Note(title="b").asave()
+                raise RuntimeError()
+
+        assert await Note.ascalar(Note.select.where(Note.title == "b")) is None
+
+    asyncio.run(run())
+
+
+def test_active_record_without_unit_of_work(engine):
+    """
+    测试工作单元外：每次调用都提交并关闭临时会话，对象属性还能访问
+    """
+    note = Note(title="a")
+    note.save()
+
+    assert note.id is not None
+    assert Note.get_by_pk(note.id).title == "a"
+    assert [n.title for n in Note.scalars(Note.select).all()] == ["a"]
+
+    note.update(title="b")
+    assert Note.scalar(Note.select).title == "b"
+    assert engine.pool.checkedout() == 0
+
+    note.delete()
+    assert Note.is_empty_table()
+
+
+def test_unit_of_work(engine):
+    """
+    测试工作单元：多次保存只提交一次，异常回滚，嵌套加入外层
+    """
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(conn))
+
+    with NoteBase.unit_of_work() as session:
+        Note(title="a").save()
+        with NoteBase.unit_of_work() as inner:
+            assert inner is session
+            Note(title="b").save()
+        assert commits == []
+
+    assert len(commits) == 1
+    assert len(Note.scalars(Note.select).all()) == 2
+
+    with pytest.raises(RuntimeError):
+        with NoteBase.unit_of_work():
+            Note(title="c").save()
+            raise RuntimeError()
+
+    assert Note.scalar(Note.select.where(Note.title == "c")) is None
+    assert engine.pool.checkedout() == 0
+
+
+def test_unit_of_work_middleware(engine):
+    """
+    测试请求级工作单元：请求里只提交一次，4xx回滚，请求结束释放连接
+    """
+    app = FastAPI()
+    app.add_middleware(UnitOfWorkMiddleware)
+
+    @app.post("/notes")
+    def add_notes(fail: bool = False):
+        Note(title="a").save()
+        Note(title="b").save()
+        if fail:
+            raise HTTPException(status_code=400)
+
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(conn))
+
+    with TestClient(app) as client:
+        assert client.post("/notes").status_code == 200
+        assert len(commits) == 1
+        assert client.post("/notes", params={"fail": True}).status_code == 400
+        assert len(commits) == 1
+
+    assert len(Note.scalars(Note.select).all()) == 2
+    assert engine.pool.checkedout() == 0
+
+
+def test_unit_of_work_background_tasks(engine):
+    """
+    测试请求级工作单元：响应发出以后后台任务的写入也会提交，后台任务失败回滚
+    """
+    app = FastAPI()
+    app.add_middleware(UnitOfWorkMiddleware)
+
+    def add_bg(fail: bool):
+        Note(title="bg").save()
+        if fail:
+            raise RuntimeError("bg")
+
+    @app.post("/notes")
+    def add_note(background_tasks: BackgroundTasks, fail: bool = False):
+        Note(title="fg").save()
+        background_tasks.add_task(add_bg, fail)
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        assert client.post("/notes").status_code == 200
+        assert client.post("/notes", params={"fail": True}).status_code == 200
+
+    titles = [note.title for note in Note.scalars(Note.select.order_by(Note.id))]
+    assert titles == ["fg", "bg", "fg"]
+    assert engine.pool.checkedout() == 0
+
+
+def test_unit_of_work_mixed_writes(engine, async_engine):
+    """
+    测试请求级工作单元：同步会话和异步会话都写了数据，不能原子提交，全部回滚并返回500
+    """
+    app = FastAPI()
+    app.add_middleware(UnitOfWorkMiddleware)
+
+    @app.post("/notes")
+    async def add_notes(mixed: bool = True):
+        await Note(title="async").asave()
+        if mixed:
+            Note(title="sync").save()
+
+    with TestClient(app) as client:
+        assert client.post("/notes").status_code == 500
+        assert Note.count() == 0
+        assert asyncio.run(Note.acount()) == 0
+
+        assert client.post("/notes", params={"mixed": False}).status_code == 200
+        assert asyncio.run(Note.acount()) == 1
+
+
+class Tag(NoteBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(unique=True)
+    count: Mapped[int] = mapped_column(default=0)
+
+
+def test_bulk_insert(engine):
+    """
+    测试批量插入：分批、返回主键、默认值生效、只提交一次
+    """
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(conn))
+
+    rows = ({"name": f"tag{i}"} for i in range(25))
+    result = Tag.bulk_insert(rows, chunk_size=10, returning=True)
+
+    assert result.rows == 25
+    assert result.chunks == 3
+    assert result.primary_keys == list(range(1, 26))
+    assert result.rows_per_second > 0
+    assert len(commits) == 1
+
+    tag = Tag.get_by_pk(1)
+    assert tag.count == 0
+    assert tag.create_at is not None
+
+
+def test_bulk_upsert(engine):
+    """
+    测试批量插入或更新：冲突的行更新，不冲突的插入
+    """
+    Tag.bulk_insert([{"name": "a", "count": 1}, {"name": "b", "count": 1}])
+    updated_at = Tag.scalar(Tag.select.where(Tag.name == "a")).updated_at
+
+    result = Tag.bulk_upsert(
+        [{"name": "a", "count": 2}, {"name": "c", "count": 3}],
+        conflict_on=["name"],
+    )
+
+    assert result.rows == 2
+    tags = {tag.name: tag for tag in Tag.scalars(Tag.select).all()}
+    assert {name: tag.count for name, tag in tags.items()} == {"a": 2, "b": 1, "c": 3}
+    assert tags["a"].updated_at >= updated_at
+    assert Tag.bulk_upsert([], conflict_on=["name"]).rows == 0
+
+
+def test_bulk_update(engine):
+    """
+    测试按主键批量更新
+    """
+    Tag.bulk_insert([{"name": "a"}, {"name": "b"}])
+
+    result = Tag.bulk_update([{"id": 1, "count": 5}, {"id": 2, "name": "bb"}])
+
+    assert result.rows == 2
+    assert Tag.get_by_pk(1).count == 5
+    assert Tag.get_by_pk(2).name == "bb"
+
+
+def test_bulk_in_unit_of_work(engine):
+    """
+    测试工作单元里的批量操作跟着工作单元回滚
+    """
+    with pytest.raises(RuntimeError):
+        with NoteBase.unit_of_work():
+            Tag.bulk_insert([{"name": "a"}])
+            raise RuntimeError()
+
+    assert Tag.is_empty_table()
+
+
+class TagRead(BaseModel):
+    id: int
+    name: str
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+def _all_pages(limit: int, **kwargs) -> list[list[str]]:
+    pages, cursor = [], None
+    while True:
+        page = Tag.paginate(cursor=cursor, limit=limit, **kwargs)
+        pages.append([tag.name for tag in page.items])
+        if page.next_cursor is None:
+            return pages
+        cursor = page.next_cursor
+
+
+def test_paginate(engine):
+    """
+    测试游标分页：默认按主键、倒序、混合方向、时间列排序都能不重不漏地翻完
+    """
+    Tag.bulk_insert([{"name": f"t{i}", "count": i % 3} for i in range(7)])
+    names = [f"t{i}" for i in range(7)]
+
+    assert _all_pages(3) == [names[0:3], names[3:6], names[6:]]
+    assert _all_pages(7) == [names]
+    assert sum(_all_pages(2, order_by=[Tag.id.desc()]), []) == names[::-1]
+
+    # count倒序，相同count按主键倒序
+    expected = sorted(names, key=lambda n: (-(int(n[1:]) % 3), -int(n[1:])))
+    assert sum(_all_pages(2, order_by=[Tag.count.desc()]), []) == expected
+
+    # count正序，相同count按id倒序，方向不一致
+    expected = sorted(names, key=lambda n: (int(n[1:]) % 3, -int(n[1:])))
+    pages = _all_pages(3, order_by=[Tag.count, Tag.id.desc()])
+    assert sum(pages, []) == expected
+
+    assert sum(_all_pages(4, order_by=[Tag.create_at.desc()]), []) == names[::-1]
+
+    stmt = Tag.select.where(Tag.count == 0)
+    assert Tag.paginate(stmt, limit=10).model_dump()["next_cursor"] is None
+    assert len(Tag.paginate(stmt, limit=10).items) == 3
+
+
+def test_paginate_invalid_cursor(engine):
+    """
+    测试无效游标返回400
+    """
+    for cursor in ["!!!", "bm90IGpzb24", "WzFd", "WyJhIiwyXQ"]:
+        with pytest.raises(HTTPException) as e:
+            Tag.paginate(cursor=cursor, order_by=[Tag.count])
+        assert e.value.status_code == 400
+
+
+def test_apaginate_endpoint(async_engine):
+    """
+    测试异步分页和分页参数依赖
+    """
+    app = FastAPI()
+
+    @app.get("/tags", response_model=Page[TagRead])
+    async def get_tags(page: PageADP):
+        return await Tag.apaginate(cursor=page.cursor, limit=page.limit)
+
+    async def add_tags():
+        async with NoteBase.async_unit_of_work() as session:
+            session.add_all(Tag(name=f"t{i}") for i in range(5))
+
+    asyncio.run(add_tags())
+
+    with TestClient(app) as client:
+        first = client.get("/tags", params={"limit": 2}).json()
+        assert [tag["name"] for tag in first["items"]] == ["t0", "t1"]
+        second = client.get(
+            "/tags", params={"limit": 2, "cursor": first["next_cursor"]}
+        ).json()
+        assert [tag["name"] for tag in second["items"]] == ["t2", "t3"]
+        assert client.get("/tags", params={"limit": 0}).status_code == 422
+        assert client.get("/tags", params={"cursor": "!!"}).status_code == 400
+
+
+def test_stream(engine):
+    """
+    测试流式读取：用yield_per分批取回全部数据
+    """
+    Tag.bulk_insert([{"name": f"t{i}"} for i in range(25)])
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, stmt, params, context, executemany: statements.append(
+            context.execution_options.get("yield_per")
+        ),
+    )
+
+    names = [tag.name for tag in Tag.stream(Tag.select.order_by(Tag.id), 10)]
+
+    assert names == [f"t{i}" for i in range(25)]
+    assert statements == [10]
+
+
+def test_astream_response(async_engine):
+    """
+    测试异步流式读取配合流式响应
+    """
+    app = FastAPI()
+
+    @app.get("/tags")
+    async def export_tags():
+        return StreamingJSONResponse(
+            Tag.astream(Tag.select.order_by(Tag.id), chunk_size=2), TagRead
+        )
+
+    async def add_tags():
+        async with NoteBase.async_unit_of_work() as session:
+            session.add_all(Tag(name=f"t{i}") for i in range(5))
+
+    asyncio.run(add_tags())
+
+    with TestClient(app) as client:
+        lines = client.get("/tags").text.splitlines()
+        assert [json.loads(line)["name"] for line in lines] == [
+            f"t{i}" for i in range(5)
+        ]
+
+
+class Member(NoteBase):
+    __entity_cache__ = EntityCache(max_size=100, ttl=60, unique_keys=["name"])
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(unique=True)
+    level: Mapped[int] = mapped_column(default=0)
+
+
+@pytest.fixture
+def member_cache():
+    cache = Member.__entity_cache__
+    cache.clear()
+    yield cache
+    cache.clear()
+
+
+def test_entity_cache(engine, member_cache):
+    """
+    测试实体缓存：按主键和唯一键命中，修改、改唯一键、删除后失效
+    """
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(1))
+    Member(name="a").save()
+
+    member = Member.get_by_pk(1)
+    count, hits = len(statements), member_cache.stats.hits
+    assert Member.get_by_pk(1).name == "a"
+    assert Member.get_by_unique("name", "a").id == 1
+    assert len(statements) == count
+    assert member_cache.stats.hits == hits + 2
+
+    # 缓存还原出来的对象能正常保存，保存后缓存失效
+    member = Member.get_by_unique("name", "a")
+    member.update(name="b", level=2)
+    assert member_cache.get(("name", "a")) is None
+    assert Member.get_by_unique("name", "a") is None
+    assert Member.get_by_pk(1).level == 2
+    assert Member.get_by_unique("name", "b").level == 2
+
+    Member.get_by_pk(1).delete()
+    assert Member.get_by_pk(1) is None
+    assert Member.get_by_unique("name", "b") is None
+
+
+def test_entity_cache_unit_of_work(engine, member_cache):
+    """
+    测试实体缓存：回滚的修改不会进缓存，批量操作清空缓存
+    """
+    Member(name="a").save()
+
+    with pytest.raises(RuntimeError):
+        with NoteBase.unit_of_work():
+            member = Member.get_by_pk(1)
+            member.update(level=5)
+            assert Member.get_by_unique("name", "a").level == 5
+            raise RuntimeError()
+
+    assert len(member_cache) == 0
+    assert Member.get_by_unique("name", "a").level == 0
+    assert len(member_cache) == 2
+
+    Member.bulk_update([{"id": 1, "level": 3}])
+    assert len(member_cache) == 0
+    assert Member.get_by_pk(1).level == 3
+
+
+def test_entity_cache_stale_store(engine, member_cache):
+    """
+    测试实体缓存：查询开始以后对象被修改失效过，查到的旧数据不放进缓存
+    """
+    Member(name="a", level=1).save()
+
+    with Session(engine) as session:
+        version = member_cache.version()
+        stale = session.get(Member, 1)
+
+        # 另一个请求在这期间提交了修改
+        member = Member.get_by_pk(1)
+        member.level = 2
+        member.save()
+
+        member_cache.store(stale, session, version)
+        assert len(member_cache) == 0
+
+    assert Member.get_by_unique("name", "a").level == 2
+
+
+def test_entity_cache_async(engine, async_engine, member_cache):
+    """
+    测试异步接口也走实体缓存
+    """
+    Member(name="a").save()
+    hits = member_cache.stats.hits
+
+    async def run():
+        member = await Member.aget_by_unique("name", "a")
+        # 同步引擎和异步引擎是两个库，缓存命中的话查不到异步库
+        assert member is None
+        assert Member.get_by_pk(1) is not None
+        member = await Member.aget_by_pk(1)
+        assert member.name == "a"
+        assert (await Member.aget_by_unique("name", "a")).id == 1
+
+    asyncio.run(run())
+    assert member_cache.stats.hits == hits + 2
+
+
+class Account(NoteBase):
+    __entity_cache__ = EntityCache(
+        max_size=100, ttl=60, unique_keys=["name"], uncached=["secret"]
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(unique=True)
+    level: Mapped[int] = mapped_column(default=0)
+    secret: Mapped[str] = mapped_column(default="")
+
+
+def test_entity_cache_uncached(engine, bind_async_engine, monkeypatch):
+    """
+    测试实体缓存：两个进程各有一份缓存，共用一个库，不缓存的列另一个进程改了马上能读到
+    """
+    pytest.importorskip("aiosqlite")
+    bind_async_engine(
+        NoteBase, create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}")
+    )
+    cache = Account.__entity_cache__
+    cache.clear()
+    Account(name="a", secret="old").save()
+    assert Account.get_by_unique("name", "a").secret == "old"
+
+    # 另一个进程的缓存，这个进程收不到它的失效
+    other = EntityCache(max_size=100, ttl=60, unique_keys=["name"], uncached=["secret"])
+    other.model = Account
+    with monkeypatch.context() as patch:
+        patch.setattr(Account, "__entity_cache__", other)
+        Account.get_by_unique("name", "a").update(level=1, secret="new")
+
+    hits = cache.stats.hits
+    account = Account.get_by_unique("name", "a")
+    assert cache.stats.hits == hits + 1
+    assert account.level == 0
+    assert account.secret == "new"
+    assert asyncio.run(Account.aget_by_pk(1)).secret == "new"
+    assert asyncio.run(Account.aget_by_unique("name", "a")).secret == "new"
+
+    # 另一个进程删了，缓存命中也查不到
+    with monkeypatch.context() as patch:
+        patch.setattr(Account, "__entity_cache__", other)
+        Account.get_by_pk(1).delete()
+
+    assert cache.get(("name", "a")) is not None
+    assert Account.get_by_unique("name", "a") is None
+    assert asyncio.run(Account.aget_by_pk(1)) is None
+    cache.clear()
+
+
+class Label(NoteBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(unique=True)
+    color: Mapped[str] = mapped_column(default="")
+
+    @cached_statement
+    def by_color(cls):
+        return cls.select.where(cls.color == bindparam("color")).order_by(cls.id)
+
+
+def test_cached_statement(engine):
+    """
+    测试命名语句：每个模型只构建一次，执行时只传参数
+    """
+    Label.bulk_insert([{"name": "a", "color": "red"}, {"name": "b", "color": "blue"}])
+
+    assert Label.by_color is Label.by_color
+    assert Label.select is Label.select
+    assert Note.select is not Label.select
+    assert Label._unique_stmt("name") is Label._unique_stmt("name")
+
+    labels = Label.scalars(Label.by_color, {"color": "blue"}).all()
+    assert [label.name for label in labels] == ["b"]
+    assert Label.scalar(Label.by_color, {"color": "red"}).name == "a"
+    assert Label.get_by_unique("name", "b").color == "blue"
+
+
+class TagCountRead(TagRead):
+    count: int
+    note: str = ""
+
+
+def test_read(engine):
+    """
+    测试只读列查询：只查响应模型需要的列，直接返回响应模型
+    """
+    Tag.bulk_insert([{"name": f"t{i}", "count": i} for i in range(5)])
+
+    stmt = Tag.select_columns(TagCountRead)
+    assert Tag.select_columns(TagCountRead) is stmt
+    assert [column.key for column in stmt.selected_columns] == ["id", "name", "count"]
+
+    tags = Tag.read(TagCountRead, stmt.where(Tag.count >= 3).order_by(Tag.id))
+    assert tags == [
+        TagCountRead(id=4, name="t3", count=3),
+        TagCountRead(id=5, name="t4", count=4),
+    ]
+    assert Tag.read(TagRead, validate=False)[0] == TagRead(id=1, name="t0")
+
+    # 只查了需要的列，排序键补查出来生成游标
+    pages = []
+    page = Tag.paginate(limit=2, order_by=[Tag.count.desc()], schema=TagRead)
+    while True:
+        pages.append([tag.name for tag in page.items])
+        if page.next_cursor is None:
+            break
+        page = Tag.paginate(
+            cursor=page.next_cursor,
+            limit=2,
+            order_by=[Tag.count.desc()],
+            schema=TagRead,
+        )
+    assert pages == [["t4", "t3"], ["t2", "t1"], ["t0"]]
+    assert isinstance(page.items[0], TagRead)
+
+    class TagDetail(TagRead):
+        notes: list[TagRead]
+
+    with pytest.raises(TypeError):
+        Tag.select_columns(TagDetail)
+
+
+def test_aread(async_engine):
+    """
+    测试异步只读列查询和分页
+    """
+
+    async def run():
+        async with NoteBase.async_unit_of_work() as session:
+            session.add_all(Tag(name=f"t{i}", count=i) for i in range(3))
+
+        assert await Tag.aread(TagRead) == [
+            TagRead(id=i + 1, name=f"t{i}") for i in range(3)
+        ]
+        page = await Tag.apaginate(limit=2, schema=TagCountRead)
+        assert page.items[1] == TagCountRead(id=2, name="t1", count=1)
+        page = await Tag.apaginate(
+            cursor=page.next_cursor, limit=2, schema=TagCountRead
+        )
+        assert [tag.name for tag in page.items] == ["t2"]
+
+    asyncio.run(run())
+
+
+def test_exists_and_count(engine):
+    """
+    测试存在性判断、精确计数和估算计数
+    """
+    counting.clear_estimates()
+    assert Label.is_empty_table() and not Label.exists()
+    assert Label.count() == 0
+
+    colors = ["red", "blue", "red"] * 3
+    Label.bulk_insert([{"name": f"l{i}", "color": c} for i, c in enumerate(colors)])
+    assert not Label.is_empty_table()
+    assert Label.exists(Label.color == "red") and not Label.exists(Label.color == "")
+    assert Label.count() == 9 and Label.count(Label.color == "blue") == 3
+
+    sql = str(counting.exists_stmt(Label, Label.color == "red"))
+    assert "EXISTS (SELECT 1" in sql and "LIMIT" in sql
+
+    # 没有ANALYZE过，没有估算值，也不退回到精确计数
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, stmt, *args: statements.append(stmt),
+    )
+    assert Label.estimated_count() is None
+    assert Label.paginate(limit=2, total=True).total is None
+    assert not any("count(" in stmt.lower() for stmt in statements)
+    Label.bulk_insert([{"name": "l9"}])
+
+    # ANALYZE以后用sqlite_stat1
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+        conn.exec_driver_sql(
+            "UPDATE sqlite_stat1 SET stat = '1000 1' WHERE tbl = 'label'"
+        )
+    counting.clear_estimates()
+    assert Label.estimated_count() == 1000
+    assert Label.count() == 10
+
+    # 结果缓存
+    Label.bulk_insert([{"name": "l10"}])
+    assert Label.estimated_count() == 1000
+
+    page = Label.paginate(limit=2, total=True)
+    assert page.total == 1000 and Label.paginate(limit=2).total is None
+
+
+def test_async_exists_and_count(async_engine):
+    """
+    测试异步的存在性判断和计数
+    """
+    counting.clear_estimates()
+
+    async def run():
+        assert not await Label.aexists()
+        async with NoteBase.async_unit_of_work() as session:
+            session.add_all(Label(name=f"l{i}") for i in range(3))
+        assert await Label.aexists(Label.name == "l1")
+        assert await Label.acount() == 3
+        assert await Label.aestimated_count() is None
+
+        async with async_engine.begin() as conn:
+            await conn.exec_driver_sql("ANALYZE")
+        counting.clear_estimates()
+        assert await Label.aestimated_count() == 3
+        page = await Label.apaginate(limit=1, total=True)
+        assert page.total == 3
+
+    asyncio.run(run())
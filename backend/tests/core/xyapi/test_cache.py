@@ -0,0 +1,54 @@
+import time
+from qual.core.xyapi.cache import TTLCache
+
+
+def test_ttl_cache_hit():
+    """
+    测试缓存命中和统计
+    """
+    cache = TTLCache[str, int](max_size=10, ttl=60)
+
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+
+    stats = cache.stats
+    assert (stats.hits, stats.misses, stats.size) == (1, 1, 1)
+    assert stats.hit_rate == 0.5
+
+
+def test_ttl_cache_expire():
+    """
+    测试缓存过期：取ttl和expires_at更早的那个
+    """
+    cache = TTLCache[str, int](max_size=10, ttl=60)
+
+    cache.put("a", 1, expires_at=time.time() - 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_lru():
+    """
+    测试缓存淘汰：超出容量淘汰最久没用的
+    """
+    cache = TTLCache[str, int](max_size=2, ttl=60)
+
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats.evictions == 1
+
+
+def test_ttl_cache_disabled():
+    """
+    测试max_size为0时不缓存
+    """
+    cache = TTLCache[str, int](max_size=0, ttl=60)
+    cache.put("a", 1)
+
+    assert cache.get("a") is None
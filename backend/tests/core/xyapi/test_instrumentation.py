@@ -0,0 +1,120 @@
+import logging
+import re
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import ForeignKey, MetaData, text
+from sqlalchemy.orm import Mapped, mapped_column, relationship, selectinload
+from qual.core.xyapi.database.instrumentation import (
+    NPlusOneError,
+    QueryTimingMiddleware,
+)
+from qual.core.xyapi.database.sqlalchemy_activerecord import (
+    Model,
+    UnitOfWorkMiddleware,
+)
+
+
+class TimingBase(Model):
+    __abstract__ = True
+    metadata = MetaData()
+
+
+class Album(TimingBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column()
+
+    photos: Mapped[list["Photo"]] = relationship()
+
+
+class Photo(TimingBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    album_id: Mapped[int] = mapped_column(ForeignKey(Album.id))
+
+
+@pytest.fixture
+def engine(bind_sqlite):
+    engine = bind_sqlite(TimingBase)
+    with TimingBase.unit_of_work() as session:
+        session.add_all(Album(name=f"a{i}", photos=[Photo()]) for i in range(4))
+    return engine
+
+
+def _app(**kwargs) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/albums")
+    def get_albums(eager: bool = False):
+        stmt = Album.select.order_by(Album.id)
+        if eager:
+            stmt = stmt.options(selectinload(Album.photos))
+        return [len(album.photos) for album in Album.scalars(stmt)]
+
+    @app.post("/albums")
+    def add_album():
+        Album(name="new").save()
+
+    app.add_middleware(UnitOfWorkMiddleware)
+    app.add_middleware(QueryTimingMiddleware, **kwargs)
+    return app
+
+
+def _timing(response) -> tuple[int, float]:
+    match = re.fullmatch(
+        r'db;dur=([\d.]+);desc="(\d+) queries"', response.headers["server-timing"]
+    )
+    return int(match[2]), float(match[1])
+
+
+def test_server_timing(engine):
+    """
+    测试Server-Timing头里的SQL条数和耗时
+    """
+    with TestClient(_app()) as client:
+        response = client.get("/albums", params={"eager": True})
+        assert response.json() == [1, 1, 1, 1]
+        count, duration = _timing(response)
+        assert count == 2 and duration > 0
+
+        # 1条查专辑，每个专辑懒加载一次照片
+        assert _timing(client.get("/albums"))[0] == 5
+        # 提交时flush的INSERT也算
+        assert _timing(client.post("/albums"))[0] == 1
+
+    with TestClient(_app(server_timing=False)) as client:
+        assert "server-timing" not in client.get("/albums").headers
+
+
+def test_failed_statement(engine):
+    """
+    测试SQL出错时不会在池化的连接上留下计时状态
+    """
+    app = _app()
+
+    @app.get("/broken")
+    def broken():
+        Album.scalars(text("SELECT * FROM missing"))
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        assert client.get("/broken").status_code == 500
+        assert _timing(client.get("/albums"))[0] == 5
+
+    with engine.connect() as conn:
+        assert not conn.info
+
+
+def test_n_plus_one(engine, caplog):
+    """
+    测试N+1检查的log和raise模式
+    """
+    with TestClient(_app(n_plus_one="log", threshold=3)) as client:
+        with caplog.at_level(logging.WARNING):
+            client.get("/albums", params={"eager": True})
+            assert "N+1" not in caplog.text
+            client.get("/albums")
+        assert caplog.text.count("疑似N+1查询：/albums") == 1
+
+    with TestClient(_app(n_plus_one="raise", threshold=3)) as client:
+        assert client.get("/albums", params={"eager": True}).status_code == 200
+        with pytest.raises(NPlusOneError):
+            client.get("/albums")
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import ForeignKey, MetaData
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from qual.core.xyapi import RawJSONResponse
+from qual.core.xyapi.database.pagination import Page, PageADP
+from qual.core.xyapi.database.sqlalchemy_activerecord import Model
+from qual.core.xyapi.database.testing import assert_num_queries
+
+
+class JsonBase(Model):
+    __abstract__ = True
+    metadata = MetaData()
+
+
+class Shelf(JsonBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column()
+    public: Mapped[bool] = mapped_column(default=True)
+
+    books: Mapped[list["Book"]] = relationship(back_populates="shelf")
+
+
+class Book(JsonBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    title: Mapped[str] = mapped_column()
+    price: Mapped[float] = mapped_column(default=0)
+    note: Mapped[str | None] = mapped_column(nullable=True)
+    shelf_id: Mapped[int] = mapped_column(ForeignKey(Shelf.id))
+
+    shelf: Mapped[Shelf] = relationship(back_populates="books")
+
+
+class BookRead(BaseModel):
+    id: int
+    title: str
+    price: float
+    note: str | None
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ShelfRead(BaseModel):
+    id: int
+    name: str
+    public: bool
+    model_config = ConfigDict(from_attributes=True)
+
+
+class ShelfReadDetail(ShelfRead):
+    books: list[BookRead]
+
+
+class BookReadDetail(BookRead):
+    shelf: ShelfRead
+
+
+def _shelves() -> list[Shelf]:
+    return [
+        Shelf(
+            name=f"shelf{i}",
+            public=i % 2 == 0,
+            books=[
+                Book(title=f"书{i}{j}", price=j + 0.5, note=None if j else '"引号"')
+                for j in range(i)
+            ],
+        )
+        for i in range(4)
+    ]
+
+
+@pytest.fixture
+def engine(bind_sqlite):
+    engine = bind_sqlite(JsonBase)
+    with JsonBase.unit_of_work() as session:
+        session.add_all(_shelves())
+    return engine
+
+
+def test_read_json(engine):
+    """
+    测试数据库拼出来的JSON跟响应模型序列化的一致
+    """
+    stmt = Shelf.select_json(ShelfReadDetail).order_by(Shelf.id)
+    with assert_num_queries(engine, 1):
+        content = Shelf.read_json(ShelfReadDetail, stmt)
+
+    shelves = Shelf.scalars(Shelf.select_for(ShelfReadDetail).order_by(Shelf.id))
+    expected = [ShelfReadDetail.model_validate(shelf).model_dump() for shelf in shelves]
+    assert json.loads(content) == expected
+    assert expected[0]["books"] == [] and expected[1]["public"] is False
+
+    books = Book.read_json(BookReadDetail, Book.select_json(BookReadDetail))
+    assert json.loads(books)[0]["shelf"] == {"id": 2, "name": "shelf1", "public": False}
+
+    assert Shelf.read_json(ShelfRead, stmt.where(Shelf.id < 0)) == b"[]"
+
+
+def test_paginate_json(engine):
+    """
+    测试在数据库里拼JSON的游标分页
+    """
+    app = FastAPI()
+
+    @app.get("/shelves", response_model=Page[ShelfReadDetail])
+    def get_shelves(page: PageADP):
+        content = Shelf.paginate_json(
+            ShelfReadDetail, cursor=page.cursor, limit=page.limit
+        )
+        return RawJSONResponse(content)
+
+    with TestClient(app) as client:
+        with assert_num_queries(engine, 1):
+            first = client.get("/shelves", params={"limit": 3})
+        assert first.headers["content-type"] == "application/json"
+        first = first.json()
+        assert [shelf["name"] for shelf in first["items"]] == [
+            "shelf0",
+            "shelf1",
+            "shelf2",
+        ]
+        second = client.get(
+            "/shelves", params={"limit": 3, "cursor": first["next_cursor"]}
+        ).json()
+        assert [len(shelf["books"]) for shelf in second["items"]] == [3]
+        assert second["next_cursor"] is None
+
+
+def test_apaginate_json():
+    """
+    测试异步接口
+    """
+    pytest.importorskip("aiosqlite")
+    engine = create_async_engine("sqlite+aiosqlite://")
+    JsonBase.bind_async(engine)
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(JsonBase.metadata.create_all)
+        async with JsonBase.async_unit_of_work() as session:
+            session.add_all(_shelves())
+
+        page = json.loads(await Shelf.apaginate_json(ShelfRead, limit=2))
+        assert [shelf["id"] for shelf in page["items"]] == [1, 2]
+        assert len(json.loads(await Shelf.aread_json(ShelfReadDetail))) == 4
+
+    try:
+        asyncio.run(run())
+    finally:
+        JsonBase.bind_async(None)
+
+
+def test_postgresql_json_document():
+    """
+    测试PostgreSQL上用json_build_object和按主键排序的json_agg
+    """
+    sql = str(Shelf.select_json(ShelfReadDetail).compile(dialect=postgresql.dialect()))
+    assert "json_build_object('id', shelf.id" in sql
+    assert "json_agg(anon_1.document ORDER BY anon_1.pk_0), '[]'::json)" in sql
+    assert "WHERE shelf.id = book.shelf_id ORDER BY book.id) AS anon_1" in sql
+
+
+def test_sqlite_json_document_order():
+    """
+    测试SQLite上聚合按主键排过序的子查询（json_group_array里不能写ORDER BY）
+    """
+    sql = str(Shelf.select_json(ShelfReadDetail).compile(dialect=sqlite.dialect()))
+    assert "json_group_array(json(anon_1.document))" in sql
+    assert "WHERE shelf.id = book.shelf_id ORDER BY book.id) AS anon_1" in sql
@@ -0,0 +1,143 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, ConfigDict
+from sqlalchemy import ForeignKey, MetaData, exc
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from qual.core.xyapi.database.loading import eager_options
+from qual.core.xyapi.database.sqlalchemy_activerecord import Model
+from qual.core.xyapi.database.testing import assert_num_queries
+
+
+class LoadingBase(Model):
+    __abstract__ = True
+    metadata = MetaData()
+
+
+class Owner(LoadingBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column()
+
+
+class Folder(LoadingBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column()
+    owner_id: Mapped[int] = mapped_column(ForeignKey(Owner.id))
+
+    owner: Mapped[Owner] = relationship()
+    files: Mapped[list["File"]] = relationship(back_populates="folder")
+
+
+class File(LoadingBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column()
+    folder_id: Mapped[int] = mapped_column(ForeignKey(Folder.id))
+
+    folder: Mapped[Folder] = relationship(back_populates="files")
+    tags: Mapped[list["FileTag"]] = relationship()
+
+
+class FileTag(LoadingBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column()
+    file_id: Mapped[int] = mapped_column(ForeignKey(File.id))
+
+
+class OwnerRead(BaseModel):
+    name: str
+    model_config = ConfigDict(from_attributes=True)
+
+
+class FileTagRead(BaseModel):
+    name: str
+    model_config = ConfigDict(from_attributes=True)
+
+
+class FileRead(BaseModel):
+    name: str
+    tags: list[FileTagRead]
+    model_config = ConfigDict(from_attributes=True)
+
+
+class FolderRead(BaseModel):
+    name: str
+    model_config = ConfigDict(from_attributes=True)
+
+
+class FolderReadDetail(FolderRead):
+    owner: OwnerRead | None
+    files: list[FileRead]
+
+
+@pytest.fixture
+def engine(bind_sqlite):
+    engine = bind_sqlite(LoadingBase)
+
+    with LoadingBase.unit_of_work() as session:
+        for i in range(3):
+            owner = Owner(name=f"owner{i}")
+            folder = Folder(name=f"folder{i}", owner=owner)
+            session.add(folder)
+            for j in range(2):
+                file = File(name=f"file{i}{j}", folder=folder)
+                file.tags = [FileTag(name="a"), FileTag(name="b")]
+                session.add(file)
+
+    return engine
+
+
+def test_eager_options():
+    """
+    测试按响应模型生成加载选项：集合用selectinload，单个对象用joinedload，嵌套递归
+    """
+    assert eager_options(Folder, FolderRead) == ()
+    assert eager_options(Folder, FolderReadDetail) is eager_options(
+        Folder, FolderReadDetail
+    )
+
+    options = eager_options(Folder, FolderReadDetail)
+    strategies = {
+        option.context[0].path[1].key: dict(option.context[0].strategy)
+        for option in options
+    }
+    assert strategies == {
+        "owner": {"lazy": "joined"},
+        "files": {"lazy": "selectin"},
+    }
+
+
+def test_select_for_route_query_count(engine):
+    """
+    测试列表接口的查询条数跟数据量无关
+    """
+    app = FastAPI()
+
+    @app.get("/folders", response_model=list[FolderReadDetail])
+    def get_folders(eager: bool = True):
+        stmt = Folder.select_for(FolderReadDetail) if eager else Folder.select
+        with LoadingBase.unit_of_work():
+            return [
+                FolderReadDetail.model_validate(folder)
+                for folder in LoadingBase.scalars(stmt.order_by(Folder.id))
+            ]
+
+    with TestClient(app) as client:
+        # 文件夹+负责人一条，文件一条，标签一条
+        with assert_num_queries(engine, 3):
+            folders = client.get("/folders").json()
+        assert [len(folder["files"]) for folder in folders] == [2, 2, 2]
+        assert folders[0]["files"][0]["tags"] == [{"name": "a"}, {"name": "b"}]
+
+        with pytest.raises(AssertionError, match="预期执行3条SQL"):
+            with assert_num_queries(engine, 3):
+                client.get("/folders", params={"eager": False})
+
+
+def test_select_for_strict(engine):
+    """
+    测试严格模式下访问响应模型没有的关系报错
+    """
+    with LoadingBase.unit_of_work():
+        folder = LoadingBase.scalar(Folder.select_for(FolderRead, strict=True))
+        with pytest.raises(exc.InvalidRequestError):
+            folder.files
@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import SingletonThreadPool
+from qual.core.xyapi.database.pool import PoolMonitor, pool_options
+
+
+def test_pool_options():
+    """
+    测试不支持池大小的连接池会去掉对应参数
+    """
+    options = pool_options("sqlite://", pool_size=3, max_overflow=1, pool_recycle=60)
+    assert options == {"poolclass": SingletonThreadPool, "pool_recycle": 60}
+
+    engine = create_engine("sqlite://", **options)
+    with engine.connect() as conn:
+        assert conn.scalar(text("SELECT 1")) == 1
+
+
+def test_pool_monitor(tmp_path):
+    """
+    测试连接池借出、溢出、超时统计
+    """
+    dsn = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    monitor = PoolMonitor()
+    engine = create_engine(
+        dsn,
+        **pool_options(dsn, monitor, pool_size=1, max_overflow=1, pool_timeout=0.1),
+    )
+    monitor.listen(engine)
+    assert type(engine.pool).__name__ == "MonitoredQueuePool"
+
+    first = engine.connect()
+    second = engine.connect()
+    stats = monitor.collect()
+    assert stats["checked_out"] == 2 and stats["overflow"] == 1
+    assert stats["connects"] == 2 and stats["overflow_connects"] == 1
+
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    first.close()
+    second.close()
+
+    stats = monitor.collect()
+    assert stats["timeouts"] == 1 and stats["wait_seconds_max"] >= 0.1
+    assert stats["checked_out"] == 0 and stats["checked_out_max"] == 2
+    assert stats["checkouts"] == 2
+
+    # 重建连接池以后还在统计
+    engine.dispose()
+    with engine.connect():
+        pass
+    assert monitor.collect()["checkouts"] == 3
+    engine.dispose()
+
+
+def test_async_pool_monitor(tmp_path):
+    """
+    测试异步引擎的连接池统计
+    """
+    pytest.importorskip("aiosqlite")
+    dsn = f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite'}"
+    monitor = PoolMonitor()
+    engine = create_async_engine(dsn, **pool_options(dsn, monitor, pool_size=2))
+    monitor.listen(engine)
+
+    async def run():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        await engine.dispose()
+
+    asyncio.run(run())
+    stats = monitor.collect()
+    assert stats["checkouts"] == 1 and stats["connects"] == 1
@@ -0,0 +1,64 @@
+import json
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from qual.core.xyapi import StreamingJSONResponse
+
+
+class Item(BaseModel):
+    id: int
+    name: str
+
+
+def _rows(count: int):
+    for i in range(count):
+        yield {"id": i, "name": f"item{i}"}
+
+
+async def _arows(count: int):
+    for row in _rows(count):
+        yield row
+
+
+app = FastAPI()
+
+
+@app.get("/items")
+async def get_items(count: int, format: str = "ndjson", asynchronous: bool = False):
+    rows = _arows(count) if asynchronous else _rows(count)
+    return StreamingJSONResponse(rows, Item, format=format, batch_size=3)
+
+
+def test_streaming_ndjson():
+    """
+    测试NDJSON：一行一个对象，同步和异步数据源都可以
+    """
+    with TestClient(app) as client:
+        for asynchronous in (False, True):
+            response = client.get(
+                "/items", params={"count": 7, "asynchronous": asynchronous}
+            )
+            assert response.headers["content-type"] == "application/x-ndjson"
+            lines = response.text.splitlines()
+            assert [json.loads(line) for line in lines] == list(_rows(7))
+
+        assert client.get("/items", params={"count": 0}).text == ""
+
+
+def test_streaming_json_array():
+    """
+    测试JSON数组：分批发送拼起来还是合法的数组
+    """
+    with TestClient(app) as client:
+        for count in (0, 1, 3, 7):
+            for asynchronous in (False, True):
+                response = client.get(
+                    "/items",
+                    params={
+                        "count": count,
+                        "format": "json",
+                        "asynchronous": asynchronous,
+                    },
+                )
+                assert response.headers["content-type"] == "application/json"
+                assert response.json() == list(_rows(count))
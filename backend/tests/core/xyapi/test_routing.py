@@ -0,0 +1,218 @@
+import asyncio
+import shutil
+import pytest
+from sqlalchemy import MetaData, create_engine, exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Mapped, mapped_column
+from qual.core.xyapi.database.routing import set_consistency_key
+from qual.core.xyapi.database.sqlalchemy_activerecord import Model
+
+
+class RoutingBase(Model):
+    __abstract__ = True
+    metadata = MetaData()
+
+
+class Item(RoutingBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(default="")
+
+
+def _databases(tmp_path, replicas: int) -> list[str]:
+    """
+    建一个主库，复制出几个从库，复制以后主库再插一行（模拟从库延迟）
+    """
+    writer = tmp_path / "writer.sqlite"
+    engine = create_engine(f"sqlite:///{writer}")
+    RoutingBase.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Item.__table__.insert(), [{"name": "old"}])
+    engine.dispose()
+
+    paths = [writer]
+    for i in range(replicas):
+        paths.append(tmp_path / f"reader{i}.sqlite")
+        shutil.copy(writer, paths[-1])
+    return [str(path) for path in paths]
+
+
+@pytest.fixture
+def router(tmp_path, bind_engine):
+    paths = _databases(tmp_path, 2)
+    writer, *readers = [create_engine(f"sqlite:///{path}") for path in paths]
+
+    router = bind_engine(RoutingBase, writer, readers, read_your_writes=60)
+    Item(name="new").save()
+    yield router
+    set_consistency_key(None)
+
+
+def _names() -> list[str]:
+    return [item.name for item in Item.scalars(Item.select.order_by(Item.id))]
+
+
+def test_read_from_replica(router):
+    """
+    测试读走从库，写走主库，轮询从库
+    """
+    assert _names() == ["old"]
+    assert _names() == ["old"]
+    assert router.stats.replica_reads == 2
+    assert router.stats.writes >= 1
+
+    with RoutingBase.unit_of_work():
+        assert Item.scalar(Item.select.where(Item.name == "new")) is None
+        # 同一个会话写过以后读主库
+        Item(name="newer").save()
+        assert _names() == ["old", "new", "newer"]
+
+
+def test_read_your_writes(router):
+    """
+    测试同一个一致性key写过以后一段时间内读主库
+    """
+    set_consistency_key("bob")
+    assert _names() == ["old"]
+
+    Item(name="bob's").save()
+    assert _names() == ["old", "new", "bob's"]
+
+    set_consistency_key("alice")
+    assert _names() == ["old"]
+
+
+def test_unhealthy_replica(tmp_path, bind_engine):
+    """
+    测试从库出错以后被跳过，全部不可用时读主库
+    """
+    writer_path, reader_path = _databases(tmp_path, 1)
+    writer = create_engine(f"sqlite:///{writer_path}")
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'reader.sqlite'}")
+    reader = create_engine(f"sqlite:///{reader_path}")
+
+    router = bind_engine(RoutingBase, writer, [broken, reader])
+    with pytest.raises(exc.OperationalError):
+        _names()
+    assert router.stats.failures == 1
+    assert not router.is_healthy(broken)
+
+    for _ in range(3):
+        assert _names() == ["old"]
+    assert router.collect()["replicas"] == {
+        repr(broken.url): False,
+        repr(reader.url): True,
+    }
+
+    router.mark_down(reader)
+    Item(name="new").save()
+    assert _names() == ["old", "new"]
+
+
+def test_async_read_from_replica(tmp_path, bind_async_engine):
+    """
+    测试异步会话同样读写分离
+    """
+    pytest.importorskip("aiosqlite")
+    paths = _databases(tmp_path, 1)
+    writer, reader = [create_async_engine(f"sqlite+aiosqlite:///{p}") for p in paths]
+
+    router = bind_async_engine(RoutingBase, writer, [reader])
+
+    async def run():
+        await Item(name="new").asave()
+        result = await Item.ascalars(Item.select.order_by(Item.id))
+        assert [item.name for item in result] == ["old"]
+
+        async with RoutingBase.async_unit_of_work():
+            await Item(name="newer").asave()
+            result = await Item.ascalars(Item.select.order_by(Item.id))
+            assert [item.name for item in result] == ["old", "new", "newer"]
+
+        await writer.dispose()
+        await reader.dispose()
+
+    asyncio.run(run())
+    assert router.stats.replica_reads == 1
+
+
+class DeviceBase(Model):
+    __abstract__ = True
+    metadata = MetaData()
+
+
+class Device(DeviceBase):
+    id: Mapped[int] = mapped_column(primary_key=True)
+    serial: Mapped[str] = mapped_column(default="")
+
+
+@pytest.fixture
+def databases(bind_sqlite):
+    return bind_sqlite(RoutingBase), bind_sqlite(DeviceBase)
+
+
+def _count(engine, model) -> int:
+    with engine.connect() as conn:
+        return len(conn.execute(model.__table__.select()).all())
+
+
+def test_bind_per_model_hierarchy(databases):
+    """
+    测试不同模型体系绑定到不同数据库，一个工作单元里按模型自动选库
+    """
+    main, device = databases
+    assert Item.engine is main
+    assert Device.engine is device
+    assert RoutingBase.engine is main
+
+    with Model.unit_of_work() as session:
+        Item(name="a").save()
+        Device(serial="d1").save()
+        # Core语句按表的metadata选库
+        session.execute(Device.__table__.insert().values(serial="d2"))
+        assert len(session.execute(Device.__table__.select()).all()) == 2
+
+    assert _count(main, Item) == 1
+    assert _count(device, Device) == 2
+    assert [d.serial for d in Device.scalars(Device.select.order_by(Device.id))] == [
+        "d1",
+        "d2",
+    ]
+
+    # 解除绑定以后回到别的绑定上（根 `Model` 或者最先绑定的）
+    DeviceBase.bind(None)
+    assert Device.engine is not device
+
+
+def test_bind_async_per_model_hierarchy(tmp_path, bind_async_engine):
+    """
+    测试异步引擎同样按模型体系选库
+    """
+    pytest.importorskip("aiosqlite")
+    main = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'main.sqlite'}")
+    device = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'device.sqlite'}")
+
+    bind_async_engine(RoutingBase, main)
+    bind_async_engine(DeviceBase, device)
+
+    async def run():
+        async with main.begin() as conn:
+            await conn.run_sync(RoutingBase.metadata.create_all)
+        async with device.begin() as conn:
+            await conn.run_sync(DeviceBase.metadata.create_all)
+
+        async with Model.async_unit_of_work():
+            await Item(name="a").asave()
+            await Device(serial="d1").asave()
+
+        assert [d.serial for d in await Device.ascalars(Device.select)] == ["d1"]
+        async with device.connect() as conn:
+            assert len((await conn.execute(Device.__table__.select())).all()) == 1
+        async with main.connect() as conn:
+            assert len((await conn.execute(Item.__table__.select())).all()) == 1
+
+        await main.dispose()
+        await device.dispose()
+
+    assert Device.async_engine is device
+    assert Item.async_engine is main
+    asyncio.run(run())
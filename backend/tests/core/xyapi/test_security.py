@@ -0,0 +1,535 @@
+import asyncio
+import time
+import pytest
+from datetime import datetime, timedelta, timezone
+from jose import jwt
+from fastapi import FastAPI
+from fastapi.security import HTTPAuthorizationCredentials
+from fastapi.testclient import TestClient
+from jose.exceptions import ExpiredSignatureError, JWTError
+from qual.apps.auth.router import well_known
+from qual.core.xyapi import security
+from qual.core.xyapi.exception import (
+    JWTUnauthorizedError,
+    ServiceUnavailableError,
+    TooManyRequestsError,
+)
+from qual.core.xyapi.security import (
+    AdmissionQueue,
+    JoseBackend,
+    KeyRing,
+    PyJWTBackend,
+    Payload,
+    RevocationStore,
+    Scope,
+    ScopeMeta,
+    TokenData,
+    TokenCache,
+    token_cache,
+    benchmark_password_rounds,
+    create_jwt_backend,
+    generate_signing_key,
+    hash_password,
+    hash_password_async,
+    password_needs_update,
+    verify_password,
+    verify_password_async,
+    shutdown_password_executor,
+)
+
+
+@pytest.fixture
+def pwd_executor():
+    yield
+    shutdown_password_executor()
+
+
+def test_hash_password_async(pwd_executor):
+    """
+    测试异步哈希密码：结果能被同步版本校验
+    """
+    hashed = asyncio.run(hash_password_async("admin"))
+
+    assert verify_password("admin", hashed)
+    assert not verify_password("admin1", hashed)
+
+
+def test_verify_password_async(pwd_executor):
+    """
+    测试异步校验密码
+    """
+    hashed = hash_password("admin")
+
+    async def verify():
+        return await asyncio.gather(
+            verify_password_async("admin", hashed),
+            verify_password_async("admin1", hashed),
+        )
+
+    assert asyncio.run(verify()) == [True, False]
+
+
+def test_shutdown_password_executor(pwd_executor):
+    """
+    测试关闭进程池后能够重新创建
+    """
+    asyncio.run(hash_password_async("admin"))
+    shutdown_password_executor()
+
+    assert security._pwd_executor is None
+    assert verify_password("admin", asyncio.run(hash_password_async("admin")))
+
+
+def test_password_needs_update(monkeypatch):
+    """
+    测试rounds跟配置不一致的哈希需要重新哈希
+    """
+    monkeypatch.setattr(security.settings, "PASSWORD_HASH_ROUNDS", 5)
+    monkeypatch.setattr(security, "_pwd_context", security._create_pwd_context())
+
+    current = hash_password("admin")
+    stale = security._pwd_context.handler().using(rounds=4).hash("admin")
+
+    assert not password_needs_update(current)
+    assert password_needs_update(stale)
+    assert verify_password("admin", stale)
+
+
+def test_benchmark_password_rounds():
+    """
+    测试挑选rounds：挑出来的rounds耗时不超过目标
+    """
+    rounds, results = benchmark_password_rounds(target_ms=20, samples=1)
+    timings = dict(results)
+
+    assert results[0][0] == 4
+    assert rounds == 4 or timings[rounds] <= 20
+
+
+def test_admission_queue_reject_when_full():
+    """
+    测试准入队列：排队满了直接拒绝 429
+    """
+    queue = AdmissionQueue(max_in_flight=1, max_queue=1, max_wait=5)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            async with queue.admit():
+                await release.wait()
+
+        running = asyncio.create_task(hold())
+        waiting = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+
+        assert queue.stats.in_flight == 1
+        assert queue.stats.queue_depth == 1
+
+        with pytest.raises(TooManyRequestsError) as e:
+            async with queue.admit():
+                ...
+        assert "Retry-After" in e.value.headers
+
+        release.set()
+        await asyncio.gather(running, waiting)
+
+    asyncio.run(run())
+
+    stats = queue.stats
+    assert stats.admitted == 2
+    assert stats.rejected == 1
+    assert stats.in_flight == 0
+    assert stats.queue_depth == 0
+
+
+def test_admission_queue_wait_timeout():
+    """
+    测试准入队列：排队超时 503
+    """
+    queue = AdmissionQueue(max_in_flight=1, max_queue=10, max_wait=0.01)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            async with queue.admit():
+                await release.wait()
+
+        running = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+
+        with pytest.raises(ServiceUnavailableError):
+            async with queue.admit():
+                ...
+
+        release.set()
+        await running
+
+        # 超时后信号量没有泄漏，还能正常准入
+        async with queue.admit():
+            ...
+
+    asyncio.run(run())
+
+    assert queue.stats.timeouts == 1
+    assert queue.stats.admitted == 2
+
+
+def test_token_cache_hit():
+    """
+    测试已验证令牌缓存：同一个token第二次解析命中缓存
+    """
+    token = Payload(sub="admin", scopes=["all"]).to_jwt()
+    token_cache.clear()
+    misses = token_cache.stats.misses
+    hits = token_cache.stats.hits
+
+    payload = Payload.from_jwt(token)
+
+    assert Payload.from_jwt(token) is payload
+    assert token_cache.stats.misses == misses + 1
+    assert token_cache.stats.hits == hits + 1
+
+
+def test_token_cache_expire_with_token():
+    """
+    测试已验证令牌缓存：条目不会比token的exp活得久
+    """
+    cache = TokenCache(max_size=10, ttl=3600)
+    payload = Payload(
+        sub="admin", exp=datetime.now(timezone.utc) + timedelta(seconds=1)
+    )
+
+    cache.put("token", payload)
+    assert cache.get("token") is payload
+
+    cache._entries[cache._key("token")] = (time.time() - 1, payload)
+    assert cache.get("token") is None
+    assert cache.stats.size == 0
+
+
+def test_token_cache_lru():
+    """
+    测试已验证令牌缓存：超出容量淘汰最久没用的
+    """
+    cache = TokenCache(max_size=2, ttl=3600)
+    exp = datetime.now(timezone.utc) + timedelta(minutes=5)
+
+    cache.put("a", Payload(sub="a", exp=exp))
+    cache.put("b", Payload(sub="b", exp=exp))
+    cache.get("a")
+    cache.put("c", Payload(sub="c", exp=exp))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats.evictions == 1
+
+
+@pytest.fixture(scope="module")
+def es256_pem():
+    ecdsa = pytest.importorskip("ecdsa")
+    return ecdsa.SigningKey.generate(curve=ecdsa.NIST256p).to_pem().decode()
+
+
+def test_jose_backend_hs256():
+    """
+    测试jose后端：快速签发的token能被 jose.jwt.decode 解析
+    """
+    backend = JoseBackend("HS256", "secret")
+    token = backend.encode({"sub": "admin", "exp": datetime.utcnow() + timedelta(1)})
+
+    assert jwt.decode(token, "secret", algorithms=["HS256"])["sub"] == "admin"
+    assert backend.decode(token)["sub"] == "admin"
+
+
+def test_jose_backend_es256(es256_pem):
+    """
+    测试jose后端：非对称算法从私钥推导公钥验签
+    """
+    backend = JoseBackend("ES256", es256_pem, kid="k1")
+    token = backend.encode({"sub": "admin"})
+
+    assert jwt.get_unverified_header(token)["kid"] == "k1"
+    assert backend.decode(token) == {"sub": "admin"}
+
+    with pytest.raises(JWTError):
+        JoseBackend("HS256", "secret").decode(token)
+
+
+def test_jwt_backend_expired():
+    """
+    测试jwt后端：过期token抛出 ExpiredSignatureError
+    """
+    backend = JoseBackend("HS256", "secret")
+    token = backend.encode({"sub": "admin", "exp": int(time.time()) - 10})
+
+    with pytest.raises(ExpiredSignatureError):
+        backend.decode(token)
+
+
+def test_jwt_backend_encode_pair():
+    """
+    测试签发令牌对
+    """
+    backend = JoseBackend("HS256", "secret")
+    access_token, refresh_token = backend.encode_pair("admin", ["all"], 1, 2)
+
+    access = backend.decode(access_token)
+    refresh = backend.decode(refresh_token)
+
+    assert access["typ"] == "access"
+    assert refresh["typ"] == "refresh"
+    assert Scope.names_of(Scope.unpack(access["scp"])) == refresh["scopes"] == ["all"]
+    assert refresh["exp"] - access["exp"] == 60
+    assert access["jti"] != refresh["jti"]
+    assert access["sid"] == refresh["sid"]
+
+    # 刷新时沿用原来的会话
+    access_token, _ = backend.encode_pair("admin", ["all"], 1, 2, sid=access["sid"])
+    assert backend.decode(access_token)["sid"] == access["sid"]
+
+
+def test_pyjwt_backend_hs256():
+    """
+    测试pyjwt后端：能跟jose后端互通
+    """
+    pytest.importorskip("jwt")
+    backend = PyJWTBackend("HS256", "secret")
+    token = backend.encode({"sub": "admin", "exp": datetime.utcnow() + timedelta(1)})
+
+    assert JoseBackend("HS256", "secret").decode(token)["sub"] == "admin"
+
+    with pytest.raises(JWTError):
+        backend.decode(token + "x")
+
+
+def test_keyring_rotate(tmp_path):
+    """
+    测试密钥环：轮换后旧密钥签发的token还能验证，新token用新密钥
+    """
+    keyring = KeyRing(tmp_path, "ES256", publish_seconds=0)
+    old_kid = keyring.active_kid
+    old_token = keyring.encode({"sub": "admin"})
+
+    # kid以秒级时间开头，保证新kid排在后面
+    time.sleep(1)
+    new_kid = keyring.rotate()
+    new_token = keyring.encode({"sub": "admin"})
+
+    assert new_kid != old_kid
+    assert keyring.active_kid == new_kid
+    assert jwt.get_unverified_header(old_token)["kid"] == old_kid
+    assert jwt.get_unverified_header(new_token)["kid"] == new_kid
+    assert keyring.decode(old_token) == keyring.decode(new_token) == {"sub": "admin"}
+
+    jwks = keyring.jwks()
+    assert {key["kid"] for key in jwks["keys"]} == {old_kid, new_kid}
+    assert all("d" not in key for key in jwks["keys"])
+
+    # 下游服务只拿JWKS就能验证
+    assert jwt.decode(new_token, jwks, algorithms=["ES256"]) == {"sub": "admin"}
+
+
+def test_jwks_primary_key(monkeypatch):
+    """
+    测试没有密钥环、只配置了 `JWT_PRIVATE_KEY` 时也发布公钥，对称密钥不发布
+    """
+    monkeypatch.setattr(security.settings, "JWT_ALGORITHM", "ES256")
+    monkeypatch.setattr(security.settings, "JWT_KEYS_DIR", "")
+    monkeypatch.setattr(
+        security.settings, "JWT_PRIVATE_KEY", generate_signing_key("ES256")
+    )
+    backend = create_jwt_backend()
+    monkeypatch.setattr(security, "jwt_backend", backend)
+    token = backend.encode({"sub": "admin"})
+
+    app = FastAPI()
+    app.include_router(well_known)
+    with TestClient(app) as client:
+        jwks = client.get("/.well-known/jwks.json").json()
+
+    assert len(jwks["keys"]) == 1
+    assert jwks["keys"][0]["kty"] == "EC" and "d" not in jwks["keys"][0]
+    assert jwt.decode(token, jwks, algorithms=["ES256"]) == {"sub": "admin"}
+
+    assert JoseBackend("HS256", "secret").jwks() == {"keys": []}
+
+
+def test_keyring_publish_ahead(tmp_path):
+    """
+    测试密钥环：新密钥先发布到JWKS，发布满 `publish_seconds` 才开始签发
+    """
+    keyring = KeyRing(tmp_path, "ES256", publish_seconds=300)
+    # 第一次启动只有一个密钥，马上签发
+    old_kid = keyring.active_kid
+    assert old_kid is not None
+
+    time.sleep(1)
+    new_kid = keyring.rotate()
+
+    assert keyring.active_kid == old_kid
+    assert {key["kid"] for key in keyring.jwks()["keys"]} == {old_kid, new_kid}
+    # 发布等待中的新密钥不会引起重复轮换
+    assert not keyring.rotate_if_due()
+
+    keyring.publish = timedelta(0)
+    keyring.reload()
+    assert keyring.active_kid == new_kid
+
+
+def test_keyring_key_file(tmp_path):
+    """
+    测试密钥环：私钥文件只有自己能读，没有残留的临时文件
+    """
+    keyring = KeyRing(tmp_path, "ES256")
+
+    files = list(tmp_path.iterdir())
+    assert [path.name for path in files] == [f"{keyring.active_kid}.pem"]
+    assert files[0].stat().st_mode & 0o777 == 0o600
+
+
+def test_keyring_prune(tmp_path):
+    """
+    测试密钥环：旧密钥过了保留期被删除
+    """
+    keyring = KeyRing(tmp_path, "ES256", retain_minutes=0, publish_seconds=0)
+    old_kid = keyring.active_kid
+    old_token = keyring.encode({"sub": "admin"})
+
+    time.sleep(1)
+    keyring.rotate()
+    time.sleep(1)
+    keyring.prune()
+
+    assert old_kid not in keyring.kids
+    assert not (tmp_path / f"{old_kid}.pem").exists()
+    with pytest.raises(JWTError):
+        keyring.decode(old_token)
+
+
+def test_keyring_reload(tmp_path):
+    """
+    测试密钥环：能验证别的worker轮换出来的新密钥
+    """
+    keyring = KeyRing(tmp_path, "ES256")
+    other = KeyRing(tmp_path, "ES256", publish_seconds=0)
+
+    time.sleep(1)
+    other.rotate()
+    token = other.encode({"sub": "admin"})
+
+    keyring._reloaded_at = 0
+    assert keyring.decode(token) == {"sub": "admin"}
+
+
+def test_revocation_store():
+    """
+    测试吊销名单：任意一个key被吊销就算吊销，过期条目会被清理
+    """
+    store = RevocationStore()
+    store.revoke("jti1", time.time() + 60)
+    store.revoke("sid1", time.time() - 1)
+
+    assert store.is_revoked("jti1")
+    assert store.is_revoked("jti2", "sid1")
+    assert not store.is_revoked("jti2", "")
+
+    assert store.purge() == 1
+    assert not store.is_revoked("sid1")
+    assert len(store) == 1
+
+
+def test_access_token_revoked(monkeypatch):
+    """
+    测试吊销会话后，这个会话签发的access令牌验证不过
+    """
+    monkeypatch.setattr(security, "revocation_store", RevocationStore())
+    token_data = TokenData.simple_create("admin", ["all"])
+    credential = HTTPAuthorizationCredentials(
+        scheme="Bearer", credentials=token_data.access_token
+    )
+    payload = security._get_access_token_payload(credential)
+
+    assert payload.jti and payload.sid
+
+    security.revocation_store.revoke(payload.sid, time.time() + 60)
+    with pytest.raises(JWTUnauthorizedError):
+        security._get_access_token_payload(credential)
+
+
+def test_scope_pack():
+    """
+    测试Scope位图：编码解码，注册新Scope后旧位图还能解码，Scope表变了解码失败
+    """
+    Scope.test_pack_a = "测试A"
+    Scope.test_pack_b = "测试B"
+    packed = Scope.pack([Scope.test_pack_b, Scope.all])
+
+    assert Scope.pack(["test_pack_unknown"]) is None
+    assert Scope.mask_of(Scope.all, Scope.test_pack_b) == Scope.unpack(packed)
+
+    Scope.test_pack_c = "测试C"
+    assert set(Scope.names_of(Scope.unpack(packed))) == {"all", "test_pack_b"}
+
+    count, fingerprint, data = packed.split(".")
+    with pytest.raises(ValueError):
+        Scope.unpack(f"{count}.AAAAAAAA.{data}")
+    with pytest.raises(ValueError):
+        Scope.unpack("garbage")
+
+
+def test_scope_order():
+    """
+    测试Scope位序号跟第一次访问的先后无关
+    """
+
+    class First(metaclass=ScopeMeta):
+        pass
+
+    class Second(metaclass=ScopeMeta):
+        pass
+
+    First.user_read = "用户:读取"
+    First.monitor
+    First.all = "全范围权限"
+
+    Second.all = "全范围权限"
+    Second.monitor
+    Second.user_read = "用户:读取"
+
+    assert First.mask_of("user_read") == Second.mask_of("user_read")
+    assert First.mask_of("all", "monitor") == Second.mask_of("all", "monitor")
+    assert First.pack(["monitor"]) == Second.pack(["monitor"])
+    assert Second.names_of(First.unpack(First.pack(["all"]))) == ["all"]
+
+    # 冻结以后注册的往后追加，不改变已有的位序号
+    First.device
+    assert First.mask_of("device") == 1 << 3
+    assert First.mask_of("user_read") == Second.mask_of("user_read")
+
+
+def test_need_scope():
+    """
+    测试NeedScope：位图令牌和旧的字符串列表令牌都能通过检查
+    """
+    checker = security.NeedScope(Scope.test_need_a, Scope.test_need_b).dependency
+    scopes = security.SecurityScopes(scopes=[Scope.test_need_a, Scope.test_need_b])
+
+    def payload_of(token: str) -> Payload:
+        return Payload.from_jwt(token, use_cache=False)
+
+    packed = Payload(scopes=[Scope.test_need_a, Scope.test_need_b]).to_jwt()
+    assert "scp" in jwt.get_unverified_claims(packed)
+    assert checker(payload_of(packed), scopes)
+
+    legacy = security.jwt_backend.encode(
+        {"sub": "admin", "scopes": [Scope.test_need_a, Scope.test_need_b]}
+    )
+    assert checker(payload_of(legacy), scopes)
+
+    assert checker(payload_of(Payload(scopes=[Scope.all]).to_jwt()), scopes)
+
+    with pytest.raises(JWTUnauthorizedError):
+        checker(payload_of(Payload(scopes=[Scope.test_need_a]).to_jwt()), scopes)